@@ -5,6 +5,7 @@ from googleapiclient.http import MediaFileUpload
 import google.auth
 
 from py_utils.common.logger import LoggerMixin
+from py_utils.google.api.quota import rate_limited_request_builder
 
 
 class GoogleDriveService(LoggerMixin):
@@ -21,7 +22,12 @@ class GoogleDriveService(LoggerMixin):
             ]
         )
         self.logger.info(f"project_id: {project_id}")
-        service = build("drive", "v3", credentials=credentials)
+        service = build(
+            "drive",
+            "v3",
+            credentials=credentials,
+            requestBuilder=rate_limited_request_builder("drive", project_id),
+        )
         return service
 
     def create_folder(self, folder_name, parent_folder_id=None):
@@ -0,0 +1,168 @@
+import os
+import random
+import threading
+import time
+
+from google.auth.transport.requests import AuthorizedSession
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+from py_utils.common.logger import LoggerMixin
+
+
+class QuotaConfig:
+    # per-user Sheets quota is 60 requests per minute and project
+    SHEETS_REQUESTS_PER_MINUTE = float(os.environ.get("SHEETS_REQUESTS_PER_MINUTE", 60))
+    DRIVE_REQUESTS_PER_MINUTE = float(os.environ.get("DRIVE_REQUESTS_PER_MINUTE", 600))
+    MAX_RETRIES = int(os.environ.get("GOOGLE_API_MAX_RETRIES", 6))
+    MAX_BACKOFF_SECONDS = float(os.environ.get("GOOGLE_API_MAX_BACKOFF_SECONDS", 64))
+
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter(LoggerMixin):
+    """
+    Thread-safe token bucket whose rate adapts to quota errors.
+
+    The rate is halved on every 429 and grows back by 2% of the quota on
+    every success, so concurrent callers converge on the rate the quota
+    actually sustains.
+
+    Args:
+        requests_per_minute (float): The quota to stay under.
+        min_requests_per_minute (float): The floor of the adapted rate.
+    """
+
+    def __init__(self, requests_per_minute: float, min_requests_per_minute=1.0):
+        self.max_rate = requests_per_minute / 60
+        self.min_rate = min(min_requests_per_minute / 60, self.max_rate)
+        self.rate = self.max_rate
+        self.capacity = max(1.0, self.max_rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            # take the token now, and wait outside the lock until it is earned
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.02)
+
+    def on_quota_error(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.logger.warning(
+                f"Quota exceeded, rate lowered to {self.rate * 60:.1f}/min"
+            )
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api: str, project_id: str = None) -> RateLimiter:
+    """
+    Return the process-wide limiter of an API and project.
+
+    Args:
+        api (str): `sheets` or `drive`.
+        project_id (str): The quota project.
+    """
+    with _limiters_lock:
+        if (api, project_id) not in _limiters:
+            requests_per_minute = (
+                QuotaConfig.SHEETS_REQUESTS_PER_MINUTE
+                if api == "sheets"
+                else QuotaConfig.DRIVE_REQUESTS_PER_MINUTE
+            )
+            _limiters[(api, project_id)] = RateLimiter(requests_per_minute)
+        return _limiters[(api, project_id)]
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(QuotaConfig.MAX_BACKOFF_SECONDS, 2**attempt))
+
+
+def call_with_quota(limiter: RateLimiter, request, get_status):
+    """
+    Run `request` under a limiter, retrying 429 and 5xx responses.
+
+    Args:
+        limiter (RateLimiter): The limiter of the API.
+        request (callable): Sends the request and returns its response.
+        get_status (callable): Returns the HTTP status of a response or error.
+    """
+    for attempt in range(QuotaConfig.MAX_RETRIES + 1):
+        limiter.acquire()
+        try:
+            response = request()
+        except Exception as e:
+            status = get_status(e)
+            if status not in RETRYABLE_STATUSES or attempt == QuotaConfig.MAX_RETRIES:
+                raise
+        else:
+            status = get_status(response)
+            if status not in RETRYABLE_STATUSES:
+                limiter.on_success()
+                return response
+            if attempt == QuotaConfig.MAX_RETRIES:
+                return response
+        if status == 429:
+            limiter.on_quota_error()
+        delay = backoff_seconds(attempt)
+        limiter.logger.warning(f"Request failed with {status}, retry in {delay:.1f}s")
+        time.sleep(delay)
+
+
+class RateLimitedSession(AuthorizedSession):
+    """
+    AuthorizedSession sending every request through the limiter of an API.
+
+    Used as the gspread session, so all Sheets calls are throttled and
+    retried before gspread sees the response.
+    """
+
+    def __init__(self, credentials, api: str, project_id: str = None, **kwargs):
+        super().__init__(credentials, **kwargs)
+        self.limiter = get_rate_limiter(api, project_id)
+
+    def request(self, method, url, *args, **kwargs):
+        return call_with_quota(
+            self.limiter,
+            lambda: super(RateLimitedSession, self).request(
+                method, url, *args, **kwargs
+            ),
+            lambda response: getattr(response, "status_code", None),
+        )
+
+
+def rate_limited_request_builder(api: str, project_id: str = None):
+    """
+    Build a googleapiclient `requestBuilder` throttling every `execute()`.
+    """
+    limiter = get_rate_limiter(api, project_id)
+
+    class RateLimitedHttpRequest(HttpRequest):
+        def execute(self, http=None, num_retries=0):
+            return call_with_quota(
+                limiter,
+                lambda: HttpRequest.execute(self, http=http, num_retries=num_retries),
+                lambda error: (
+                    error.resp.status if isinstance(error, HttpError) else None
+                ),
+            )
+
+    return RateLimitedHttpRequest
@@ -1,34 +1,138 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from googleapiclient.discovery import build
 from oauth2client import client
 import gspread
 import google.auth
-import gspread_dataframe as gd
+import numpy as np
 import pandas as pd
+import requests
 from typing import List
 from py_utils.common.logger import LoggerMixin
-import time
+from py_utils.google.api.quota import (
+    QuotaConfig,
+    RateLimitedSession,
+    backoff_seconds,
+    rate_limited_request_builder,
+)
+from py_utils.utils.cache import ParquetCache, make_cache_key
+from py_utils.utils.dataframe import coerce_to_schema, hash_keys, normalize_cell
+from py_utils.utils.key_index import SheetKeyIndex
+from py_utils.utils.path import get_cache_dir
+
+
+class SheetConfig:
+    # snapshots are keyed by the spreadsheet revision, so they are never stale
+    SNAPSHOT_CACHE_ENABLED = os.environ.get(
+        "SHEET_SNAPSHOT_CACHE", "true"
+    ).lower() in ("1", "true")
+    SNAPSHOT_CACHE_DIR = os.environ.get("SHEET_SNAPSHOT_CACHE_DIR")
+    SNAPSHOT_CACHE_MAX_BYTES = int(
+        os.environ.get("SHEET_SNAPSHOT_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+    )
+    # chunks of a large write are sent concurrently, still under the quota
+    WRITE_WORKERS = int(os.environ.get("SHEET_WRITE_WORKERS", 4))
+    MAX_REQUEST_BYTES = int(os.environ.get("SHEET_MAX_REQUEST_BYTES", 2 * 1024 * 1024))
+
+
+SCOPES = (
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive",
+)
+
+
+class SheetClient:
+    """
+    An authorized gspread client shared by every service using the same scopes.
+
+    Spreadsheets are opened on first use and cached by id, and worksheets are
+    cached by title, so services cost no request until they are used.
+    """
+
+    def __init__(self, scopes=SCOPES):
+        self.credentials, self.project_id = google.auth.default(scopes=list(scopes))
+        # every request is throttled and retried under the Sheets quota
+        self.gc = gspread.Client(
+            auth=self.credentials,
+            session=RateLimitedSession(
+                self.credentials, api="sheets", project_id=self.project_id
+            ),
+        )
+        self.drive_session = RateLimitedSession(
+            self.credentials, api="drive", project_id=self.project_id
+        )
+        self.spreadsheets = {}
+        self.worksheets = {}
+        self.lock = threading.RLock()
+
+    def open_spreadsheet(self, spreadsheet_id):
+        with self.lock:
+            if spreadsheet_id not in self.spreadsheets:
+                self.spreadsheets[spreadsheet_id] = self.gc.open_by_key(spreadsheet_id)
+            return self.spreadsheets[spreadsheet_id]
+
+    def get_worksheet(self, spreadsheet_id, title):
+        with self.lock:
+            key = (spreadsheet_id, title)
+            if key not in self.worksheets:
+                spreadsheet = self.open_spreadsheet(spreadsheet_id)
+                self.worksheets[key] = spreadsheet.worksheet(title)
+            return self.worksheets[key]
+
+    def invalidate_worksheet(self, spreadsheet_id, title):
+        """Forget a cached worksheet whose grid was changed."""
+        with self.lock:
+            self.worksheets.pop((spreadsheet_id, title), None)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_sheet_client(scopes=SCOPES) -> SheetClient:
+    with _clients_lock:
+        if scopes not in _clients:
+            _clients[scopes] = SheetClient(scopes)
+        return _clients[scopes]
 
 
 class GoogleSheetService(LoggerMixin):
     def __init__(self, url: str = None, **kwargs):
         super().__init__()
         self.url = url
-        credentials, project_id = google.auth.default(
-            scopes=[
-                "https://spreadsheets.google.com/feeds",
-                "https://www.googleapis.com/auth/drive",
-            ]
-        )
-        self.logger.info(f"project_id: {project_id}")
-        self.gc = self.authorize(credentials)
-        self.spread_sheet = self.gc.open_by_url(self.url)
+        self.spreadsheet_id = gspread.utils.extract_id_from_url(url)
+        self.client = get_sheet_client()
+        self.project_id = self.client.project_id
+        self.gc = self.client.gc
+        self.drive_session = self.client.drive_session
+        self.snapshot_cache = None
+        if SheetConfig.SNAPSHOT_CACHE_ENABLED:
+            self.snapshot_cache = ParquetCache(
+                directory=SheetConfig.SNAPSHOT_CACHE_DIR
+                or get_cache_dir("sheet_snapshots"),
+                max_bytes=SheetConfig.SNAPSHOT_CACHE_MAX_BYTES,
+            )
+
+    @property
+    def spread_sheet(self):
+        # opened on first use, shared with the other services of the spreadsheet
+        return self.client.open_spreadsheet(self.spreadsheet_id)
 
     def service(self):
-        service = build("sheets", "v4", credentials=self.creds)
+        service = build(
+            "sheets",
+            "v4",
+            credentials=self.creds,
+            requestBuilder=rate_limited_request_builder("sheets", self.project_id),
+        )
         return service
 
-    def authorize(self, credentials):
-        gc = gspread.authorize(credentials)
+    def authorize(self, credentials, project_id=None):
+        # every request is throttled and retried under the Sheets quota
+        session = RateLimitedSession(credentials, api="sheets", project_id=project_id)
+        gc = gspread.Client(auth=credentials, session=session)
         return gc
 
     def get_creds(self):
@@ -41,7 +145,7 @@ class GoogleSheetService(LoggerMixin):
         return self.spread_sheet.get_worksheet(index)
 
     def get_worksheet_by_name(self, title):
-        return self.spread_sheet.worksheet(title)
+        return self.client.get_worksheet(self.spreadsheet_id, title)
 
     def get_worksheet(self, key):
         if isinstance(key, int):
@@ -51,7 +155,7 @@ class GoogleSheetService(LoggerMixin):
 
     def is_sheet_exists(self, sheet_name):
         try:
-            self.spread_sheet.worksheet(sheet_name)
+            self.get_worksheet_by_name(sheet_name)
             return True
         except gspread.exceptions.WorksheetNotFound:
             return False
@@ -93,80 +197,807 @@ class GoogleSheetService(LoggerMixin):
                             account credentials.
         """
         worksheet = self.get_worksheet(sheet_id)
-        # 2. Get all data from the worksheet
-        data = worksheet.get_all_values()
-        headers = data[0]
-        df = pd.DataFrame(data[1:], columns=headers)
-
-        # 3. Find rows to delete
-        rows_to_delete = []
-        for i, row in df.iterrows():
-            for value_set in key_values:
-                match = True
-                for j, key_col in enumerate(key_columns):
-                    if key_col not in df.columns:
-                        raise ValueError(f"Key column '{key_col}' not found in sheet.")
-                    if str(row[key_col]) != str(
-                        value_set[j]
-                    ):  # Compare as strings for safety
-                        match = False
-                        break  # No need to check other key columns for this value_set
-                if match:
-                    rows_to_delete.append(
-                        i + 2
-                    )  # +2 because gspread uses 1-based indexing and headers are row 1
-                    break  # No need to check other value_sets for this row
-
-        # 4. Delete rows (in reverse order to avoid shifting issues)
-        rows_to_delete.sort(reverse=True)
-        for row_num in rows_to_delete:
-            worksheet.delete_rows(row_num)
-            self.logger.info(f"Deleted row {row_num} from {sheet_id}")
-            time.sleep(0.2)
-
-    def export_to_sheets(self, sheet_idx, df, mode="r"):
+        # only the key columns are needed to find the rows
+        df = self.read_sheet(worksheet.title, columns=key_columns)
+        keys_df = pd.DataFrame(key_values, columns=key_columns)
+        is_match = hash_keys(df, key_columns).isin(hash_keys(keys_df, key_columns))
+        # +2 because sheet rows are 1-based and headers are row 1
+        rows_to_delete = np.flatnonzero(is_match.to_numpy()) + 2
+        if len(rows_to_delete) == 0:
+            self.logger.info(f"No rows to delete from {sheet_id}")
+            return
+
+        # coalesce the rows into contiguous ranges, deleted from the bottom up
+        breaks = np.flatnonzero(np.diff(rows_to_delete) != 1)
+        starts = rows_to_delete[np.r_[0, breaks + 1]]
+        ends = rows_to_delete[np.r_[breaks, len(rows_to_delete) - 1]]
+        requests = [
+            {
+                "deleteDimension": {
+                    "range": {
+                        "sheetId": worksheet.id,
+                        "dimension": "ROWS",
+                        "startIndex": int(start) - 1,
+                        "endIndex": int(end),
+                    }
+                }
+            }
+            for start, end in zip(starts[::-1], ends[::-1])
+        ]
+        self.spread_sheet.batch_update({"requests": requests})
+        self.client.invalidate_worksheet(self.spreadsheet_id, worksheet.title)
+        self.logger.info(
+            f"Deleted {len(rows_to_delete)} rows in {len(requests)} ranges "
+            f"from {sheet_id}"
+        )
+
+    def export_to_sheets(self, sheet_idx, df, mode="r", unique_keys=None):
         if not self.is_sheet_exists(sheet_idx):
-            self.spread_sheet.add_worksheet(title=sheet_idx, rows=1, cols=1)
+            self.spread_sheet.add_worksheet(
+                title=sheet_idx, rows=1, cols=max(1, len(df.columns))
+            )
         current_worksheet = self.get_worksheet(sheet_idx)
         self.logger.info(f"current_worksheet name: {current_worksheet.title}")
         if mode == "w":
-            current_worksheet.clear()
-            gd.set_with_dataframe(
-                worksheet=current_worksheet,
-                dataframe=df,
-                include_index=False,
-                include_column_header=True,
-                resize=True,
-            )
+            self.write_dataframe(current_worksheet, df)
             return True
         elif mode == "a":
-            gd.set_with_dataframe(
-                worksheet=current_worksheet,
-                dataframe=df,
-                include_index=False,
-                include_column_header=(
-                    False if self._is_headers_exist(sheet_idx) else True
-                ),
-                row=len(current_worksheet.get_all_values()) + 1,
-                resize=False,
+            self.append_dataframe(
+                current_worksheet,
+                df,
+                include_column_header=not self._is_headers_exist(sheet_idx),
             )
             return True
+        elif mode == "sync":
+            self.sync_dataframe(current_worksheet, df, unique_keys=unique_keys)
+            return True
         else:
-            raise ValueError("Invalid mode. Use 'w' for write or 'a' for append.")
+            raise ValueError(
+                "Invalid mode. Use 'w' for write, 'a' for append or 'sync'."
+            )
 
-    def _is_headers_exist(self, sheet_name):
-        current_worksheet = self.spread_sheet.worksheet(sheet_name)
-        headers = current_worksheet.get_all_values()
-        if len(headers) > 0:
-            return True
+    def sync_dataframe(self, worksheet, df, unique_keys=None):
+        """
+        Make a worksheet hold the rows of a DataFrame, writing only what changed.
+
+        The current values are read, from the snapshot cache when the sheet is
+        unchanged, and compared cell by cell. Rows are matched on `unique_keys`,
+        or by position without keys. Changed cells, deleted rows and new rows
+        are sent in a single `spreadsheets.batchUpdate`. Kept rows stay where
+        they are and new rows are appended at the bottom. A worksheet with
+        other headers is rewritten entirely.
+
+        Args:
+            worksheet: The gspread worksheet to write.
+            df: The rows the worksheet should hold.
+            unique_keys: The key columns matching sheet rows to DataFrame rows.
+        """
+        # typed values compare the same whatever the number format of a cell
+        current = self.read_sheet(
+            worksheet.title,
+            value_render_option="UNFORMATTED_VALUE",
+            date_time_render_option="FORMATTED_STRING",
+            is_normalized=True,
+        )
+        if list(current.columns) != [normalize_cell(column) for column in df.columns]:
+            self.logger.info(f"Headers of {worksheet.title} changed, rewriting it")
+            self.write_dataframe(worksheet, df)
+            return
+        values = self._to_values(df)
+        desired = pd.DataFrame(
+            [[normalize_cell(value) for value in row] for row in values],
+            columns=current.columns,
+        )
+        if unique_keys:
+            is_first = ~desired.duplicated(subset=unique_keys).to_numpy()
+            desired = desired[is_first].reset_index(drop=True)
+            values = [row for row, keep in zip(values, is_first) if keep]
+
+        if unique_keys:
+            current_keys = hash_keys(current, unique_keys).to_numpy()
+            desired_keys = hash_keys(desired, unique_keys).to_numpy()
+            positions = pd.Series(np.arange(len(desired)), index=desired_keys)
+            is_kept = np.isin(current_keys, desired_keys) & ~pd.Series(
+                current_keys
+            ).duplicated().to_numpy()
+            kept_rows = np.flatnonzero(is_kept)
+            kept_positions = positions.loc[current_keys[is_kept]].to_numpy()
+            new_positions = np.flatnonzero(~np.isin(desired_keys, current_keys))
         else:
+            kept = min(len(current), len(desired))
+            is_kept = np.arange(len(current)) < kept
+            kept_rows = kept_positions = np.arange(kept)
+            new_positions = np.arange(kept, len(desired))
+
+        # cell-level diff of the rows present on both sides
+        is_changed = (
+            current.to_numpy()[kept_rows] != desired.to_numpy()[kept_positions]
+        )
+        requests = []
+        for row, position, changed in self._changed_blocks(
+            kept_rows, kept_positions, is_changed
+        ):
+            first, last = changed
+            requests.append(
+                {
+                    "updateCells": {
+                        "start": {
+                            "sheetId": worksheet.id,
+                            # +1 for the header row
+                            "rowIndex": int(row[0]) + 1,
+                            "columnIndex": int(first),
+                        },
+                        "rows": [
+                            self._to_row_data(values[p][first : last + 1])
+                            for p in position
+                        ],
+                        "fields": "userEnteredValue",
+                    }
+                }
+            )
+        updated_cells = int(is_changed.sum())
+
+        # delete the rows that are gone, from the bottom up
+        rows_to_delete = np.flatnonzero(~is_kept) + 1
+        if len(rows_to_delete):
+            breaks = np.flatnonzero(np.diff(rows_to_delete) != 1)
+            starts = rows_to_delete[np.r_[0, breaks + 1]]
+            ends = rows_to_delete[np.r_[breaks, len(rows_to_delete) - 1]]
+            requests += [
+                {
+                    "deleteDimension": {
+                        "range": {
+                            "sheetId": worksheet.id,
+                            "dimension": "ROWS",
+                            "startIndex": int(start),
+                            "endIndex": int(end) + 1,
+                        }
+                    }
+                }
+                for start, end in zip(starts[::-1], ends[::-1])
+            ]
+        if len(new_positions):
+            requests.append(
+                {
+                    "appendCells": {
+                        "sheetId": worksheet.id,
+                        "rows": [self._to_row_data(values[p]) for p in new_positions],
+                        "fields": "userEnteredValue",
+                    }
+                }
+            )
+        self.logger.info(
+            f"Sync {worksheet.title}: {updated_cells} cells updated, "
+            f"{len(rows_to_delete)} rows deleted, {len(new_positions)} rows added"
+        )
+        if not requests:
+            return
+        self.spread_sheet.batch_update({"requests": requests})
+        self.client.invalidate_worksheet(self.spreadsheet_id, worksheet.title)
+
+    @staticmethod
+    def _changed_blocks(rows, positions, is_changed):
+        """
+        Group changed rows into runs of adjacent sheet rows.
+
+        Yields:
+            tuple: The sheet rows, the DataFrame positions and the
+                `(first, last)` changed columns of each run.
+        """
+        changed_rows = np.flatnonzero(is_changed.any(axis=1))
+        block = []
+        for index in changed_rows:
+            if block and rows[index] != rows[block[-1]] + 1:
+                yield GoogleSheetService._block(rows, positions, is_changed, block)
+                block = []
+            block.append(index)
+        if block:
+            yield GoogleSheetService._block(rows, positions, is_changed, block)
+
+    @staticmethod
+    def _block(rows, positions, is_changed, block):
+        columns = np.flatnonzero(is_changed[block].any(axis=0))
+        return rows[block], positions[block], (columns[0], columns[-1])
+
+    @staticmethod
+    def _to_row_data(row):
+        cells = []
+        for value in row:
+            if isinstance(value, bool):
+                cells.append({"userEnteredValue": {"boolValue": value}})
+            elif isinstance(value, (int, float)):
+                cells.append({"userEnteredValue": {"numberValue": value}})
+            elif isinstance(value, str) and value.startswith("="):
+                cells.append({"userEnteredValue": {"formulaValue": value}})
+            elif value == "":
+                cells.append({})
+            else:
+                cells.append({"userEnteredValue": {"stringValue": str(value)}})
+        return {"values": cells}
+
+    def append_dataframe(
+        self,
+        worksheet,
+        df,
+        include_column_header: bool = False,
+        max_request_bytes: int = None,
+    ):
+        """
+        Append a DataFrame below the last row with `values.append`.
+
+        The rows are sent with INSERT_ROWS in chunks of about
+        `max_request_bytes`, so the worksheet is never downloaded.
+
+        Args:
+            worksheet: The gspread worksheet to append to.
+            df: The rows to append.
+            include_column_header: Send the column names as the first row.
+            max_request_bytes: The approximate payload size of one request.
+        """
+        values = self._to_values(df)
+        if include_column_header:
+            values = [[str(column) for column in df.columns]] + values
+        if not values:
+            return
+        chunks = self._chunk_rows(values, max_request_bytes)
+        for start, end in chunks:
+            self.spread_sheet.values_append(
+                gspread.utils.absolute_range_name(worksheet.title, "A1"),
+                params={
+                    "valueInputOption": "USER_ENTERED",
+                    "insertDataOption": "INSERT_ROWS",
+                },
+                body={"values": values[start:end]},
+            )
+        # the appended rows grew the grid of the cached worksheet
+        self.client.invalidate_worksheet(self.spreadsheet_id, worksheet.title)
+        self.logger.info(
+            f"Appended {len(df)} rows to {worksheet.title} in {len(chunks)} requests"
+        )
+
+    def write_dataframe(
+        self,
+        worksheet,
+        df,
+        include_column_header: bool = True,
+        max_request_bytes: int = None,
+        max_workers: int = None,
+    ):
+        """
+        Replace the content of a worksheet with a DataFrame, in parallel chunks.
+
+        The worksheet is cleared and resized to the frame once, then the rows
+        are split into row ranges of about `max_request_bytes` that are written
+        concurrently with `values.update`. Every request goes through the
+        Sheets rate limiter, and a failed chunk is retried on its own.
+
+        Args:
+            worksheet: The gspread worksheet to write.
+            df: The rows the worksheet should hold.
+            include_column_header: Write the column names as the first row.
+            max_request_bytes: The approximate payload size of one request.
+            max_workers: The number of chunks written concurrently.
+        """
+        values = self._to_values(df)
+        if include_column_header:
+            values = [[str(column) for column in df.columns]] + values
+        # the grid is sized once, so chunks never need to grow it
+        worksheet.clear()
+        worksheet.resize(rows=max(1, len(values)), cols=max(1, len(df.columns)))
+        self.client.invalidate_worksheet(self.spreadsheet_id, worksheet.title)
+        if not values:
+            return
+        chunks = self._chunk_rows(values, max_request_bytes)
+        with ThreadPoolExecutor(
+            max_workers=max_workers or SheetConfig.WRITE_WORKERS
+        ) as executor:
+            futures = [
+                executor.submit(
+                    self._write_chunk, worksheet.title, start, values[start:end]
+                )
+                for start, end in chunks
+            ]
+            for future in futures:
+                future.result()
+        self.logger.info(
+            f"Wrote {len(values)} rows to {worksheet.title} in {len(chunks)} chunks"
+        )
+
+    @staticmethod
+    def _is_retryable_write_error(error):
+        # 4xx errors are a bad payload or a permission, resending cannot help
+        if isinstance(error, gspread.exceptions.APIError):
+            return error.response.status_code >= 500
+        return isinstance(
+            error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)
+        )
+
+    def _write_chunk(self, title, start, rows):
+        # rate limits and 5xx are retried by the session; this covers timeouts
+        # and 5xx that survived them, without resending the other chunks
+        range_name = gspread.utils.absolute_range_name(title, f"A{start + 1}")
+        for attempt in range(QuotaConfig.MAX_RETRIES + 1):
+            try:
+                return self.spread_sheet.values_update(
+                    range_name,
+                    params={"valueInputOption": "USER_ENTERED"},
+                    body={"values": rows},
+                )
+            except Exception as e:
+                if (
+                    not self._is_retryable_write_error(e)
+                    or attempt == QuotaConfig.MAX_RETRIES
+                ):
+                    raise
+                delay = backoff_seconds(attempt)
+                self.logger.warning(
+                    f"Writing {range_name} failed ({e}), retry in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+    @staticmethod
+    def _chunk_rows(values, max_request_bytes=None):
+        """Split rows into `(start, end)` ranges of about `max_request_bytes`."""
+        max_request_bytes = max_request_bytes or SheetConfig.MAX_REQUEST_BYTES
+        # approximate the JSON size of every row from its cell lengths
+        text = pd.DataFrame(values).astype(str)
+        row_bytes = sum(text[column].str.len() + 4 for column in text.columns)
+        chunk_ids = np.cumsum(row_bytes.to_numpy()) // max_request_bytes
+        boundaries = np.flatnonzero(np.diff(chunk_ids)) + 1
+        return list(
+            zip(
+                np.r_[0, boundaries].tolist(), np.r_[boundaries, len(values)].tolist()
+            )
+        )
+
+    @staticmethod
+    def _to_values(df):
+        """Convert a DataFrame to JSON-serializable rows, with blanks for nulls."""
+        df = df.copy()
+        for column in df.columns:
+            if not (
+                pd.api.types.is_numeric_dtype(df[column])
+                or pd.api.types.is_bool_dtype(df[column])
+            ):
+                df[column] = df[column].astype(str).where(df[column].notna(), None)
+        return df.astype(object).where(df.notna(), "").values.tolist()
+
+    def _is_headers_exist(self, sheet_name):
+        # only the first row is needed to know whether headers were written
+        return len(self.read_headers(sheet_name)) > 0
+
+    def read_headers(self, sheet_name):
+        """Fetch only the header row of a worksheet."""
+        return self.get_worksheet_by_name(sheet_name).row_values(1)
+
+    def read_sheet(
+        self,
+        sheet_name,
+        headers=None,
+        columns: List[str] = None,
+        start_row: int = 2,
+        end_row: int = None,
+        page_rows: int = 20000,
+        header_row: List[str] = None,
+        value_render_option: str = None,
+        date_time_render_option: str = None,
+        is_normalized: bool = False,
+        schema: List[dict] = None,
+    ):
+        """
+        Read a worksheet into a DataFrame of strings.
+
+        Without `columns` or a row range the whole tab is fetched at once.
+        Otherwise only the header row is fetched first, then the ranges of the
+        needed columns are fetched with `values.batchGet` in pages of rows.
+        Trailing rows that are empty in all read columns are dropped.
+
+        Reads are served from the local snapshot cache while the Drive
+        revision of the spreadsheet is unchanged.
+
+        Args:
+            sheet_name: The name of the worksheet.
+            headers: The columns of the empty DataFrame returned for an empty tab.
+            columns: The header names of the columns to read, in output order.
+            start_row: The first sheet row to read, 1-based; row 1 is the header.
+            end_row: The last sheet row to read. Defaults to the end of the tab.
+            page_rows: The number of rows fetched per request.
+            header_row: The header row when the caller already fetched it.
+            value_render_option: e.g. `UNFORMATTED_VALUE` to read typed values
+                instead of formatted strings.
+            date_time_render_option: e.g. `SERIAL_NUMBER` to read dates as
+                day serials.
+            is_normalized: Render headers and cells with `normalize_cell`, so
+                unformatted values are strings again and can be cached.
+            schema: `{field, type}` dicts keyed by sheet header. The columns
+                are coerced with `coerce_to_schema` before the snapshot is
+                cached, since Parquet cannot store columns mixing the numbers
+                and strings of unformatted values.
+        """
+        render_options = {}
+        if value_render_option is not None:
+            render_options["value_render_option"] = value_render_option
+        if date_time_render_option is not None:
+            render_options["date_time_render_option"] = date_time_render_option
+        revision = self.get_revision() if self.snapshot_cache is not None else None
+        cache_key = None
+        if revision is not None:
+            cache_key = make_cache_key(
+                self.spreadsheet_id,
+                sheet_name,
+                revision,
+                headers,
+                columns,
+                start_row,
+                end_row,
+                sorted(render_options.items()),
+                is_normalized,
+                schema,
+            )
+            df = self.snapshot_cache.get(cache_key)
+            if df is not None:
+                self.logger.info(
+                    f"Read {sheet_name} from snapshot of revision {revision}"
+                )
+                return df
+        df = self._read_sheet(
+            sheet_name,
+            headers,
+            columns,
+            start_row,
+            end_row,
+            page_rows,
+            header_row,
+            render_options,
+        )
+        if is_normalized:
+            df.columns = [normalize_cell(column) for column in df.columns]
+            df = df.apply(lambda column: column.map(normalize_cell))
+        if schema is not None:
+            df, failures = coerce_to_schema(df, schema)
+            for column, count in failures.items():
+                self.logger.warning(
+                    f"{count} values of column '{column}' of {sheet_name} could "
+                    "not be converted and were set to null."
+                )
+        if cache_key is not None:
+            self.snapshot_cache.put(cache_key, df)
+        return df
+
+    def _get_drive_metadata(self):
+        try:
+            response = self.drive_session.get(
+                f"https://www.googleapis.com/drive/v3/files/{self.spreadsheet_id}",
+                params={
+                    "fields": "version,modifiedTime,lastModifyingUser(me)",
+                    "supportsAllDrives": "true",
+                },
+            )
+            response.raise_for_status()
+        except Exception as e:
+            self.logger.warning(f"Failed to read the spreadsheet revision: {e}")
+            return None
+        return response.json()
+
+    @staticmethod
+    def _to_revision(metadata):
+        if metadata is None:
+            return None
+        return f"{metadata['version']}@{metadata['modifiedTime']}"
+
+    def get_revision(self):
+        """
+        Fetch the Drive `version` and `modifiedTime` of the spreadsheet.
+
+        Returns:
+            str: The revision, or None when the Drive metadata is not readable.
+        """
+        return self._to_revision(self._get_drive_metadata())
+
+    def get_key_index(self, sheet_name, keys):
+        """
+        Open the key index of a worksheet, rebuilding it if the sheet changed.
+
+        The index is trusted while the spreadsheet revision is the one it
+        recorded after its last write. Otherwise, e.g. after a manual edit,
+        only the key columns are read to rebuild it.
+
+        Args:
+            sheet_name: The worksheet.
+            keys: The key columns.
+
+        Returns:
+            SheetKeyIndex: The up-to-date index.
+        """
+        index = SheetKeyIndex(self.spreadsheet_id, sheet_name, keys)
+        self.refresh_key_index(index)
+        return index
+
+    def refresh_key_index(self, index):
+        """
+        Rebuild a key index from its worksheet unless it is at the current
+        revision.
+
+        Args:
+            index: The SheetKeyIndex of the worksheet.
+
+        Returns:
+            bool: The index was rebuilt.
+        """
+        revision = self.get_revision()
+        if revision is not None and index.revision == revision:
             return False
+        self.logger.info(
+            f"Key index of {index.sheet_name} is at {index.revision}, "
+            f"the spreadsheet at {revision}"
+        )
+        self._rebuild_key_index(index, revision)
+        return True
+
+    def _rebuild_key_index(self, index, revision):
+        df_keys = pd.DataFrame(columns=index.keys)
+        if self.is_sheet_exists(index.sheet_name) and self.read_headers(
+            index.sheet_name
+        ):
+            # typed cells, so numbers and dates compare with the written
+            # values whatever their display format
+            df_keys = self.read_sheet(
+                index.sheet_name,
+                columns=index.keys,
+                value_render_option="UNFORMATTED_VALUE",
+                date_time_render_option="SERIAL_NUMBER",
+                is_normalized=True,
+            )
+        index.rebuild(df_keys, revision)
+
+    def write_with_key_index(self, index, df, write, is_replace=False):
+        """
+        Write rows with `write` and record their keys in the key index.
+
+        Just before the write the revision must still be the one the index
+        recorded; otherwise the index is rebuilt and, for an append, rows whose
+        key the sheet now holds are dropped. After the write its revision is
+        recorded only if this account made the last change, else another
+        writer interleaved and the index is rebuilt from the sheet.
 
-    def read_sheet(self, sheet_name, headers=None):
-        current_worksheet = self.spread_sheet.worksheet(sheet_name)
-        data = current_worksheet.get_all_values()
-        if len(data) >= 2:
-            df = pd.DataFrame(data[1:], columns=data[0])
-            return df
+        Args:
+            index: The SheetKeyIndex of the worksheet.
+            df: The rows to write.
+            write: Called with the rows to write them.
+            is_replace: The write replaces the worksheet content.
+
+        Returns:
+            pd.DataFrame: The rows written.
+        """
+        if self.refresh_key_index(index) and not is_replace:
+            df = index.get_new_rows(df)
+            if df.empty:
+                return df
+        write(df)
+        metadata = self._get_drive_metadata()
+        revision = self._to_revision(metadata)
+        is_own_change = (metadata or {}).get("lastModifyingUser", {}).get("me")
+        if revision is None or not is_own_change:
+            self.logger.info(
+                f"{index.sheet_name} changed during the write, rebuilding its index"
+            )
+            self._rebuild_key_index(index, revision)
+        elif is_replace:
+            index.rebuild(df, revision)
         else:
-            return pd.DataFrame(columns=headers)
+            index.add(df, revision)
+        return df
+
+    def _read_sheet(
+        self,
+        sheet_name,
+        headers,
+        columns,
+        start_row,
+        end_row,
+        page_rows,
+        header_row,
+        render_options,
+    ):
+        is_whole_sheet = columns is None and start_row == 2 and end_row is None
+        if not is_whole_sheet:
+            # pages stop at row_count, which a cached worksheet may hold from
+            # before another writer grew the grid
+            self.client.invalidate_worksheet(self.spreadsheet_id, sheet_name)
+        current_worksheet = self.get_worksheet_by_name(sheet_name)
+        if is_whole_sheet:
+            data = current_worksheet.get_all_values(**render_options)
+            if len(data) >= 2:
+                df = pd.DataFrame(data[1:], columns=data[0])
+                return df
+            else:
+                return pd.DataFrame(columns=headers)
+
+        if header_row is None:
+            header_row = current_worksheet.row_values(1)
+        columns = columns if columns is not None else header_row
+        if not header_row:
+            return pd.DataFrame(columns=headers or columns)
+        positions = {}
+        for position, header in enumerate(header_row, start=1):
+            positions.setdefault(header, position)
+        for column in columns:
+            if column not in positions:
+                raise ValueError(f"Column '{column}' not found in sheet.")
+        # merge adjacent columns into one range per request
+        spans = []
+        for position in sorted({positions[column] for column in columns}):
+            if spans and spans[-1][1] == position - 1:
+                spans[-1][1] = position
+            else:
+                spans.append([position, position])
+
+        end_row = min(
+            end_row or current_worksheet.row_count, current_worksheet.row_count
+        )
+        pages = {
+            position: [] for first, last in spans for position in range(first, last + 1)
+        }
+        num_rows = 0
+        for page_start in range(start_row, end_row + 1, page_rows):
+            page_end = min(page_start + page_rows - 1, end_row)
+            response = self.spread_sheet.values_batch_get(
+                [
+                    gspread.utils.absolute_range_name(
+                        current_worksheet.title,
+                        f"{gspread.utils.rowcol_to_a1(page_start, first)}:"
+                        f"{gspread.utils.rowcol_to_a1(page_end, last)}",
+                    )
+                    for first, last in spans
+                ],
+                params={
+                    "majorDimension": "COLUMNS",
+                    "valueRenderOption": render_options.get(
+                        "value_render_option", "FORMATTED_VALUE"
+                    ),
+                    "dateTimeRenderOption": render_options.get(
+                        "date_time_render_option", "SERIAL_NUMBER"
+                    ),
+                },
+            )
+            page_columns = {}
+            for (first, _), value_range in zip(spans, response["valueRanges"]):
+                for offset, values in enumerate(value_range.get("values", [])):
+                    page_columns[first + offset] = values
+            # trailing empty cells are omitted, so pad every page to its full height
+            page_length = page_end - page_start + 1
+            for position, page in pages.items():
+                values = page_columns.get(position, [])
+                page.append(values + [""] * (page_length - len(values)))
+            longest = max(map(len, page_columns.values()), default=0)
+            if longest:
+                num_rows = page_start - start_row + longest
+        if num_rows == 0:
+            return pd.DataFrame(columns=headers or columns)
+        return pd.DataFrame(
+            {
+                column: [
+                    value for page in pages[positions[column]] for value in page
+                ][:num_rows]
+                for column in columns
+            }
+        )
+
+    @staticmethod
+    def map_schema_to_headers(schema, header_row, normalize_header=None):
+        """
+        Key a schema by the sheet headers its fields are named after.
+
+        Args:
+            schema: `{field, type}` dicts.
+            header_row: The header row of the worksheet.
+            normalize_header: Maps a header to its field name. Defaults to
+                the header itself.
+
+        Returns:
+            list: The `{field, type}` dicts of the headers found, keyed by
+                sheet header.
+        """
+        fields = {field["field"]: field for field in schema}
+        header_schema = []
+        for header in dict.fromkeys(header_row):
+            name = normalize_header(header) if normalize_header else header
+            if name in fields:
+                header_schema.append({**fields[name], "field": header})
+        return header_schema
+
+    def read_sheets(
+        self,
+        sheet_names: List[str],
+        value_render_option=None,
+        date_time_render_option=None,
+        schemas: dict = None,
+        normalize_header=None,
+    ):
+        """
+        Read several whole worksheets with a single `values.batchGet`.
+
+        Tabs already in the snapshot cache at the current revision are not
+        requested again.
+
+        Args:
+            sheet_names: The worksheets to read.
+            value_render_option: e.g. `UNFORMATTED_VALUE` to read typed values
+                instead of formatted strings.
+            date_time_render_option: e.g. `SERIAL_NUMBER` to read dates as
+                day serials.
+            schemas: `{field, type}` dicts by worksheet. The columns are
+                coerced with `coerce_to_schema` before the snapshot is
+                cached, like in `read_sheet`. Unformatted tabs without a
+                schema are not cached, as Parquet cannot store their mixed
+                columns.
+            normalize_header: Maps a sheet header to its schema field name.
+
+        Returns:
+            dict: The DataFrame of every worksheet, by name.
+        """
+        sheet_names = list(dict.fromkeys(sheet_names))
+        schemas = schemas or {}
+        params = {
+            "valueRenderOption": value_render_option or "FORMATTED_VALUE",
+            "dateTimeRenderOption": date_time_render_option or "SERIAL_NUMBER",
+        }
+        is_unformatted = params["valueRenderOption"] == "UNFORMATTED_VALUE"
+        revision = self.get_revision() if self.snapshot_cache is not None else None
+        cache_keys = {
+            sheet_name: make_cache_key(
+                self.spreadsheet_id,
+                sheet_name,
+                revision,
+                sorted(params.items()),
+                schemas.get(sheet_name),
+            )
+            for sheet_name in sheet_names
+        }
+        frames = {}
+        if revision is not None:
+            for sheet_name in sheet_names:
+                df = self.snapshot_cache.get(cache_keys[sheet_name])
+                if df is not None:
+                    frames[sheet_name] = df
+        missing = [name for name in sheet_names if name not in frames]
+        if missing:
+            response = self.spread_sheet.values_batch_get(
+                [gspread.utils.absolute_range_name(name) for name in missing],
+                params=params,
+            )
+            for sheet_name, value_range in zip(missing, response["valueRanges"]):
+                df = self._values_to_dataframe(value_range.get("values", []))
+                schema = schemas.get(sheet_name)
+                if schema is not None:
+                    df, failures = coerce_to_schema(
+                        df,
+                        self.map_schema_to_headers(
+                            schema, df.columns, normalize_header
+                        ),
+                    )
+                    for column, count in failures.items():
+                        self.logger.warning(
+                            f"{count} values of column '{column}' of {sheet_name} "
+                            "could not be converted and were set to null."
+                        )
+                if revision is not None and (schema is not None or not is_unformatted):
+                    self.snapshot_cache.put(cache_keys[sheet_name], df)
+                frames[sheet_name] = df
+        self.logger.info(
+            f"Read {len(sheet_names)} worksheets, {len(missing)} from the API"
+        )
+        return {sheet_name: frames[sheet_name] for sheet_name in sheet_names}
+
+    @staticmethod
+    def _values_to_dataframe(values):
+        """Build a DataFrame from rows whose first row is the header."""
+        if not values:
+            return pd.DataFrame()
+        header = values[0]
+        if len(values) < 2:
+            return pd.DataFrame(columns=header)
+        # trailing empty cells are omitted, so pad every row to the header width
+        rows = pd.DataFrame(values[1:]).reindex(columns=range(len(header)))
+        rows.columns = header
+        return rows.fillna("")
@@ -1,18 +1,192 @@
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
 import pandas as pd
+import pyarrow.parquet as pq
 from google.cloud import bigquery
 from py_utils.common.logger import LoggerMixin
+from py_utils.google.console.gcs import GCSUtil, parse_gcs_uri
+from py_utils.google.console.job_stats import get_job_stats_collector
+from py_utils.utils.cache import ParquetCache, make_cache_key
+from py_utils.utils.dataframe import hash_keys, normalize_keys
+from py_utils.utils.path import get_cache_dir
+
+KEY_HASH_COLUMN = "_key_hash"
+
+_SQL_TOKEN_RE = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)|\s+")
+
+
+# results of queries calling these functions change between runs
+_NON_DETERMINISTIC_RE = re.compile(
+    r"\b(CURRENT_(?:DATE|DATETIME|TIME|TIMESTAMP)|RAND|GENERATE_UUID"
+    r"|SESSION_USER|NET\.HOST)\b|@@",
+    re.IGNORECASE,
+)
+
+
+def is_deterministic_sql(query: str) -> bool:
+    """
+    Tell whether a query calls no time, random or session function.
+
+    String literals and quoted identifiers are ignored.
+    """
+    code = _SQL_TOKEN_RE.sub(lambda m: " " if m.group(1) else m.group(0), query)
+    return _NON_DETERMINISTIC_RE.search(code) is None
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Collapse whitespace outside of string literals and identifiers.
+    """
+    normalized = _SQL_TOKEN_RE.sub(lambda m: m.group(1) or " ", query)
+    return normalized.strip().rstrip(";").strip()
+
+
+class BigqueryConfig:
+    QUERY_CACHE_ENABLED = os.environ.get("BIGQUERY_QUERY_CACHE", "false").lower() in (
+        "1",
+        "true",
+    )
+    QUERY_CACHE_DIR = os.environ.get("BIGQUERY_QUERY_CACHE_DIR")
+    QUERY_CACHE_TTL_SECONDS = float(
+        os.environ.get("BIGQUERY_QUERY_CACHE_TTL_SECONDS", 600)
+    )
+    QUERY_CACHE_MAX_BYTES = int(
+        os.environ.get("BIGQUERY_QUERY_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+    )
+    STREAM_FLUSH_ROWS = int(os.environ.get("BIGQUERY_STREAM_FLUSH_ROWS", 500))
+    STREAM_FLUSH_INTERVAL_SECONDS = float(
+        os.environ.get("BIGQUERY_STREAM_FLUSH_INTERVAL_SECONDS", 1.0)
+    )
+    READ_MEMORY_MAX_BYTES = int(
+        os.environ.get("BIGQUERY_READ_MEMORY_MAX_BYTES", 512 * 1024 * 1024)
+    )
+    READ_STREAM_MAX_BYTES = int(
+        os.environ.get("BIGQUERY_READ_STREAM_MAX_BYTES", 10 * 1024 * 1024 * 1024)
+    )
+    READ_CHUNK_ROWS = int(os.environ.get("BIGQUERY_READ_CHUNK_ROWS", 100000))
+    # e.g. gs://bucket/tmp/bigquery_exports; without it huge reads are streamed
+    EXPORT_URI_PREFIX = os.environ.get("BIGQUERY_EXPORT_URI_PREFIX")
+    # `duckdb` runs every service on a local database instead of BigQuery
+    BACKEND = os.environ.get("BIGQUERY_BACKEND", "bigquery").lower()
+    DUCKDB_DATABASE = os.environ.get("BIGQUERY_DUCKDB_DATABASE")
+    DUCKDB_FIXTURES_DIR = os.environ.get("BIGQUERY_DUCKDB_FIXTURES_DIR")
+    # key sets whose literal fits in this many bytes are inlined in the
+    # query, larger ones are loaded to a short-lived staging table; BigQuery
+    # rejects query texts over 1 MB
+    ANTI_JOIN_MAX_INLINE_BYTES = int(
+        os.environ.get("BIGQUERY_ANTI_JOIN_MAX_INLINE_BYTES", 512 * 1024)
+    )
+    ANTI_JOIN_KEYS_TTL_SECONDS = int(
+        os.environ.get("BIGQUERY_ANTI_JOIN_KEYS_TTL_SECONDS", 3600)
+    )
+
+
+# key types whose STRING cast matches the text a sheet shows for them, and
+# the text `normalize_keys` renders for them
+_ANTI_JOIN_KEY_TYPES = {"STRING", "INTEGER", "INT64"}
+
+
+class READSTRATEGY:
+    MEMORY = "memory"
+    STREAM = "stream"
+    EXPORT = "export"
 
 
 class BigqueryService(LoggerMixin):
-    def __init__(self, project_id):
+    def __init__(self, project_id, query_cache: ParquetCache = None, client=None):
         """
         Initialize the BigQueryUtil with a specific project ID.
 
         Args:
                         project_id (str): The Google Cloud project ID.
+                        query_cache (ParquetCache): Optional local query result cache.
+                                        Enabled by default when BIGQUERY_QUERY_CACHE is set.
+                        client (bigquery.Client): The client to use, e.g. built from a
+                                        service account. Defaults to the ambient credentials.
         """
-        self.client = bigquery.Client(project=project_id)
+        self.client = client or bigquery.Client(project=project_id)
         self.project_id = project_id
+        self.job_stats = get_job_stats_collector()
+        if query_cache is None and BigqueryConfig.QUERY_CACHE_ENABLED:
+            query_cache = ParquetCache(
+                directory=BigqueryConfig.QUERY_CACHE_DIR
+                or get_cache_dir("bigquery_query"),
+                max_bytes=BigqueryConfig.QUERY_CACHE_MAX_BYTES,
+                ttl_seconds=BigqueryConfig.QUERY_CACHE_TTL_SECONDS,
+            )
+        self.query_cache = query_cache
+
+    @staticmethod
+    def _dry_run_config(job_config=None):
+        """
+        Copy a query job config as a dry run.
+
+        Parameters, default dataset and connection properties are kept, so
+        the dry run validates and estimates the same query as the real job.
+        """
+        if job_config is None:
+            dry_run_config = bigquery.QueryJobConfig()
+        else:
+            dry_run_config = bigquery.QueryJobConfig.from_api_repr(
+                job_config.to_api_repr()
+            )
+        dry_run_config.dry_run = True
+        dry_run_config.use_query_cache = False
+        return dry_run_config
+
+    def _submit_query(self, query, job_config=None, is_script=False):
+        """
+        Start a query job under the budget policy of the current task.
+
+        Args:
+                        query (str): The SQL to execute.
+                        job_config (google.cloud.bigquery.QueryJobConfig): Optional job config.
+                        is_script (bool): Skip the dry run for multi-statement scripts.
+
+        Returns:
+                        google.cloud.bigquery.job.QueryJob: The started job.
+        """
+        job_config = job_config or bigquery.QueryJobConfig()
+        policy = self.job_stats.policy
+        if policy.is_dry_run_first and not is_script:
+            dry_run_job = self.client.query(
+                query, job_config=self._dry_run_config(job_config)
+            )
+            self.job_stats.check_estimate(dry_run_job.total_bytes_processed)
+        if (
+            policy.max_bytes_billed is not None
+            and job_config.maximum_bytes_billed is None
+        ):
+            job_config.maximum_bytes_billed = policy.max_bytes_billed
+        return self.client.query(query, job_config=job_config)
+
+    def _submit_load(self, df, destination, job_config=None):
+        return self.client.load_table_from_dataframe(
+            df, destination, job_config=job_config
+        )
+
+    def _submit_load_uri(self, uris, destination, job_config=None):
+        return self.client.load_table_from_uri(
+            uris, destination, job_config=job_config
+        )
+
+    def _wait(self, job):
+        """
+        Wait for a job to finish and record its statistics.
+
+        Returns:
+                        The result of the job.
+        """
+        result = job.result()
+        self.job_stats.record(job)
+        return result
 
     def scd(
         self,
@@ -21,6 +195,7 @@ class BigqueryService(LoggerMixin):
         df: pd.DataFrame = None,
         unique_keys=None,
         schema=None,
+        is_key_hash: bool = False,
     ):
         self.logger.info(f"Start merge data to table: {destination_table}")
         destination_project_dataset = f"{self.project_id}.{destination_dataset}"
@@ -29,6 +204,9 @@ class BigqueryService(LoggerMixin):
         )
         l = destination_project_dataset_table.split(".")
         staging_project_dataset_table = l[0] + ".staging." + l[2]
+        if is_key_hash:
+            self._check_key_hash_column(destination_project_dataset_table)
+            df, schema = self._with_key_hash(df, unique_keys, schema)
         # insert data to staging table
         if schema is not None:
             job_stg_table_config = bigquery.LoadJobConfig(
@@ -42,12 +220,12 @@ class BigqueryService(LoggerMixin):
                 write_disposition="WRITE_TRUNCATE",
                 autodetect=True,
             )
-        create_stg_table_job = self.client.load_table_from_dataframe(
+        create_stg_table_job = self._submit_load(
             df, staging_project_dataset_table, job_config=job_stg_table_config
         )
-        create_stg_table_job.result()
+        self._wait(create_stg_table_job)
         # build dml to merge data from staging table to destination table
-        on_clause = self._build_on_clause(unique_keys)
+        on_clause = self._build_on_clause(unique_keys, is_key_hash=is_key_hash)
         merge_dml = f"""
 			DECLARE cols STRING;
 			DECLARE update_clause STRING;
@@ -78,7 +256,7 @@ class BigqueryService(LoggerMixin):
 			''', update_clause);	
         """
         self.logger.info(f"Merge DML: {merge_dml}")
-        self.client.query(merge_dml).result()
+        self._wait(self._submit_query(merge_dml, is_script=True))
         return merge_dml
 
     def insert(
@@ -89,8 +267,16 @@ class BigqueryService(LoggerMixin):
         time_partitioning=None,
         clustering_fields=None,
         schema=None,
+        unique_keys=None,
+        is_key_hash: bool = False,
     ):
         self.logger.info(f"Start insert data to table: {table_id}")
+        if is_key_hash:
+            if write_disposition == "WRITE_APPEND":
+                self._check_key_hash_column(table_id)
+            df, schema = self._with_key_hash(df, unique_keys, schema)
+            if clustering_fields is None:
+                clustering_fields = [KEY_HASH_COLUMN]
         if schema is not None:
             job_config = bigquery.LoadJobConfig(
                 create_disposition="CREATE_IF_NEEDED",
@@ -109,11 +295,152 @@ class BigqueryService(LoggerMixin):
         if clustering_fields is not None:
             self.logger.info(f"Clustering fields: {clustering_fields}")
             job_config.clustering_fields = clustering_fields
-        job = self.client.load_table_from_dataframe(df, table_id, job_config=job_config)
-        job.result()
+        job = self._submit_load(df, table_id, job_config=job_config)
+        self._wait(job)
         self.logger.info(f"Insert data to table: {table_id} - Done")
         return job.state
 
+    def load_from_uris(
+        self,
+        table_id: str,
+        uri_batches,
+        source_format=bigquery.SourceFormat.PARQUET,
+        write_disposition="WRITE_APPEND",
+        time_partitioning=None,
+        clustering_fields=None,
+        schema=None,
+        skip_leading_rows=None,
+        on_batch_loaded=None,
+    ):
+        """
+        Load files already in GCS with server-side load jobs, one per batch of URIs.
+
+        With WRITE_TRUNCATE only the first batch truncates the table; the other
+        batches are appended. Batches after the first run concurrently; a failed
+        batch does not stop the others, and the first failure is raised once
+        every job has finished, so `on_batch_loaded` sees every loaded batch.
+
+        Args:
+                        table_id (str): The full table id `project.dataset.table`.
+                        uri_batches (list): Lists of `gs://` URIs, one load job each.
+                        source_format (str): A `bigquery.SourceFormat` value.
+                        write_disposition (str): The write disposition of the first batch.
+                        time_partitioning: Partitioning used if the table is created.
+                        clustering_fields (list): Clustering used if the table is created.
+                        schema (list): The load schema. Autodetected when None.
+                        skip_leading_rows (int): Header rows to skip for CSV files.
+                        on_batch_loaded (callable): Called with each batch once loaded.
+
+        Returns:
+                        int: The number of rows loaded.
+        """
+
+        def make_job_config(disposition):
+            job_config = bigquery.LoadJobConfig(
+                create_disposition="CREATE_IF_NEEDED",
+                write_disposition=disposition,
+                source_format=source_format,
+            )
+            if schema is not None:
+                job_config.schema = schema
+            else:
+                job_config.autodetect = True
+            if skip_leading_rows is not None:
+                job_config.skip_leading_rows = skip_leading_rows
+            if time_partitioning is not None:
+                job_config.time_partitioning = time_partitioning
+            if clustering_fields is not None:
+                job_config.clustering_fields = clustering_fields
+            return job_config
+
+        output_rows = 0
+        batches = list(uri_batches)
+        if write_disposition != "WRITE_APPEND" and batches:
+            first_batch, batches = batches[0], batches[1:]
+            job = self._submit_load_uri(
+                first_batch, table_id, job_config=make_job_config(write_disposition)
+            )
+            self._wait(job)
+            output_rows += job.output_rows or 0
+            if on_batch_loaded is not None:
+                on_batch_loaded(first_batch)
+        jobs, error = [], None
+        for batch in batches:
+            try:
+                job = self._submit_load_uri(
+                    batch, table_id, job_config=make_job_config("WRITE_APPEND")
+                )
+            except Exception as e:
+                self.logger.error(f"Failed to submit load of {batch}: {e}")
+                error = error or e
+                continue
+            jobs.append((batch, job))
+        for batch, job in jobs:
+            try:
+                self._wait(job)
+            except Exception as e:
+                self.logger.error(f"Failed to load {batch}: {e}")
+                error = error or e
+                continue
+            output_rows += job.output_rows or 0
+            if on_batch_loaded is not None:
+                on_batch_loaded(batch)
+        self.logger.info(f"Loaded {output_rows} rows from GCS into {table_id}")
+        if error is not None:
+            raise error
+        return output_rows
+
+    def append_stream(
+        self,
+        table_id: str,
+        df,
+        time_partitioning=None,
+        clustering_fields=None,
+        schema=None,
+        is_flush: bool = False,
+    ):
+        """
+        Append rows through a pooled Storage Write API stream instead of a load job.
+
+        The destination is created with a regular load job the first time.
+        Afterwards rows are buffered and sent in batches of
+        BIGQUERY_STREAM_FLUSH_ROWS, or every BIGQUERY_STREAM_FLUSH_INTERVAL_SECONDS.
+
+        Args:
+                        table_id (str): The full table id `project.dataset.table`.
+                        df (pandas.DataFrame): The rows to append.
+                        time_partitioning: Partitioning used if the table is created.
+                        clustering_fields (list): Clustering used if the table is created.
+                        schema (list): Schema used if the table is created.
+                        is_flush (bool): Send the buffered rows before returning.
+        """
+        # imported here so that the Storage Write API client stays optional
+        from py_utils.google.console.stream_writer import get_stream_writer_pool
+
+        pool = get_stream_writer_pool(
+            flush_rows=BigqueryConfig.STREAM_FLUSH_ROWS,
+            flush_interval_seconds=BigqueryConfig.STREAM_FLUSH_INTERVAL_SECONDS,
+        )
+        if table_id not in pool.writers:
+            if not self.is_table_exists(table_id):
+                return self.insert(
+                    table_id=table_id,
+                    df=df,
+                    write_disposition="WRITE_APPEND",
+                    time_partitioning=time_partitioning,
+                    clustering_fields=clustering_fields,
+                    schema=schema,
+                )
+            columns = [field.name for field in self.client.get_table(table_id).schema]
+            stream_writer = pool.get_writer(table_id, columns=columns)
+        else:
+            stream_writer = pool.get_writer(table_id)
+        stream_writer.append(df)
+        if is_flush:
+            stream_writer.flush()
+        self.job_stats.increment_metric("stream_rows_appended", len(df))
+        self.logger.info(f"Appended {len(df)} rows to stream of table: {table_id}")
+
     def run_query(self, query):
         """
         Run a SQL query against BigQuery and return the results.
@@ -124,8 +451,407 @@ class BigqueryService(LoggerMixin):
         Returns:
                         google.cloud.bigquery.table.RowIterator: An iterator over the rows in the results.
         """
-        query_job = self.client.query(query)
-        return query_job.result()
+        query_job = self._submit_query(query)
+        return self._wait(query_job)
+
+    def _query_cache_key(self, query):
+        """
+        Build the result cache key of a query from a dry run.
+
+        The key covers the normalized SQL and the `modified` time of every
+        referenced table. Non-SELECT statements, non-deterministic queries,
+        tables with a streaming buffer and external tables, whose `modified`
+        time does not follow their data, are not cacheable, like in BigQuery's
+        own result cache.
+
+        Returns:
+                        str: The cache key, or None when the query is not cacheable.
+        """
+        if not is_deterministic_sql(query):
+            return None
+        dry_run_job = self.client.query(
+            query,
+            job_config=bigquery.QueryJobConfig(dry_run=True, use_query_cache=False),
+        )
+        if dry_run_job.statement_type != "SELECT":
+            return None
+        versions = []
+        for table_ref in dry_run_job.referenced_tables:
+            table = self.client.get_table(table_ref)
+            if table.streaming_buffer is not None or table.table_type == "EXTERNAL":
+                return None
+            versions.append(f"{table.full_table_id}@{table.modified.isoformat()}")
+        return make_cache_key(normalize_sql(query), *sorted(versions))
+
+    def query_dataframes(self, queries):
+        """
+        Run queries concurrently into DataFrames, serving repeats from the cache.
+
+        Args:
+                        queries (list): The SQL queries to execute.
+
+        Returns:
+                        list: DataFrames in the same order as `queries`.
+        """
+        results = [None] * len(queries)
+        cache_keys = [None] * len(queries)
+        misses = []
+        if self.query_cache is not None and queries:
+            # every key costs a dry run and table lookups, so they run together
+            with ThreadPoolExecutor(max_workers=min(len(queries), 8)) as executor:
+                cache_keys = list(executor.map(self._query_cache_key, queries))
+        for index, query in enumerate(queries):
+            if self.query_cache is not None:
+                if cache_keys[index] is not None:
+                    results[index] = self.query_cache.get(cache_keys[index])
+            if results[index] is None:
+                misses.append(index)
+            else:
+                self.logger.info(f"Query result served from cache: {cache_keys[index]}")
+                self.job_stats.increment_metric("query_cache_hits")
+        if misses:
+            for miss_index, result in self.iter_completed_queries(
+                [queries[index] for index in misses]
+            ):
+                index = misses[miss_index]
+                results[index] = result.to_dataframe()
+                if cache_keys[index] is not None:
+                    self.query_cache.put(cache_keys[index], results[index])
+        return results
+
+    def query_to_dataframe(self, query):
+        """
+        Run a SQL query into a DataFrame, using the local result cache if enabled.
+
+        Args:
+                        query (str): The SQL query to execute.
+
+        Returns:
+                        pandas.DataFrame: The query results.
+        """
+        return self.query_dataframes([query])[0]
+
+    def choose_read_strategy(self, query_job):
+        """
+        Choose how to read a finished query from the size of its result.
+
+        The size is the `num_bytes` of the job's destination table. The bytes
+        a query scans say little about its result: an aggregation scans a lot
+        and returns little, and a join can return more than it scans.
+
+        Args:
+                        query_job (google.cloud.bigquery.job.QueryJob): The finished job.
+
+        Returns:
+                        str: A READSTRATEGY value.
+        """
+        result_bytes = 0
+        if query_job.destination is not None:
+            result_bytes = self.client.get_table(query_job.destination).num_bytes or 0
+        if result_bytes <= BigqueryConfig.READ_MEMORY_MAX_BYTES:
+            strategy = READSTRATEGY.MEMORY
+        elif (
+            result_bytes <= BigqueryConfig.READ_STREAM_MAX_BYTES
+            or BigqueryConfig.EXPORT_URI_PREFIX is None
+        ):
+            strategy = READSTRATEGY.STREAM
+        else:
+            strategy = READSTRATEGY.EXPORT
+        self.logger.info(f"Read strategy: {strategy} - result: {result_bytes} bytes")
+        self.job_stats.record_metric("read_strategy", strategy)
+        self.job_stats.record_metric("read_result_bytes", result_bytes)
+        return strategy
+
+    def iter_query_dataframes(self, query, chunk_rows=None):
+        """
+        Read a query result as DataFrame chunks with a size-appropriate strategy.
+
+        The query runs once; the strategy then follows the size of its result.
+        Small results are fetched in memory as a single chunk and go through
+        the result cache. Larger results are streamed with the Storage Read
+        API. The largest are exported to GCS as Parquet and read back shard by
+        shard, row group by row group.
+
+        Args:
+                        query (str): The SQL query to read.
+                        chunk_rows (int): Rows per chunk when exporting.
+
+        Yields:
+                        pandas.DataFrame: The result chunks.
+        """
+        chunk_rows = chunk_rows or BigqueryConfig.READ_CHUNK_ROWS
+        cache_key = None
+        if self.query_cache is not None:
+            cache_key = self._query_cache_key(query)
+            cached = self.query_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                self.logger.info(f"Query result served from cache: {cache_key}")
+                self.job_stats.increment_metric("query_cache_hits")
+                yield cached
+                return
+        query_job = self._submit_query(query)
+        result = self._wait(query_job)
+        strategy = self.choose_read_strategy(query_job)
+        if strategy == READSTRATEGY.MEMORY:
+            df = result.to_dataframe()
+            if cache_key is not None:
+                self.query_cache.put(cache_key, df)
+            yield df
+        elif strategy == READSTRATEGY.STREAM:
+            yield from self._iter_stream_dataframes(result)
+        else:
+            yield from self._iter_export_dataframes(query_job, chunk_rows)
+
+    @staticmethod
+    def build_anti_join_query(query, keys_sql, unique_keys):
+        """
+        Wrap a query so that it only returns rows whose keys are not in `keys_sql`.
+
+        NULL keys compare as blanks, like empty sheet cells.
+
+        Args:
+                        query (str): The SQL query to filter.
+                        keys_sql (str): A FROM item with one STRING column per key.
+                        unique_keys (list): The key columns.
+
+        Returns:
+                        str: The wrapped query.
+        """
+        on_clause = " AND ".join(
+            f"s.`{key}` = IFNULL(CAST(q.`{key}` AS STRING), '')"
+            for key in unique_keys
+        )
+        # the query may end with a `--` comment, so it closes on its own line
+        return (
+            f"SELECT q.* FROM (\n{query.strip().rstrip(';')}\n) AS q\n"
+            f"WHERE NOT EXISTS (SELECT 1 FROM {keys_sql} AS s WHERE {on_clause})"
+        )
+
+    def check_anti_join_key_types(self, query, unique_keys):
+        """
+        Check from a dry run that the keys of a query compare as sheet strings.
+
+        STRING and INT64 keys cast to the text a sheet shows for them. The
+        text of dates, timestamps, floats and booleans depends on the format
+        of the cells, so such keys must be formatted in the query instead.
+
+        Args:
+                        query (str): The SQL query to read.
+                        unique_keys (list): The key columns.
+
+        Raises:
+                        ValueError: A key is missing or has another type.
+        """
+        dry_run_job = self.client.query(query, job_config=self._dry_run_config())
+        types = {field.name: field.field_type for field in dry_run_job.schema}
+        invalid = {
+            key: types.get(key)
+            for key in unique_keys
+            if types.get(key) not in _ANTI_JOIN_KEY_TYPES
+        }
+        if invalid:
+            raise ValueError(
+                f"Anti-join keys must be STRING or INT64 columns, got {invalid}; "
+                "format them as strings in the query, e.g. with FORMAT_DATE."
+            )
+
+    def iter_query_dataframes_not_in(
+        self, query, keys_df: pd.DataFrame, unique_keys, chunk_rows=None
+    ):
+        """
+        Read the rows of a query whose keys are not in `keys_df`, filtered in BigQuery.
+
+        Keys are compared as STRING, after `check_anti_join_key_types`; the
+        keys of `keys_df` are rendered with `normalize_keys`. Key sets whose
+        literal fits in ANTI_JOIN_MAX_INLINE_BYTES are inlined in the query as
+        an `UNNEST` array, so the wrapped query can still be served from the
+        result cache. Larger ones are loaded to a staging table that expires on
+        its own and is dropped once the result is read. The ORDER BY of the
+        query is not kept.
+
+        Args:
+                        query (str): The SQL query to read.
+                        keys_df (pandas.DataFrame): The keys to exclude.
+                        unique_keys (list): The key columns.
+                        chunk_rows (int): Rows per chunk when exporting.
+
+        Yields:
+                        pandas.DataFrame: The result chunks.
+        """
+        keys_df = normalize_keys(keys_df, unique_keys).drop_duplicates()
+        if keys_df.empty:
+            yield from self.iter_query_dataframes(query, chunk_rows=chunk_rows)
+            return
+        self.check_anti_join_key_types(query, unique_keys)
+        inline_query = self._build_inline_anti_join_query(query, keys_df, unique_keys)
+        if inline_query is not None:
+            yield from self.iter_query_dataframes(inline_query, chunk_rows=chunk_rows)
+            return
+        staging_project_dataset_table = (
+            f"{self.project_id}.staging.anti_join_{uuid.uuid4().hex}"
+        )
+        job_config = bigquery.LoadJobConfig(
+            create_disposition="CREATE_IF_NEEDED",
+            write_disposition="WRITE_TRUNCATE",
+            schema=[bigquery.SchemaField(key, "STRING") for key in unique_keys],
+        )
+        self._wait(
+            self._submit_load(
+                keys_df, staging_project_dataset_table, job_config=job_config
+            )
+        )
+        try:
+            # dropped below; the expiration covers runs that die before that
+            table = self.client.get_table(staging_project_dataset_table)
+            table.expires = datetime.now(timezone.utc) + timedelta(
+                seconds=BigqueryConfig.ANTI_JOIN_KEYS_TTL_SECONDS
+            )
+            self.client.update_table(table, ["expires"])
+            self.logger.info(
+                f"Loaded {len(keys_df)} keys to {staging_project_dataset_table}"
+            )
+            yield from self.iter_query_dataframes(
+                self.build_anti_join_query(
+                    query, f"`{staging_project_dataset_table}`", unique_keys
+                ),
+                chunk_rows=chunk_rows,
+            )
+        finally:
+            self.client.delete_table(staging_project_dataset_table, not_found_ok=True)
+
+    def _build_inline_anti_join_query(self, query, keys_df, unique_keys):
+        """
+        Inline the keys as an `UNNEST` literal, or return None when over budget.
+        """
+        max_bytes = BigqueryConfig.ANTI_JOIN_MAX_INLINE_BYTES
+        # the key characters alone bound the literal from below
+        if keys_df.apply(lambda column: column.str.len()).to_numpy().sum() > max_bytes:
+            return None
+        # JSON strings are valid BigQuery string literals
+        structs = ", ".join(
+            "STRUCT("
+            + ", ".join(
+                f"{json.dumps(value, ensure_ascii=False)} AS `{key}`"
+                for key, value in zip(unique_keys, row)
+            )
+            + ")"
+            for row in keys_df.itertuples(index=False)
+        )
+        inline_query = self.build_anti_join_query(
+            query, f"UNNEST([{structs}])", unique_keys
+        )
+        if len(inline_query.encode("utf-8")) > max_bytes:
+            return None
+        return inline_query
+
+    def _iter_stream_dataframes(self, result):
+        # imported here so that the Storage Read API client stays optional
+        from google.cloud import bigquery_storage
+
+        yield from result.to_dataframe_iterable(
+            bqstorage_client=bigquery_storage.BigQueryReadClient()
+        )
+
+    def _iter_export_dataframes(self, query_job, chunk_rows):
+        export_prefix = BigqueryConfig.EXPORT_URI_PREFIX.rstrip("/")
+        destination_uri = f"{export_prefix}/{query_job.job_id}/*.parquet"
+        extract_job = self.client.extract_table(
+            query_job.destination,
+            destination_uri,
+            job_config=bigquery.ExtractJobConfig(
+                destination_format=bigquery.DestinationFormat.PARQUET
+            ),
+            location=query_job.location,
+        )
+        self._wait(extract_job)
+        gcs_util = GCSUtil(project_id=self.project_id)
+        for uri, _, _ in gcs_util.list_blobs_matching(destination_uri):
+            bucket_name, blob_name = parse_gcs_uri(uri)
+            with tempfile.NamedTemporaryFile(suffix=".parquet") as file:
+                gcs_util.download_file(bucket_name, blob_name, file.name)
+                gcs_util.delete_blob(bucket_name, blob_name)
+                for batch in pq.ParquetFile(file.name).iter_batches(
+                    batch_size=chunk_rows
+                ):
+                    yield batch.to_pandas()
+
+    def iter_completed_queries(
+        self, queries, timeout=None, poll_interval=0.5, max_poll_interval=8.0
+    ):
+        """
+        Start all queries at once and yield their results as jobs complete.
+
+        Jobs are polled together, doubling the wait between polling rounds up
+        to `max_poll_interval` seconds. When a job fails, the timeout expires
+        or the caller stops iterating, the pending jobs are cancelled.
+
+        Args:
+                        queries (list): The SQL queries to execute.
+                        timeout (float): Seconds to wait for all jobs. Default is no limit.
+                        poll_interval (float): Initial seconds between polling rounds.
+                        max_poll_interval (float): Maximum seconds between polling rounds.
+
+        Yields:
+                        tuple: The index of the query in `queries` and its RowIterator.
+        """
+        pending = {}
+        try:
+            for index, query in enumerate(queries):
+                pending[index] = self._submit_query(query)
+            self.logger.info(f"Submitted {len(pending)} query jobs")
+            deadline = None if timeout is None else time.monotonic() + timeout
+            interval = poll_interval
+            while pending:
+                for index, job in list(pending.items()):
+                    if job.done():
+                        del pending[index]
+                        self.logger.info(
+                            f"Query job {job.job_id} done - {len(pending)} pending"
+                        )
+                        yield index, self._wait(job)
+                if not pending:
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError(
+                        f"{len(pending)} query jobs did not finish within {timeout}s"
+                    )
+                time.sleep(interval)
+                interval = min(interval * 2, max_poll_interval)
+        finally:
+            # a failed job, a timeout or a caller that stops early would leave
+            # the other jobs running and billing
+            if pending:
+                self.logger.info(f"Cancelling {len(pending)} pending query jobs")
+            for job in pending.values():
+                try:
+                    job.cancel()
+                except Exception as e:
+                    self.logger.warning(f"Failed to cancel job {job.job_id}: {e}")
+
+    def submit_queries(
+        self, queries, timeout=None, poll_interval=0.5, max_poll_interval=8.0
+    ):
+        """
+        Run many independent queries concurrently and wait for all of them.
+
+        Args:
+                        queries (list): The SQL queries to execute.
+                        timeout (float): Seconds to wait for all jobs. Default is no limit.
+                        poll_interval (float): Initial seconds between polling rounds.
+                        max_poll_interval (float): Maximum seconds between polling rounds.
+
+        Returns:
+                        list: RowIterator results in the same order as `queries`.
+        """
+        results = [None] * len(queries)
+        for index, result in self.iter_completed_queries(
+            queries,
+            timeout=timeout,
+            poll_interval=poll_interval,
+            max_poll_interval=max_poll_interval,
+        ):
+            results[index] = result
+        return results
 
     def create_dataset(self, dataset_id, location="US"):
         """
@@ -199,12 +925,50 @@ class BigqueryService(LoggerMixin):
         dataset_ref = self.client.dataset(dataset_id)
         table_ref = dataset_ref.table(table_id)
         job_config = bigquery.LoadJobConfig()
-        job = self.client.load_table_from_dataframe(
-            df, table_ref, job_config=job_config
-        )
+        job = self._submit_load(df, table_ref, job_config=job_config)
         return job
 
-    def _build_on_clause(self, unique_keys):
+    def _with_key_hash(self, df, unique_keys, schema=None):
+        """
+        Materialize a single INT64 surrogate key over the unique keys.
+
+        Args:
+                        df (pandas.DataFrame): The DataFrame to load.
+                        unique_keys (list): The key columns to hash.
+                        schema (list): The optional load schema.
+
+        Returns:
+                        tuple: The DataFrame with `_key_hash` and the extended schema.
+        """
+        if not unique_keys:
+            raise ValueError("unique_keys is required to build the key hash.")
+        df = df.assign(**{KEY_HASH_COLUMN: hash_keys(df, unique_keys)})
+        if schema is not None and KEY_HASH_COLUMN not in [f.name for f in schema]:
+            schema = list(schema) + [
+                bigquery.SchemaField(KEY_HASH_COLUMN, "INTEGER", mode="NULLABLE")
+            ]
+        return df, schema
+
+    def _check_key_hash_column(self, table_id: str):
+        """
+        Reject writes keyed on `_key_hash` into a table created without it.
+
+        The hash is computed in pandas and cannot be reproduced in SQL, so the
+        column cannot be backfilled in place.
+        """
+        if (
+            self.is_table_exists(table_id=table_id)
+            and KEY_HASH_COLUMN not in self.get_column_names(table_id)
+        ):
+            raise ValueError(
+                f"Table {table_id} has no {KEY_HASH_COLUMN} column. Reload it "
+                f"with write mode truncate and is_key_hash before enabling "
+                f"is_key_hash for merges or appends."
+            )
+
+    def _build_on_clause(self, unique_keys, is_key_hash=False):
+        if is_key_hash:
+            return f"t.{KEY_HASH_COLUMN} = s.{KEY_HASH_COLUMN}"
         on_clause = ""
         for key in unique_keys:
             on_clause += f"t.{key} = s.{key} and "
@@ -218,6 +982,7 @@ class BigqueryService(LoggerMixin):
         df: pd.DataFrame = None,
         unique_keys=None,
         schema=None,
+        is_key_hash: bool = False,
     ):
         self.logger.info(f"Start merge data to table: {destination_table}")
         destination_project_dataset = f"{self.project_id}.{destination_dataset}"
@@ -226,6 +991,9 @@ class BigqueryService(LoggerMixin):
         )
         l = destination_project_dataset_table.split(".")
         staging_project_dataset_table = l[0] + ".staging." + l[2]
+        if is_key_hash:
+            self._check_key_hash_column(destination_project_dataset_table)
+            df, schema = self._with_key_hash(df, unique_keys, schema)
         # insert data to staging table
         if schema is not None:
             job_stg_table_config = bigquery.LoadJobConfig(
@@ -239,12 +1007,30 @@ class BigqueryService(LoggerMixin):
                 write_disposition="WRITE_TRUNCATE",
                 autodetect=True,
             )
-        create_stg_table_job = self.client.load_table_from_dataframe(
+        create_stg_table_job = self._submit_load(
             df, staging_project_dataset_table, job_config=job_stg_table_config
         )
-        create_stg_table_job.result()
+        self._wait(create_stg_table_job)
         # build dml to merge data from staging table to destination table
-        on_clause = self._build_on_clause(unique_keys)
+        on_clause = self._build_on_clause(unique_keys, is_key_hash=is_key_hash)
+        return self._merge_staging(
+            destination_dataset,
+            destination_table,
+            staging_project_dataset_table,
+            on_clause,
+        )
+
+    def _merge_staging(
+        self,
+        destination_dataset: str,
+        destination_table: str,
+        staging_project_dataset_table: str,
+        on_clause: str,
+    ):
+        destination_project_dataset = f"{self.project_id}.{destination_dataset}"
+        destination_project_dataset_table = (
+            f"{destination_project_dataset}.{destination_table}"
+        )
         merge_dml = f"""declare cols string;
 				set cols = (
 				select
@@ -263,10 +1049,288 @@ class BigqueryService(LoggerMixin):
 					'''
 					, cols
 				);"""
-        self.client.query(merge_dml).result()
+        self._wait(self._submit_query(merge_dml, is_script=True))
         self.logger.info(f"Merge DML: {merge_dml}")
         return merge_dml
 
+    def merge_query(
+        self,
+        query: str,
+        destination_dataset: str = None,
+        destination_table: str = None,
+        unique_keys=None,
+    ):
+        """
+        Merge the results of a query into a table without leaving BigQuery.
+
+        The query is materialized into the staging dataset, then merged on
+        `unique_keys` like `merge`. A missing destination is created instead.
+
+        Args:
+                        query (str): The SQL query producing the rows to merge.
+                        destination_dataset (str): The destination dataset.
+                        destination_table (str): The destination table.
+                        unique_keys (list): The columns to merge on.
+
+        Returns:
+                        str: The executed DML, or None when the table was created.
+        """
+        destination_project_dataset_table = (
+            f"{self.project_id}.{destination_dataset}.{destination_table}"
+        )
+        if not self.is_table_exists(destination_project_dataset_table):
+            self.query_to_table(
+                query,
+                destination_project_dataset_table,
+                write_disposition="WRITE_APPEND",
+            )
+            return None
+        staging_project_dataset_table = f"{self.project_id}.staging.{destination_table}"
+        self.query_to_table(
+            query, staging_project_dataset_table, write_disposition="WRITE_TRUNCATE"
+        )
+        return self._merge_staging(
+            destination_dataset,
+            destination_table,
+            staging_project_dataset_table,
+            self._build_on_clause(unique_keys),
+        )
+
+    def query_to_table(
+        self,
+        query: str,
+        destination: str,
+        write_disposition="WRITE_TRUNCATE",
+        time_partitioning=None,
+        clustering_fields=None,
+    ):
+        """
+        Write the results of a query into a table with a server-side query job.
+
+        Args:
+                        query (str): The SQL query to execute.
+                        destination (str): The table id, optionally with a `$YYYYMMDD`
+                                        partition decorator.
+                        write_disposition (str): WRITE_TRUNCATE, WRITE_APPEND or WRITE_EMPTY.
+                        time_partitioning: Partitioning used if the table is created.
+                        clustering_fields (list): Clustering used if the table is created.
+
+        Returns:
+                        google.cloud.bigquery.job.QueryJob: The finished job.
+        """
+        self.logger.info(f"Write query results to table: {destination}")
+        job_config = bigquery.QueryJobConfig(
+            destination=destination,
+            create_disposition="CREATE_IF_NEEDED",
+            write_disposition=write_disposition,
+        )
+        if time_partitioning is not None:
+            job_config.time_partitioning = time_partitioning
+        if clustering_fields is not None:
+            job_config.clustering_fields = clustering_fields
+        query_job = self._submit_query(query, job_config=job_config)
+        self._wait(query_job)
+        return query_job
+
+    def extract_tables(
+        self,
+        extracts,
+        destination_format=bigquery.DestinationFormat.CSV,
+        compression=None,
+    ):
+        """
+        Export several tables or partitions to GCS with concurrent extract jobs.
+
+        Args:
+                        extracts (list): `(source, destination_uri)` pairs. Sources may use
+                                        a `$YYYYMMDD` partition decorator and URIs a `*` wildcard.
+                        destination_format (str): A `bigquery.DestinationFormat` value.
+                        compression (str): A `bigquery.Compression` value, or None.
+
+        Returns:
+                        list: The finished extract jobs.
+        """
+        jobs = []
+        for source, destination_uri in extracts:
+            table = self.client.get_table(source.split("$")[0])
+            job_config = bigquery.ExtractJobConfig(
+                destination_format=destination_format
+            )
+            if compression is not None:
+                job_config.compression = compression
+            self.logger.info(f"Export {source} to {destination_uri}")
+            jobs.append(
+                self.client.extract_table(
+                    source,
+                    destination_uri,
+                    job_config=job_config,
+                    location=table.location,
+                )
+            )
+        for job in jobs:
+            self._wait(job)
+        return jobs
+
+    def copy_table(
+        self, source: str, destination: str, write_disposition="WRITE_TRUNCATE"
+    ):
+        """
+        Copy a table or a partition with a copy job, which scans no bytes.
+
+        Args:
+                        source (str): The source table id, optionally with a partition decorator.
+                        destination (str): The destination table id, optionally with a
+                                        partition decorator.
+                        write_disposition (str): WRITE_TRUNCATE, WRITE_APPEND or WRITE_EMPTY.
+
+        Returns:
+                        google.cloud.bigquery.job.CopyJob: The finished job.
+        """
+        self.logger.info(f"Copy table {source} to {destination}")
+        job_config = bigquery.CopyJobConfig(
+            create_disposition="CREATE_IF_NEEDED",
+            write_disposition=write_disposition,
+        )
+        copy_job = self.client.copy_table(source, destination, job_config=job_config)
+        self._wait(copy_job)
+        return copy_job
+
+    def read_row_hashes(self, table_id: str, unique_keys, hash_column: str):
+        """
+        Read only the key columns and the row hash column of a table.
+
+        Keys are cast to STRING so they compare with client-side snapshots.
+
+        Args:
+                        table_id (str): The full table id `project.dataset.table`.
+                        unique_keys (list): The key columns.
+                        hash_column (str): The column holding the row hash.
+
+        Returns:
+                        pandas.DataFrame: The key columns plus the hash column.
+        """
+        select_keys = ", ".join(
+            f"CAST(`{key}` AS STRING) AS `{key}`" for key in unique_keys
+        )
+        query = f"SELECT {select_keys}, `{hash_column}` FROM `{table_id}`"
+        self.logger.info(f"Read row hashes: {query}")
+        return self.run_query(query).to_dataframe()
+
+    def delete_by_keys(
+        self,
+        destination_dataset: str = None,
+        destination_table: str = None,
+        keys_df: pd.DataFrame = None,
+        unique_keys=None,
+    ):
+        """
+        Delete the rows of a table matching a DataFrame of STRING keys.
+
+        Args:
+                        destination_dataset (str): The dataset of the table.
+                        destination_table (str): The table to delete from.
+                        keys_df (pandas.DataFrame): The keys to delete, as strings.
+                        unique_keys (list): The key columns.
+
+        Returns:
+                        str: The executed DML.
+        """
+        destination_project_dataset_table = (
+            f"{self.project_id}.{destination_dataset}.{destination_table}"
+        )
+        staging_project_dataset_table = (
+            f"{self.project_id}.staging.{destination_table}__deleted"
+        )
+        job_config = bigquery.LoadJobConfig(
+            create_disposition="CREATE_IF_NEEDED",
+            write_disposition="WRITE_TRUNCATE",
+            schema=[bigquery.SchemaField(key, "STRING") for key in unique_keys],
+        )
+        load_job = self._submit_load(
+            keys_df[unique_keys], staging_project_dataset_table, job_config=job_config
+        )
+        self._wait(load_job)
+        on_clause = " and ".join(
+            f"CAST(t.{key} AS STRING) = s.{key}" for key in unique_keys
+        )
+        delete_dml = f"""
+            DELETE FROM `{destination_project_dataset_table}` AS t
+            WHERE EXISTS (
+                SELECT 1 FROM `{staging_project_dataset_table}` AS s
+                WHERE {on_clause}
+            )
+        """
+        self.logger.info(f"Delete DML: {delete_dml}")
+        self._wait(self._submit_query(delete_dml))
+        return delete_dml
+
+    def get_column_names(self, table_id: str):
+        """
+        List the column names of a table.
+
+        Args:
+                        table_id (str): The full table id `project.dataset.table`.
+
+        Returns:
+                        list: The top-level column names.
+        """
+        return [field.name for field in self.client.get_table(table_id).schema]
+
+    def check_key_types(self, table_id: str, unique_keys):
+        """
+        Check that the keys of a table compare as strings with DataFrame keys.
+
+        Change detection and `delete_by_keys` match keys as STRING. Only
+        STRING and INT64 columns cast to the text `normalize_keys` renders;
+        timestamps, floats and booleans cast to another text.
+
+        Args:
+                        table_id (str): The full table id `project.dataset.table`.
+                        unique_keys (list): The key columns.
+
+        Raises:
+                        ValueError: A key is missing or has another type.
+        """
+        types = {
+            field.name: field.field_type
+            for field in self.client.get_table(table_id.split("$")[0]).schema
+        }
+        invalid = {
+            key: types.get(key)
+            for key in unique_keys
+            if types.get(key) not in _ANTI_JOIN_KEY_TYPES
+        }
+        if invalid:
+            raise ValueError(
+                f"Keys of {table_id} must be STRING or INT64 columns to be "
+                f"matched with DataFrame keys, got {invalid}."
+            )
+
+    def get_table_type(self, table_id: str):
+        """
+        Return the type of a table: TABLE, VIEW, MATERIALIZED_VIEW, EXTERNAL, ...
+
+        Args:
+                        table_id (str): The full table id `project.dataset.table`.
+        """
+        return self.client.get_table(table_id.split("$")[0]).table_type
+
+    def add_column_if_not_exists(self, table_id: str, column: str, column_type: str):
+        """
+        Add a NULLABLE column to an existing table, if it is missing.
+
+        Args:
+                        table_id (str): The full table id `project.dataset.table`.
+                        column (str): The column name.
+                        column_type (str): The BigQuery type, e.g. `INT64`.
+        """
+        ddl = (
+            f"ALTER TABLE `{table_id}` "
+            f"ADD COLUMN IF NOT EXISTS `{column}` {column_type}"
+        )
+        self.logger.info(f"DDL: {ddl}")
+        self._wait(self._submit_query(ddl))
+
     def is_table_exists(self, table_id: str):
         dataset_id = table_id.split(".")[1]
         table_name = table_id.split(".")[2]
@@ -277,3 +1341,28 @@ class BigqueryService(LoggerMixin):
             return True
         except Exception:
             return False
+
+
+def get_bigquery_service(project_id, **kwargs):
+    """
+    Build the BigqueryService of the backend selected by BIGQUERY_BACKEND.
+
+    Args:
+                    project_id (str): The Google Cloud project ID.
+                    **kwargs: Extra arguments of the BigQuery backend.
+
+    Returns:
+                    BigqueryService or DuckdbBigqueryService: The service.
+    """
+    if BigqueryConfig.BACKEND == "duckdb":
+        # imported here so that DuckDB stays optional
+        from py_utils.google.console.duckdb_backend import DuckdbBigqueryService
+
+        return DuckdbBigqueryService(
+            project_id,
+            database=BigqueryConfig.DUCKDB_DATABASE,
+            fixtures_dir=BigqueryConfig.DUCKDB_FIXTURES_DIR,
+        )
+    if BigqueryConfig.BACKEND != "bigquery":
+        raise ValueError(f"Invalid BigQuery backend: {BigqueryConfig.BACKEND}")
+    return BigqueryService(project_id, **kwargs)
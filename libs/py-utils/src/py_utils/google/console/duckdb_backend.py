@@ -0,0 +1,636 @@
+import os
+import re
+
+import duckdb
+import pandas as pd
+from google.cloud import bigquery
+from py_utils.common.logger import LoggerMixin
+from py_utils.google.console.bigquery import KEY_HASH_COLUMN, BigqueryService
+from py_utils.google.console.job_stats import get_job_stats_collector
+from py_utils.utils.dataframe import hash_keys, normalize_keys
+from py_utils.utils.path import get_cache_dir
+
+_DIALECT_RE = re.compile(
+    r"(?:(?<!\w)([rR]))?'((?:[^'\\]|\\.)*)'"
+    r"|\"((?:[^\"\\]|\\.)*)\""
+    r"|`([^`]*)`"
+    r"|\b(CURRENT_(?:TIMESTAMP|DATE))\s*\(\s*\)"
+    r"|\b(INT64|FLOAT64|BYTES|SAFE_CAST)\b",
+    re.IGNORECASE,
+)
+
+# BigQuery escape sequences in quoted strings, decoded before requoting
+_ESCAPE_RE = re.compile(
+    r"\\(?:x([0-9a-fA-F]{2})|u([0-9a-fA-F]{4})|U([0-9a-fA-F]{8})|([0-7]{3})|(.))",
+    re.DOTALL,
+)
+
+_ESCAPES = {
+    "a": "\a",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+    "v": "\v",
+}
+
+_TYPE_NAMES = {
+    "INT64": "BIGINT",
+    "FLOAT64": "DOUBLE",
+    "BYTES": "BLOB",
+    "SAFE_CAST": "TRY_CAST",
+}
+
+# BigQuery schema field types to DuckDB column types
+_COLUMN_TYPES = {
+    "STRING": "VARCHAR",
+    "INTEGER": "BIGINT",
+    "INT64": "BIGINT",
+    "FLOAT": "DOUBLE",
+    "FLOAT64": "DOUBLE",
+    "NUMERIC": "DECIMAL(38, 9)",
+    "BIGNUMERIC": "DOUBLE",
+    "BOOLEAN": "BOOLEAN",
+    "BOOL": "BOOLEAN",
+    "TIMESTAMP": "TIMESTAMPTZ",
+    "DATETIME": "TIMESTAMP",
+    "DATE": "DATE",
+    "TIME": "TIME",
+    "BYTES": "BLOB",
+}
+
+_FIXTURE_READERS = {
+    ".csv": "read_csv_auto",
+    ".parquet": "read_parquet",
+    ".json": "read_json_auto",
+    ".ndjson": "read_json_auto",
+}
+
+
+def quote_table(table_id: str) -> str:
+    """
+    Map a BigQuery `[project.]dataset.table[$partition]` id onto `"dataset"."table"`.
+
+    The project is dropped: every project shares the local database.
+    """
+    parts = table_id.split("$")[0].split(".")
+    return ".".join(f'"{part}"' for part in parts[-2:])
+
+
+def _unescape(match):
+    hex_code, short_code, long_code, octal_code, char = match.groups()
+    if char is not None:
+        # \\, \', \", \`, \? and the other escapes stand for the character
+        return _ESCAPES.get(char, char)
+    if octal_code is not None:
+        return chr(int(octal_code, 8))
+    return chr(int(hex_code or short_code or long_code, 16))
+
+
+def _to_duckdb_string(value: str) -> str:
+    # DuckDB strings take no backslash escapes, only doubled quotes
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _translate_token(match):
+    (
+        raw_prefix,
+        single_quoted,
+        double_quoted,
+        identifier,
+        function,
+        type_name,
+    ) = match.groups()
+    if single_quoted is not None:
+        if raw_prefix is not None:
+            return _to_duckdb_string(single_quoted)
+        return _to_duckdb_string(_ESCAPE_RE.sub(_unescape, single_quoted))
+    if double_quoted is not None:
+        # BigQuery double quotes delimit strings, DuckDB ones identifiers
+        return _to_duckdb_string(_ESCAPE_RE.sub(_unescape, double_quoted))
+    if identifier is not None:
+        return quote_table(identifier) if "." in identifier else f'"{identifier}"'
+    if function is not None:
+        return function.upper()
+    return _TYPE_NAMES[type_name.upper()]
+
+
+def to_duckdb_sql(query: str) -> str:
+    """
+    Rewrite the BigQuery-specific syntax of a query for DuckDB.
+
+    Covers backtick identifiers, double-quoted and raw strings, backslash
+    escapes in strings, `CURRENT_TIMESTAMP()`, `SAFE_CAST` and the
+    INT64/FLOAT64/BYTES type names. Anything else is expected to be valid in
+    both dialects.
+    """
+    return _DIALECT_RE.sub(_translate_token, query)
+
+
+def to_duckdb_type(field) -> str:
+    column_type = _COLUMN_TYPES.get(field.field_type.upper(), "VARCHAR")
+    if field.mode == "REPEATED":
+        column_type += "[]"
+    return column_type
+
+
+class QueryResult:
+    """
+    The rows of a local query, with the parts of the RowIterator API operators use.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.total_rows = len(df)
+
+    def to_dataframe(self, *args, **kwargs):
+        return self.df
+
+    def to_dataframe_iterable(self, *args, **kwargs):
+        yield self.df
+
+    def __iter__(self):
+        return iter(self.df.to_dict(orient="records"))
+
+
+class DuckdbBigqueryService(LoggerMixin):
+    def __init__(self, project_id, database: str = None, fixtures_dir: str = None):
+        """
+        Run BigqueryService operations on a local DuckDB database.
+
+        Datasets map onto DuckDB schemas and `project.dataset.table` ids onto
+        `"dataset"."table"`. Merges, SCD and deletes are run as native DuckDB
+        DML instead of the BigQuery scripts. Partition decorators are dropped,
+        so decorated writes apply to the whole table.
+
+        Args:
+                        project_id (str): The Google Cloud project ID, kept for table ids.
+                        database (str): The DuckDB database file, or `:memory:`.
+                                        Defaults to a file per project in the cache directory.
+                        fixtures_dir (str): Optional `{dataset}/{table}.{csv,parquet,json}`
+                                        tree seeding the tables that do not exist yet.
+        """
+        self.project_id = project_id
+        self.database = database or os.path.join(
+            get_cache_dir("duckdb"), f"{project_id or 'local'}.duckdb"
+        )
+        self.connection = duckdb.connect(self.database)
+        self.job_stats = get_job_stats_collector()
+        self.query_cache = None
+        if fixtures_dir is not None:
+            self.load_fixtures(fixtures_dir)
+
+    def _execute(self, query, parameters=None):
+        query = to_duckdb_sql(query)
+        self.logger.debug(f"DuckDB query: {query}")
+        result = self.connection.execute(query, parameters)
+        self.job_stats.increment_metric("duckdb_queries")
+        if result.description is None:
+            return pd.DataFrame()
+        return result.df()
+
+    def load_fixtures(self, directory: str, is_replace: bool = False):
+        """
+        Load fixture files laid out as `{dataset}/{table}.{csv,parquet,json,ndjson}`.
+
+        Args:
+                        directory (str): The fixtures directory.
+                        is_replace (bool): Replace tables that already exist.
+
+        Returns:
+                        list: The loaded table ids.
+        """
+        loaded = []
+        for dataset_id in sorted(os.listdir(directory)):
+            dataset_dir = os.path.join(directory, dataset_id)
+            if not os.path.isdir(dataset_dir):
+                continue
+            for file_name in sorted(os.listdir(dataset_dir)):
+                table_name, extension = os.path.splitext(file_name)
+                if extension not in _FIXTURE_READERS:
+                    continue
+                table_id = f"{self.project_id}.{dataset_id}.{table_name}"
+                if not is_replace and self.is_table_exists(table_id):
+                    continue
+                path = os.path.join(dataset_dir, file_name).replace("'", "''")
+                self.create_dataset(dataset_id)
+                self.connection.execute(
+                    f"CREATE OR REPLACE TABLE {quote_table(table_id)} AS "
+                    f"SELECT * FROM {_FIXTURE_READERS[extension]}('{path}')"
+                )
+                loaded.append(table_id)
+        self.logger.info(f"Loaded fixtures from {directory}: {loaded}")
+        return loaded
+
+    def _write(self, source_sql, table_id, write_disposition, schema=None):
+        """
+        Write the rows of a DuckDB SELECT into a table, creating it if needed.
+        """
+        table = quote_table(table_id)
+        self.create_dataset(table_id.split("$")[0].split(".")[-2])
+        is_table_exists = self.is_table_exists(table_id)
+        if write_disposition == "WRITE_EMPTY" and is_table_exists:
+            if self._count_rows(table_id):
+                raise ValueError(f"Table {table_id} is not empty.")
+        if write_disposition == "WRITE_TRUNCATE" or not is_table_exists:
+            if schema is None:
+                self.connection.execute(
+                    f"CREATE OR REPLACE TABLE {table} AS {source_sql}"
+                )
+                return
+            columns = ", ".join(
+                f'"{field.name}" {to_duckdb_type(field)}' for field in schema
+            )
+            self.connection.execute(f"CREATE OR REPLACE TABLE {table} ({columns})")
+        self.connection.execute(f"INSERT INTO {table} BY NAME {source_sql}")
+
+    def _write_dataframe(self, df, table_id, write_disposition, schema=None):
+        self.connection.register("_source_df", df)
+        try:
+            self._write(
+                "SELECT * FROM _source_df", table_id, write_disposition, schema=schema
+            )
+        finally:
+            self.connection.unregister("_source_df")
+
+    def _count_rows(self, table_id):
+        return self.connection.execute(
+            f"SELECT COUNT(*) FROM {quote_table(table_id)}"
+        ).fetchone()[0]
+
+    def _with_key_hash(self, df, unique_keys, schema=None):
+        if not unique_keys:
+            raise ValueError("unique_keys is required to build the key hash.")
+        df = df.assign(**{KEY_HASH_COLUMN: hash_keys(df, unique_keys)})
+        if schema is not None and KEY_HASH_COLUMN not in [f.name for f in schema]:
+            schema = list(schema) + [
+                bigquery.SchemaField(KEY_HASH_COLUMN, "INTEGER", mode="NULLABLE")
+            ]
+        return df, schema
+
+    _check_key_hash_column = BigqueryService._check_key_hash_column
+
+    def _build_on_clause(self, unique_keys, is_key_hash=False):
+        if is_key_hash:
+            return f't."{KEY_HASH_COLUMN}" = s."{KEY_HASH_COLUMN}"'
+        return " and ".join(f't."{key}" = s."{key}"' for key in unique_keys)
+
+    def insert(
+        self,
+        table_id: str,
+        df,
+        write_disposition="WRITE_TRUNCATE",
+        time_partitioning=None,
+        clustering_fields=None,
+        schema=None,
+        unique_keys=None,
+        is_key_hash: bool = False,
+    ):
+        self.logger.info(f"Start insert data to table: {table_id}")
+        if is_key_hash:
+            if write_disposition == "WRITE_APPEND":
+                self._check_key_hash_column(table_id)
+            df, schema = self._with_key_hash(df, unique_keys, schema)
+        self._write_dataframe(df, table_id, write_disposition, schema=schema)
+        self.logger.info(f"Insert data to table: {table_id} - Done")
+        return "DONE"
+
+    def append_stream(
+        self,
+        table_id: str,
+        df,
+        time_partitioning=None,
+        clustering_fields=None,
+        schema=None,
+        is_flush: bool = False,
+    ):
+        self._write_dataframe(df, table_id, "WRITE_APPEND", schema=schema)
+        self.job_stats.increment_metric("stream_rows_appended", len(df))
+
+    def _stage(self, df, destination_table, unique_keys, schema, is_key_hash):
+        staging_project_dataset_table = f"{self.project_id}.staging.{destination_table}"
+        if is_key_hash:
+            df, schema = self._with_key_hash(df, unique_keys, schema)
+        self._write_dataframe(
+            df, staging_project_dataset_table, "WRITE_TRUNCATE", schema=schema
+        )
+        return staging_project_dataset_table
+
+    def _merge_staging(
+        self,
+        destination_dataset: str,
+        destination_table: str,
+        staging_project_dataset_table: str,
+        on_clause: str,
+        touch_column: str = None,
+    ):
+        """
+        Upsert a staging table into a table, like the MERGE BigqueryService runs.
+
+        Matched rows are replaced by the staged ones and the others inserted.
+        `touch_column` of the matched rows is set to the current timestamp.
+        """
+        destination = quote_table(f"{destination_dataset}.{destination_table}")
+        staging = quote_table(staging_project_dataset_table)
+        matched = f"EXISTS (SELECT 1 FROM {destination} AS t WHERE {on_clause})"
+        statements = []
+        if touch_column is not None:
+            statements.append(
+                f'UPDATE {staging} AS s SET "{touch_column}" = CURRENT_TIMESTAMP '
+                f"WHERE {matched}"
+            )
+        statements += [
+            f"DELETE FROM {destination} AS t WHERE EXISTS "
+            f"(SELECT 1 FROM {staging} AS s WHERE {on_clause})",
+            f"INSERT INTO {destination} BY NAME SELECT * FROM {staging}",
+        ]
+        merge_dml = ";\n".join(statements)
+        self.logger.info(f"Merge DML: {merge_dml}")
+        self.connection.execute("BEGIN TRANSACTION")
+        try:
+            for statement in statements:
+                self.connection.execute(statement)
+            self.connection.execute("COMMIT")
+        except Exception:
+            self.connection.execute("ROLLBACK")
+            raise
+        return merge_dml
+
+    def merge(
+        self,
+        destination_dataset: str = None,
+        destination_table: str = None,
+        df: pd.DataFrame = None,
+        unique_keys=None,
+        schema=None,
+        is_key_hash: bool = False,
+    ):
+        self.logger.info(f"Start merge data to table: {destination_table}")
+        if is_key_hash:
+            self._check_key_hash_column(f"{destination_dataset}.{destination_table}")
+        staging_project_dataset_table = self._stage(
+            df, destination_table, unique_keys, schema, is_key_hash
+        )
+        return self._merge_staging(
+            destination_dataset,
+            destination_table,
+            staging_project_dataset_table,
+            self._build_on_clause(unique_keys, is_key_hash=is_key_hash),
+        )
+
+    def scd(
+        self,
+        destination_dataset: str = None,
+        destination_table: str = None,
+        df: pd.DataFrame = None,
+        unique_keys=None,
+        schema=None,
+        is_key_hash: bool = False,
+    ):
+        self.logger.info(f"Start merge data to table: {destination_table}")
+        if is_key_hash:
+            self._check_key_hash_column(f"{destination_dataset}.{destination_table}")
+        staging_project_dataset_table = self._stage(
+            df, destination_table, unique_keys, schema, is_key_hash
+        )
+        return self._merge_staging(
+            destination_dataset,
+            destination_table,
+            staging_project_dataset_table,
+            self._build_on_clause(unique_keys, is_key_hash=is_key_hash),
+            touch_column="_timestamp",
+        )
+
+    def merge_query(
+        self,
+        query: str,
+        destination_dataset: str = None,
+        destination_table: str = None,
+        unique_keys=None,
+    ):
+        destination_project_dataset_table = (
+            f"{self.project_id}.{destination_dataset}.{destination_table}"
+        )
+        if not self.is_table_exists(destination_project_dataset_table):
+            self.query_to_table(
+                query,
+                destination_project_dataset_table,
+                write_disposition="WRITE_APPEND",
+            )
+            return None
+        staging_project_dataset_table = f"{self.project_id}.staging.{destination_table}"
+        self.query_to_table(
+            query, staging_project_dataset_table, write_disposition="WRITE_TRUNCATE"
+        )
+        return self._merge_staging(
+            destination_dataset,
+            destination_table,
+            staging_project_dataset_table,
+            self._build_on_clause(unique_keys),
+        )
+
+    def run_query(self, query):
+        """
+        Run a SQL query and return its rows.
+
+        Returns:
+                        QueryResult: The rows, with `to_dataframe()` like a RowIterator.
+        """
+        return QueryResult(self._execute(query))
+
+    def query_to_dataframe(self, query):
+        return self._execute(query)
+
+    def query_dataframes(self, queries):
+        return [self._execute(query) for query in queries]
+
+    def iter_query_dataframes(self, query, chunk_rows=None):
+        yield self._execute(query)
+
+    def iter_query_dataframes_not_in(
+        self, query, keys_df: pd.DataFrame, unique_keys, chunk_rows=None
+    ):
+        keys_df = normalize_keys(keys_df, unique_keys).drop_duplicates()
+        if keys_df.empty:
+            yield self._execute(query)
+            return
+        self.check_anti_join_key_types(query, unique_keys)
+        self.connection.register("_anti_join_keys", keys_df)
+        try:
+            yield self._execute(
+                BigqueryService.build_anti_join_query(
+                    query, "_anti_join_keys", unique_keys
+                )
+            )
+        finally:
+            self.connection.unregister("_anti_join_keys")
+
+    def check_anti_join_key_types(self, query, unique_keys):
+        types = {
+            row[0]: row[1]
+            for row in self.connection.execute(
+                f"DESCRIBE {to_duckdb_sql(query.strip().rstrip(';'))}"
+            ).fetchall()
+        }
+        invalid = {
+            key: types.get(key)
+            for key in unique_keys
+            if types.get(key) not in ("VARCHAR", "BIGINT", "INTEGER")
+        }
+        if invalid:
+            raise ValueError(
+                f"Anti-join keys must be STRING or INT64 columns, got {invalid}; "
+                "format them as strings in the query, e.g. with FORMAT_DATE."
+            )
+
+    def query_to_table(
+        self,
+        query: str,
+        destination: str,
+        write_disposition="WRITE_TRUNCATE",
+        time_partitioning=None,
+        clustering_fields=None,
+    ):
+        self.logger.info(f"Write query results to table: {destination}")
+        self._write(to_duckdb_sql(query), destination, write_disposition)
+
+    def copy_table(
+        self, source: str, destination: str, write_disposition="WRITE_TRUNCATE"
+    ):
+        self.logger.info(f"Copy table {source} to {destination}")
+        self.query_to_table(
+            f"SELECT * FROM {quote_table(source)}",
+            destination,
+            write_disposition=write_disposition,
+        )
+
+    def read_row_hashes(self, table_id: str, unique_keys, hash_column: str):
+        select_keys = ", ".join(
+            f'CAST("{key}" AS VARCHAR) AS "{key}"' for key in unique_keys
+        )
+        return self._execute(
+            f'SELECT {select_keys}, "{hash_column}" FROM {quote_table(table_id)}'
+        )
+
+    def delete_by_keys(
+        self,
+        destination_dataset: str = None,
+        destination_table: str = None,
+        keys_df: pd.DataFrame = None,
+        unique_keys=None,
+    ):
+        staging_project_dataset_table = (
+            f"{self.project_id}.staging.{destination_table}__deleted"
+        )
+        self._write_dataframe(
+            keys_df[unique_keys].astype(str),
+            staging_project_dataset_table,
+            "WRITE_TRUNCATE",
+        )
+        on_clause = " and ".join(
+            f'CAST(t."{key}" AS VARCHAR) = s."{key}"' for key in unique_keys
+        )
+        delete_dml = (
+            f"DELETE FROM {quote_table(f'{destination_dataset}.{destination_table}')} "
+            f"AS t WHERE EXISTS (SELECT 1 FROM "
+            f"{quote_table(staging_project_dataset_table)} AS s WHERE {on_clause})"
+        )
+        self.logger.info(f"Delete DML: {delete_dml}")
+        self.connection.execute(delete_dml)
+        return delete_dml
+
+    def create_dataset(self, dataset_id, location="US"):
+        self.connection.execute(f'CREATE SCHEMA IF NOT EXISTS "{dataset_id}"')
+        return dataset_id
+
+    def list_datasets(self):
+        return [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT schema_name FROM information_schema.schemata "
+                "WHERE catalog_name = current_database() ORDER BY schema_name"
+            ).fetchall()
+        ]
+
+    def list_tables(self, dataset_id):
+        return [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT table_name FROM information_schema.tables "
+                "WHERE table_catalog = current_database() AND table_schema = ? "
+                "ORDER BY table_name",
+                [dataset_id],
+            ).fetchall()
+        ]
+
+    def delete_dataset(self, dataset_id, delete_contents=False):
+        cascade = " CASCADE" if delete_contents else ""
+        self.connection.execute(f'DROP SCHEMA IF EXISTS "{dataset_id}"{cascade}')
+
+    def load_table_from_dataframe(self, df, dataset_id, table_id):
+        self._write_dataframe(df, f"{dataset_id}.{table_id}", "WRITE_APPEND")
+
+    def get_column_names(self, table_id: str):
+        dataset_id, table_name = table_id.split("$")[0].split(".")[-2:]
+        return [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_catalog = current_database() "
+                "AND table_schema = ? AND table_name = ? ORDER BY ordinal_position",
+                [dataset_id, table_name],
+            ).fetchall()
+        ]
+
+    def check_key_types(self, table_id: str, unique_keys):
+        dataset_id, table_name = table_id.split("$")[0].split(".")[-2:]
+        types = dict(
+            self.connection.execute(
+                "SELECT column_name, data_type FROM information_schema.columns "
+                "WHERE table_catalog = current_database() "
+                "AND table_schema = ? AND table_name = ?",
+                [dataset_id, table_name],
+            ).fetchall()
+        )
+        invalid = {
+            key: types.get(key)
+            for key in unique_keys
+            if types.get(key) not in ("VARCHAR", "BIGINT", "INTEGER")
+        }
+        if invalid:
+            raise ValueError(
+                f"Keys of {table_id} must be STRING or INT64 columns to be "
+                f"matched with DataFrame keys, got {invalid}."
+            )
+
+    def get_table_type(self, table_id: str):
+        dataset_id, table_name = table_id.split("$")[0].split(".")[-2:]
+        row = self.connection.execute(
+            "SELECT table_type FROM information_schema.tables "
+            "WHERE table_catalog = current_database() "
+            "AND table_schema = ? AND table_name = ?",
+            [dataset_id, table_name],
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Table {table_id} does not exist.")
+        return "TABLE" if row[0] == "BASE TABLE" else row[0]
+
+    def add_column_if_not_exists(self, table_id: str, column: str, column_type: str):
+        column_type = _COLUMN_TYPES.get(column_type.upper(), column_type)
+        self.connection.execute(
+            f"ALTER TABLE {quote_table(table_id)} "
+            f'ADD COLUMN IF NOT EXISTS "{column}" {column_type}'
+        )
+
+    def is_table_exists(self, table_id: str):
+        dataset_id, table_name = table_id.split("$")[0].split(".")[-2:]
+        return (
+            self.connection.execute(
+                "SELECT COUNT(*) FROM information_schema.tables "
+                "WHERE table_catalog = current_database() "
+                "AND table_schema = ? AND table_name = ?",
+                [dataset_id, table_name],
+            ).fetchone()[0]
+            > 0
+        )
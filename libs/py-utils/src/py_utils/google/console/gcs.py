@@ -1,5 +1,21 @@
+import fnmatch
+import re
+from concurrent.futures import ThreadPoolExecutor
+
 from google.cloud import storage
 
+_WILDCARD_RE = re.compile(r"[*?\[]")
+
+
+def parse_gcs_uri(uri):
+    """
+    Split a `gs://bucket/path` URI into its bucket and blob name.
+    """
+    if not uri.startswith("gs://"):
+        raise ValueError(f"Invalid GCS URI: {uri}")
+    bucket_name, _, blob_name = uri[len("gs://") :].partition("/")
+    return bucket_name, blob_name
+
 
 class GCSUtil:
     def __init__(self, project_id):
@@ -85,6 +101,61 @@ class GCSUtil:
         blobs = bucket.list_blobs()
         return [blob.name for blob in blobs]
 
+    def list_blobs_matching(self, uri):
+        """
+        List the blobs matching a URI with wildcards, e.g. `gs://bucket/dt=*/*.parquet`.
+
+        Only the prefix before the first wildcard is listed server-side; the
+        rest of the pattern is matched client-side.
+
+        Args:
+            uri (str): The GCS URI, with optional `*`, `?` or `[...]` wildcards.
+
+        Returns:
+            list: A list of `(uri, generation, size)` tuples.
+        """
+        bucket_name, pattern = parse_gcs_uri(uri)
+        match = _WILDCARD_RE.search(pattern)
+        prefix = pattern[: match.start()] if match else pattern
+        blobs = self.client.list_blobs(bucket_name, prefix=prefix)
+        return [
+            (f"gs://{bucket_name}/{blob.name}", blob.generation, blob.size)
+            for blob in blobs
+            if not blob.name.endswith("/")
+            and (match is None or fnmatch.fnmatchcase(blob.name, pattern))
+        ]
+
+    def list_uris_matching(self, uris, max_workers=8):
+        """
+        List the blobs matching several wildcard URIs in parallel.
+
+        Args:
+            uris (list): The GCS URIs to expand.
+            max_workers (int): The number of concurrent list requests.
+
+        Returns:
+            list: A sorted, de-duplicated list of `(uri, generation, size)` tuples.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(self.list_blobs_matching, uris)
+        return sorted({blob for blobs in results for blob in blobs})
+
+    def read_text(self, bucket_name, blob_name):
+        """
+        Read a blob as text, or return None if it does not exist.
+        """
+        blob = self.client.bucket(bucket_name).blob(blob_name)
+        if not blob.exists():
+            return None
+        return blob.download_as_text()
+
+    def write_text(self, bucket_name, blob_name, content, content_type="text/plain"):
+        """
+        Write text content to a blob, replacing it if it exists.
+        """
+        blob = self.client.bucket(bucket_name).blob(blob_name)
+        blob.upload_from_string(content, content_type=content_type)
+
     def delete_blob(self, bucket_name, blob_name):
         """
         Delete a blob from a GCS bucket.
@@ -0,0 +1,145 @@
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from py_utils.common.logger import LoggerMixin
+
+
+class BytesBilledExceededError(Exception):
+    pass
+
+
+@dataclass
+class JobPolicy:
+    max_bytes_billed: int = None
+    is_dry_run_first: bool = False
+
+
+@dataclass
+class JobStats:
+    task_id: str
+    job_id: str
+    job_type: str
+    total_bytes_processed: int = None
+    total_bytes_billed: int = None
+    slot_millis: int = None
+    cache_hit: bool = None
+    duration_seconds: float = None
+
+
+@dataclass
+class TaskStats:
+    task_id: str
+    jobs: List[JobStats] = field(default_factory=list)
+    metrics: Dict[str, object] = field(default_factory=dict)
+
+
+class JobStatsCollector(LoggerMixin):
+    """
+    Process-wide collector of BigQuery job statistics, grouped by task.
+
+    The pipeline sets the current task and its policy before running an
+    operator; `BigqueryService` reads the policy and records every job.
+    """
+
+    DEFAULT_TASK_ID = "default"
+
+    def __init__(self):
+        self.tasks: Dict[str, TaskStats] = {}
+        self.current_task_id = self.DEFAULT_TASK_ID
+        self.policy = JobPolicy()
+
+    def start_task(self, task_id: str, policy: JobPolicy = None):
+        self.current_task_id = task_id
+        self.policy = policy or JobPolicy()
+        self.tasks.setdefault(task_id, TaskStats(task_id=task_id))
+
+    def end_task(self):
+        self.current_task_id = self.DEFAULT_TASK_ID
+        self.policy = JobPolicy()
+
+    def _current_task(self) -> TaskStats:
+        return self.tasks.setdefault(
+            self.current_task_id, TaskStats(task_id=self.current_task_id)
+        )
+
+    def check_estimate(self, estimated_bytes: int):
+        """
+        Raise when a dry-run estimate exceeds the task budget.
+        """
+        max_bytes_billed = self.policy.max_bytes_billed
+        self.logger.info(
+            f"Dry run estimate: {estimated_bytes} bytes - budget: {max_bytes_billed}"
+        )
+        if max_bytes_billed is not None and estimated_bytes > max_bytes_billed:
+            raise BytesBilledExceededError(
+                f"Query would process {estimated_bytes} bytes, over the budget of "
+                f"{max_bytes_billed} bytes for task {self.current_task_id}"
+            )
+
+    def record(self, job) -> JobStats:
+        """
+        Record the statistics of a finished BigQuery job.
+        """
+        duration = None
+        if job.started is not None and job.ended is not None:
+            duration = (job.ended - job.started).total_seconds()
+        stats = JobStats(
+            task_id=self.current_task_id,
+            job_id=job.job_id,
+            job_type=job.job_type,
+            total_bytes_processed=getattr(job, "total_bytes_processed", None),
+            total_bytes_billed=getattr(job, "total_bytes_billed", None),
+            slot_millis=getattr(job, "slot_millis", None),
+            cache_hit=getattr(job, "cache_hit", None),
+            duration_seconds=duration,
+        )
+        self._current_task().jobs.append(stats)
+        self.logger.info(f"Job stats: {stats}")
+        return stats
+
+    def record_metric(self, name: str, value):
+        self._current_task().metrics[name] = value
+
+    def increment_metric(self, name: str, value=1):
+        metrics = self._current_task().metrics
+        metrics[name] = metrics.get(name, 0) + value
+
+    def summary(self) -> List[dict]:
+        rows = []
+        for task in self.tasks.values():
+            rows.append(
+                {
+                    "task_id": task.task_id,
+                    "jobs": len(task.jobs),
+                    "bytes_processed": sum(
+                        j.total_bytes_processed or 0 for j in task.jobs
+                    ),
+                    "bytes_billed": sum(j.total_bytes_billed or 0 for j in task.jobs),
+                    "slot_millis": sum(j.slot_millis or 0 for j in task.jobs),
+                    "cache_hits": sum(1 for j in task.jobs if j.cache_hit),
+                    "duration_seconds": round(
+                        sum(j.duration_seconds or 0 for j in task.jobs), 3
+                    ),
+                    **task.metrics,
+                }
+            )
+        return rows
+
+    def log_summary(self):
+        rows = self.summary()
+        if not rows:
+            return
+        self.logger.info("BigQuery job summary:")
+        for row in rows:
+            self.logger.info(" | ".join(f"{k}={v}" for k, v in row.items()))
+
+    def reset(self):
+        self.tasks = {}
+        self.end_task()
+
+
+_collector = JobStatsCollector()
+
+
+def get_job_stats_collector() -> JobStatsCollector:
+    return _collector
@@ -0,0 +1,234 @@
+import atexit
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+from google.api_core import exceptions
+from google.cloud import bigquery_storage_v1
+from google.cloud.bigquery_storage_v1 import types, writer
+
+from py_utils.common.logger import LoggerMixin
+
+
+class StreamWriter(LoggerMixin):
+    """
+    Buffered appender over one COMMITTED Storage Write API stream.
+
+    Rows are sent as Arrow record batches with explicit offsets, so a batch
+    resent after a connection failure is acknowledged with ALREADY_EXISTS
+    instead of being written twice.
+
+    Args:
+        write_client (BigQueryWriteClient): The Storage Write API client.
+        table_path (str): `projects/{project}/datasets/{dataset}/tables/{table}`.
+        columns (list): Destination column order. Defaults to the DataFrame's.
+        flush_rows (int): Flush once this many rows are buffered.
+        flush_interval_seconds (float): Flush buffered rows at least this often.
+        max_retries (int): Resend attempts of a batch after a failure.
+    """
+
+    def __init__(
+        self,
+        write_client,
+        table_path: str,
+        columns: list = None,
+        flush_rows: int = 500,
+        flush_interval_seconds: float = 1.0,
+        max_retries: int = 3,
+    ):
+        self.write_client = write_client
+        self.table_path = table_path
+        self.columns = columns
+        self.flush_rows = flush_rows
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_retries = max_retries
+        self.buffer = []
+        self.buffered_rows = 0
+        self.offset = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.RLock()
+        self.write_stream = self.write_client.create_write_stream(
+            parent=self.table_path,
+            write_stream=types.WriteStream(type_=types.WriteStream.Type.COMMITTED),
+        )
+        self.append_rows_stream = None
+        self.arrow_schema = None
+        self.stopped = threading.Event()
+        self.flush_error = None
+        self.flusher = None
+        self._start_flusher()
+        self.logger.info(f"Opened write stream: {self.write_stream.name}")
+
+    def _start_flusher(self):
+        self.flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self.flusher.start()
+
+    def _open(self, arrow_schema: pa.Schema):
+        template = types.AppendRowsRequest(
+            write_stream=self.write_stream.name,
+            arrow_rows=types.AppendRowsRequest.ArrowData(
+                writer_schema=types.ArrowSchema(
+                    serialized_schema=arrow_schema.serialize().to_pybytes()
+                )
+            ),
+        )
+        self.append_rows_stream = writer.AppendRowsStream(self.write_client, template)
+        self.arrow_schema = arrow_schema
+
+    def _close_connection(self):
+        if self.append_rows_stream is not None:
+            try:
+                self.append_rows_stream.close()
+            except Exception as e:
+                self.logger.warning(f"Failed to close append stream: {e}")
+            self.append_rows_stream = None
+
+    def _send(self, batch: pa.RecordBatch):
+        request = types.AppendRowsRequest(
+            offset=self.offset,
+            arrow_rows=types.AppendRowsRequest.ArrowData(
+                rows=types.ArrowRecordBatch(
+                    serialized_record_batch=batch.serialize().to_pybytes()
+                )
+            ),
+        )
+        if self.arrow_schema is not None and not batch.schema.equals(
+            self.arrow_schema
+        ):
+            # the writer schema is fixed per connection
+            self._close_connection()
+        for attempt in range(self.max_retries + 1):
+            if self.append_rows_stream is None:
+                self._open(batch.schema)
+            try:
+                self.append_rows_stream.send(request).result()
+                break
+            except exceptions.AlreadyExists:
+                self.logger.info(f"Rows at offset {self.offset} already committed")
+                break
+            except Exception as e:
+                self._close_connection()
+                if attempt == self.max_retries:
+                    raise
+                self.logger.warning(f"Append at offset {self.offset} failed: {e}")
+                time.sleep(2**attempt)
+        self.offset += batch.num_rows
+
+    def _raise_flush_error(self):
+        # a failed periodic flush surfaces in the caller's thread
+        if self.flush_error is not None:
+            error, self.flush_error = self.flush_error, None
+            if not self.stopped.is_set():
+                self._start_flusher()
+            raise error
+
+    def append(self, df: pd.DataFrame):
+        if self.columns is not None:
+            df = df[[column for column in self.columns if column in df.columns]]
+        with self.lock:
+            self._raise_flush_error()
+            self.buffer.append(df)
+            self.buffered_rows += len(df)
+            if self.buffered_rows >= self.flush_rows:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.buffer:
+                return
+            df = pd.concat(self.buffer, ignore_index=True)
+            for start in range(0, len(df), self.flush_rows):
+                end = start + self.flush_rows
+                self._send(
+                    pa.RecordBatch.from_pandas(
+                        df.iloc[start:end], preserve_index=False
+                    )
+                )
+                # acknowledged rows leave the buffer at once, so a later flush
+                # after a failure resends only the rows the offset has not seen
+                self.buffer = [df.iloc[end:]]
+                self.buffered_rows = max(0, len(df) - end)
+            self.logger.info(f"Flushed {len(df)} rows to {self.table_path}")
+            self.buffer = []
+            self.buffered_rows = 0
+
+    def _flush_periodically(self):
+        while not self.stopped.wait(self.flush_interval_seconds):
+            if time.monotonic() - self.last_flush < self.flush_interval_seconds:
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error(f"Periodic flush to {self.table_path} failed: {e}")
+                self.flush_error = e
+                return
+
+    def close(self):
+        self.stopped.set()
+        self.flusher.join()
+        self._raise_flush_error()
+        self.flush()
+        self._close_connection()
+        self.write_client.finalize_write_stream(name=self.write_stream.name)
+        self.logger.info(
+            f"Closed write stream {self.write_stream.name} after {self.offset} rows"
+        )
+
+
+class StreamWriterPool(LoggerMixin):
+    """
+    Process-wide pool keeping one StreamWriter per destination table.
+    """
+
+    def __init__(self, flush_rows: int = 500, flush_interval_seconds: float = 1.0):
+        self.flush_rows = flush_rows
+        self.flush_interval_seconds = flush_interval_seconds
+        self.write_client = None
+        self.writers = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def table_path(table_id: str) -> str:
+        project_id, dataset_id, table_name = table_id.split(".")
+        return f"projects/{project_id}/datasets/{dataset_id}/tables/{table_name}"
+
+    def get_writer(self, table_id: str, columns: list = None) -> StreamWriter:
+        with self.lock:
+            if table_id not in self.writers:
+                if self.write_client is None:
+                    self.write_client = bigquery_storage_v1.BigQueryWriteClient()
+                self.writers[table_id] = StreamWriter(
+                    self.write_client,
+                    self.table_path(table_id),
+                    columns=columns,
+                    flush_rows=self.flush_rows,
+                    flush_interval_seconds=self.flush_interval_seconds,
+                )
+            return self.writers[table_id]
+
+    def flush_all(self):
+        for stream_writer in list(self.writers.values()):
+            stream_writer.flush()
+
+    def close_all(self):
+        with self.lock:
+            for stream_writer in self.writers.values():
+                stream_writer.close()
+            self.writers = {}
+
+
+_pool = None
+
+
+def get_stream_writer_pool(
+    flush_rows: int = 500, flush_interval_seconds: float = 1.0
+) -> StreamWriterPool:
+    global _pool
+    if _pool is None:
+        _pool = StreamWriterPool(
+            flush_rows=flush_rows, flush_interval_seconds=flush_interval_seconds
+        )
+        atexit.register(_pool.close_all)
+    return _pool
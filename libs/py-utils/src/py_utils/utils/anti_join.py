@@ -0,0 +1,190 @@
+import os
+import shutil
+import tempfile
+from typing import Iterator, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from py_utils.common.logger import LoggerMixin
+from py_utils.utils.dataframe import hash_normalized_keys
+from py_utils.utils.path import get_cache_dir
+
+
+class AntiJoinConfig:
+    # the key hashes of one group of partitions must fit in this budget
+    MEMORY_BUDGET_BYTES = int(
+        os.environ.get("ANTI_JOIN_MEMORY_BUDGET_BYTES", 256 * 1024 * 1024)
+    )
+    NUM_PARTITIONS = int(os.environ.get("ANTI_JOIN_NUM_PARTITIONS", 64))
+    SPILL_DIR = os.environ.get("ANTI_JOIN_SPILL_DIR")
+
+
+class OutOfCoreAntiJoin(LoggerMixin):
+    """
+    Anti-join larger than memory: the rows of `left` whose key is not in `right`.
+
+    Both sides are added in chunks and spilled to local files. Left rows go
+    in arrival order to an Arrow IPC stream, and the key hashes of both sides
+    are hash-partitioned into raw int64 files. The join then loads the
+    partitions group by group under `memory_budget_bytes`, marks the new left
+    rows in a bitmap, and streams them back in their original order.
+
+    Keys are compared as `hash_normalized_keys` hashes, like the in-memory
+    `anti_join`, so typed keys match sheet strings.
+
+    Args:
+        keys (list): The key columns, present on both sides.
+        memory_budget_bytes (int): The memory available to one join step.
+        num_partitions (int): The number of hash partitions of the keys.
+        spill_dir (str): The directory of the spill files, removed on close.
+    """
+
+    def __init__(
+        self,
+        keys: List[str],
+        memory_budget_bytes: int = None,
+        num_partitions: int = None,
+        spill_dir: str = None,
+    ):
+        self.keys = list(keys)
+        self.memory_budget_bytes = (
+            memory_budget_bytes or AntiJoinConfig.MEMORY_BUDGET_BYTES
+        )
+        self.num_partitions = num_partitions or AntiJoinConfig.NUM_PARTITIONS
+        self.spill_dir = tempfile.mkdtemp(
+            prefix="anti_join_",
+            dir=spill_dir or AntiJoinConfig.SPILL_DIR or get_cache_dir("spill"),
+        )
+        self.num_left_rows = 0
+        self.num_right_rows = 0
+        self.left_schema = None
+        self.left_sink = None
+        self.left_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._close_left_writer()
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def _close_left_writer(self):
+        if self.left_writer is not None:
+            self.left_writer.close()
+            self.left_sink.close()
+            self.left_writer = None
+
+    def _partition_path(self, side, partition):
+        return os.path.join(self.spill_dir, f"{side}_{partition:04d}.bin")
+
+    def _spill_partitions(self, side, hashes, records):
+        partitions = (hashes.view("uint64") % np.uint64(self.num_partitions)).astype(
+            "int64"
+        )
+        # rows are grouped by partition with one stable sort, then split
+        order = np.argsort(partitions, kind="stable")
+        counts = np.bincount(partitions, minlength=self.num_partitions)
+        for partition, chunk in enumerate(np.split(records[order], np.cumsum(counts))):
+            if len(chunk):
+                with open(self._partition_path(side, partition), "ab") as file:
+                    chunk.tofile(file)
+
+    def add_right(self, df: pd.DataFrame):
+        """Add a chunk of the rows whose keys are excluded."""
+        if df.empty:
+            return
+        hashes = hash_normalized_keys(df, self.keys).to_numpy()
+        self._spill_partitions("right", hashes, hashes)
+        self.num_right_rows += len(df)
+
+    def add_left(self, df: pd.DataFrame):
+        """Add a chunk of the rows to filter, in output order."""
+        if df.empty:
+            return
+        hashes = hash_normalized_keys(df, self.keys).to_numpy()
+        row_ids = np.arange(
+            self.num_left_rows, self.num_left_rows + len(df), dtype="int64"
+        )
+        self._spill_partitions("left", hashes, np.column_stack([row_ids, hashes]))
+        table = pa.Table.from_pandas(
+            df, schema=self.left_schema, preserve_index=False
+        )
+        if self.left_writer is None:
+            self.left_schema = table.schema
+            self.left_sink = pa.OSFile(os.path.join(self.spill_dir, "left.arrow"), "wb")
+            self.left_writer = pa.ipc.new_stream(self.left_sink, self.left_schema)
+        self.left_writer.write_table(table)
+        self.num_left_rows += len(df)
+
+    def _partition_groups(self):
+        """Group adjacent partitions whose key hashes fit in the memory budget."""
+        group, group_bytes = [], 0
+        for partition in range(self.num_partitions):
+            partition_bytes = sum(
+                os.path.getsize(path)
+                for path in (
+                    self._partition_path("left", partition),
+                    self._partition_path("right", partition),
+                )
+                if os.path.exists(path)
+            )
+            if group and group_bytes + partition_bytes > self.memory_budget_bytes:
+                yield group
+                group, group_bytes = [], 0
+            group.append(partition)
+            group_bytes += partition_bytes
+        if group:
+            yield group
+
+    def _read_partitions(self, side, partitions, width):
+        arrays = [
+            np.fromfile(self._partition_path(side, partition), dtype="int64")
+            for partition in partitions
+            if os.path.exists(self._partition_path(side, partition))
+        ]
+        if not arrays:
+            return np.empty((0, width), dtype="int64")
+        return np.concatenate(arrays).reshape(-1, width)
+
+    def _is_new(self) -> np.ndarray:
+        is_new = np.zeros(self.num_left_rows, dtype=bool)
+        for partitions in self._partition_groups():
+            left = self._read_partitions("left", partitions, 2)
+            right = self._read_partitions("right", partitions, 1)
+            is_new[left[:, 0]] = ~np.isin(left[:, 1], right[:, 0])
+        return is_new
+
+    def iter_left_only(self, chunk_rows: int = 100000) -> Iterator[pd.DataFrame]:
+        """
+        Stream the left rows whose key is not in the right rows.
+
+        Args:
+            chunk_rows (int): The approximate number of rows of every chunk.
+        """
+        self._close_left_writer()
+        if self.num_left_rows == 0:
+            return
+        is_new = self._is_new()
+        self.logger.info(
+            f"Anti-join kept {int(is_new.sum())} of {self.num_left_rows} rows "
+            f"against {self.num_right_rows} keys"
+        )
+        offset = 0
+        batches, num_rows = [], 0
+        with pa.OSFile(os.path.join(self.spill_dir, "left.arrow"), "rb") as source:
+            for batch in pa.ipc.open_stream(source):
+                mask = is_new[offset : offset + batch.num_rows]
+                offset += batch.num_rows
+                if mask.any():
+                    batches.append(batch.filter(pa.array(mask)))
+                    num_rows += batches[-1].num_rows
+                if num_rows >= chunk_rows:
+                    yield pa.Table.from_batches(batches).to_pandas()
+                    batches, num_rows = [], 0
+        if batches:
+            yield pa.Table.from_batches(batches).to_pandas()
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import time
+
+import pandas as pd
+
+from py_utils.common.logger import LoggerMixin
+
+
+def make_cache_key(*parts) -> str:
+    """
+    Build a stable file-name safe cache key from any number of parts.
+
+    :param parts: Values identifying the cached entry; they are joined as strings.
+    :return: A hex sha256 digest.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class ParquetCache(LoggerMixin):
+    """
+    On-disk cache of DataFrames stored as Parquet files.
+
+    Entries older than `ttl_seconds` are ignored and removed. When the directory
+    grows over `max_bytes`, the least recently read entries are evicted first.
+
+    Args:
+        directory (str): Directory holding the cache files.
+        max_bytes (int): Maximum total size of the cache. None means unbounded.
+        ttl_seconds (float): Maximum age of an entry. None means no expiry.
+    """
+
+    SUFFIX = ".parquet"
+
+    def __init__(self, directory: str, max_bytes: int = None, ttl_seconds=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.SUFFIX}")
+
+    def _is_expired(self, path: str) -> bool:
+        if self.ttl_seconds is None:
+            return False
+        return time.time() - os.path.getmtime(path) > self.ttl_seconds
+
+    def get(self, key: str):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        if self._is_expired(path):
+            self.logger.info(f"Cache entry expired: {key}")
+            os.remove(path)
+            return None
+        try:
+            df = pd.read_parquet(path)
+        except Exception as e:
+            self.logger.warning(f"Failed to read cache entry {key}: {e}")
+            os.remove(path)
+            return None
+        # record the read time for LRU eviction, keeping mtime for the TTL
+        os.utime(path, (time.time(), os.path.getmtime(path)))
+        return df
+
+    def put(self, key: str, df: pd.DataFrame) -> bool:
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            df.to_parquet(tmp_path, index=False)
+        except Exception as e:
+            self.logger.warning(f"Failed to write cache entry {key}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, path)
+        self.evict()
+        return True
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            if self._is_expired(path):
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_atime, stat.st_size, path))
+        if self.max_bytes is None:
+            return
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            os.remove(path)
+            total_bytes -= size
+            self.logger.info(f"Evicted cache entry: {path}")
@@ -0,0 +1,158 @@
+import os
+from dataclasses import dataclass
+from typing import List
+
+import pandas as pd
+
+from py_utils.common.logger import LoggerMixin
+from py_utils.utils.dataframe import hash_rows, normalize_keys
+from py_utils.utils.path import get_cache_dir
+
+ROW_HASH_COLUMN = "_row_hash"
+
+
+@dataclass
+class ChangeSet:
+    upserts: pd.DataFrame
+    deleted_keys: pd.DataFrame
+    snapshot: pd.DataFrame
+    inserted: int
+    updated: int
+    unchanged: int
+
+    @property
+    def deleted(self):
+        return len(self.deleted_keys)
+
+    @property
+    def is_empty(self):
+        return self.upserts.empty and self.deleted_keys.empty
+
+
+class ChangeDetector(LoggerMixin):
+    """
+    Detect inserted, updated and deleted rows between two loads of a table.
+
+    Every row is reduced to a ``{key: hash}`` pair where the hash covers the
+    non-key columns. Keys are rendered with `normalize_keys`, so they compare
+    with the STRING keys `read_row_hashes` returns for STRING and INT64
+    columns. The previous snapshot is either persisted locally as
+    Parquet or read from a ``_row_hash`` column in the target table.
+
+    Args:
+        unique_keys (list): Columns identifying a row.
+        snapshot_name (str): Name of the local snapshot, usually the table id.
+        exclude_columns (list): Columns ignored by the content hash.
+        cache_dir (str): Directory holding local snapshots.
+    """
+
+    def __init__(
+        self,
+        unique_keys: List[str],
+        snapshot_name: str = None,
+        exclude_columns: List[str] = None,
+        cache_dir: str = None,
+    ):
+        if not unique_keys:
+            raise ValueError("Change detection requires unique_keys.")
+        self.unique_keys = list(unique_keys)
+        self.snapshot_name = snapshot_name
+        self.exclude_columns = set(exclude_columns or []) | {ROW_HASH_COLUMN}
+        self.cache_dir = cache_dir or get_cache_dir("change_detection")
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.cache_dir, f"{self.snapshot_name}.parquet")
+
+    def _value_columns(self, df):
+        return [
+            column
+            for column in df.columns
+            if column not in self.unique_keys and column not in self.exclude_columns
+        ]
+
+    def compute_row_hashes(self, df: pd.DataFrame) -> pd.Series:
+        return hash_rows(df, self._value_columns(df))
+
+    def compute_snapshot(self, df: pd.DataFrame) -> pd.DataFrame:
+        snapshot = normalize_keys(df, self.unique_keys)
+        snapshot[ROW_HASH_COLUMN] = self.compute_row_hashes(df)
+        return snapshot.reset_index(drop=True)
+
+    def load_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            self.logger.info(f"No snapshot found at {self.snapshot_path}")
+            return None
+        return pd.read_parquet(self.snapshot_path)
+
+    def save_snapshot(self, snapshot: pd.DataFrame):
+        tmp_path = f"{self.snapshot_path}.tmp"
+        snapshot.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.snapshot_path)
+        self.logger.info(f"Saved snapshot of {len(snapshot)} keys to {self.snapshot_path}")
+
+    def detect(self, df: pd.DataFrame, previous: pd.DataFrame = None) -> ChangeSet:
+        """
+        Compare a DataFrame with the previous snapshot.
+
+        Args:
+            df (pandas.DataFrame): The full current data.
+            previous (pandas.DataFrame): Key columns plus ``_row_hash``. When
+                None the local snapshot is used.
+
+        Returns:
+            ChangeSet: Rows to upsert, keys to delete and the new snapshot.
+        """
+        snapshot = self.compute_snapshot(df)
+        if previous is None:
+            previous = self.load_snapshot()
+        if previous is None or previous.empty:
+            return ChangeSet(
+                upserts=df,
+                deleted_keys=snapshot.iloc[0:0][self.unique_keys],
+                snapshot=snapshot,
+                inserted=len(df),
+                updated=0,
+                unchanged=0,
+            )
+
+        current_index = pd.MultiIndex.from_frame(snapshot[self.unique_keys])
+        previous = normalize_keys(previous, self.unique_keys).assign(
+            **{ROW_HASH_COLUMN: previous[ROW_HASH_COLUMN]}
+        )
+        previous_index = pd.MultiIndex.from_frame(previous[self.unique_keys])
+        # rows written before the hash column existed have a null hash and
+        # always count as changed
+        previous_hashes = pd.Series(
+            previous[ROW_HASH_COLUMN].astype("Int64").fillna(0).to_numpy("int64"),
+            index=previous_index,
+        )
+        has_hash = pd.Series(
+            previous[ROW_HASH_COLUMN].notna().to_numpy(), index=previous_index
+        )
+        is_first = ~previous_hashes.index.duplicated(keep="last")
+        previous_hashes = previous_hashes[is_first]
+        has_hash = has_hash[is_first]
+
+        is_known = current_index.isin(previous_hashes.index)
+        matched_hashes = previous_hashes.reindex(current_index[is_known]).to_numpy()
+        matched_has_hash = has_hash.reindex(current_index[is_known]).to_numpy(bool)
+        is_changed = ~is_known
+        is_changed[is_known] = (
+            matched_hashes != snapshot[ROW_HASH_COLUMN].to_numpy()[is_known]
+        ) | ~matched_has_hash
+        is_deleted = ~previous_hashes.index.isin(current_index)
+
+        change_set = ChangeSet(
+            upserts=df[is_changed].copy(),
+            deleted_keys=previous_hashes.index[is_deleted].to_frame(index=False),
+            snapshot=snapshot,
+            inserted=int((~is_known).sum()),
+            updated=int((is_changed & is_known).sum()),
+            unchanged=int((~is_changed).sum()),
+        )
+        self.logger.info(
+            f"Change detection: inserted={change_set.inserted} updated={change_set.updated} "
+            f"deleted={change_set.deleted} unchanged={change_set.unchanged}"
+        )
+        return change_set
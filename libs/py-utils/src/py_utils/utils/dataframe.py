@@ -0,0 +1,367 @@
+import math
+import numbers
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+
+def hash_rows(df: pd.DataFrame, columns: List[str] = None) -> pd.Series:
+    """
+    Compute a vectorized 64-bit content hash for every row of a DataFrame.
+
+    The hash is deterministic across processes, so it can be persisted and
+    compared between runs. It is returned as ``int64`` so that it can be stored
+    in an INTEGER column in BigQuery.
+
+    :param df: The DataFrame to hash.
+    :param columns: Columns to include in the hash. Defaults to all columns.
+    :return: A Series of ``int64`` hashes aligned with ``df.index``.
+    """
+    if columns is not None:
+        df = df[list(columns)]
+    if len(df.columns) == 0:
+        return pd.Series(np.zeros(len(df), dtype="int64"), index=df.index)
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    return pd.Series(hashes.to_numpy().view("int64"), index=df.index)
+
+
+def stringify_keys(df: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    """
+    Return the key columns of a DataFrame cast to strings.
+
+    Keys read from a sheet, from a local snapshot or from BigQuery can carry
+    different dtypes for the same value, so they are compared as strings.
+
+    :param df: The DataFrame holding the key columns.
+    :param keys: The key column names.
+    :return: A new DataFrame with only the key columns, as strings.
+    """
+    return df[list(keys)].astype(str)
+
+
+def hash_keys(df: pd.DataFrame, keys: List[str]) -> pd.Series:
+    """
+    Compute a vectorized 64-bit surrogate key over one or more key columns.
+
+    Keys are hashed as strings, so the same key value yields the same hash
+    whatever dtype it was read with.
+
+    :param df: The DataFrame holding the key columns.
+    :param keys: The key column names.
+    :return: A Series of ``int64`` hashes aligned with ``df.index``.
+    """
+    return hash_rows(stringify_keys(df, keys))
+
+
+def normalize_cell(value) -> str:
+    """
+    Render a cell value as a canonical string.
+
+    Unformatted sheet values and DataFrame values map onto the same string:
+    `1`, `1.0` and `np.int64(1)` become `1`, booleans `TRUE`/`FALSE` and
+    blanks, None and NaN an empty string.
+
+    :param value: A scalar cell value.
+    :return: The canonical string.
+    """
+    if value is None or value is pd.NA or value is pd.NaT:
+        return ""
+    if isinstance(value, (bool, np.bool_)):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if math.isnan(value):
+            return ""
+        return str(int(value)) if value.is_integer() else repr(value)
+    return str(value)
+
+
+def normalize_keys(df: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    """
+    Return the key columns of a DataFrame rendered with `normalize_cell`.
+
+    Formatted sheet strings and typed values of the same key compare equal,
+    e.g. `"1"` and `1.0`, or a blank cell and None.
+
+    :param df: The DataFrame holding the key columns.
+    :param keys: The key column names.
+    :return: A new DataFrame with only the key columns, as strings.
+    """
+    return df[list(keys)].apply(lambda column: column.map(normalize_cell))
+
+
+def hash_normalized_keys(df: pd.DataFrame, keys: List[str]) -> pd.Series:
+    """
+    Hash the key columns of a DataFrame rendered with `normalize_keys`.
+
+    Used to diff typed rows against sheet rows: a NULL key and a blank cell,
+    or `1.0` and `"1"`, get the same hash.
+
+    :param df: The DataFrame holding the key columns.
+    :param keys: The key column names.
+    :return: A Series of ``int64`` hashes aligned with ``df.index``.
+    """
+    return hash_rows(normalize_keys(df, keys))
+
+
+# Google Sheets day serials count from 1899-12-30
+SHEET_EPOCH = pd.Timestamp("1899-12-30")
+
+DEFAULT_DATETIME_FORMATS = {
+    "TIMESTAMP": "%Y-%m-%d %H:%M:%S",
+    "DATETIME": "%Y-%m-%d %H:%M:%S",
+    "DATE": "%d-%m-%Y",
+}
+
+_TRUE_VALUES = {"true", "1", "yes", "y"}
+_FALSE_VALUES = {"false", "0", "no", "n"}
+
+
+def _coerce_datetime(column: pd.Series, field_format: str) -> pd.Series:
+    numbers = pd.to_numeric(column, errors="coerce")
+    is_serial = numbers.notna() & column.map(
+        lambda value: not isinstance(value, str)
+    ).astype(bool)
+    parsed = pd.to_datetime(
+        column.where(~is_serial).astype("string"), format=field_format, errors="coerce"
+    )
+    serials = SHEET_EPOCH + pd.to_timedelta(numbers.where(is_serial), unit="D")
+    return parsed.where(~is_serial, serials)
+
+
+def _coerce_boolean(column: pd.Series) -> pd.Series:
+    text = column.astype("string").str.strip().str.lower()
+    return pd.Series(
+        np.where(text.isin(_TRUE_VALUES), True, None), index=column.index
+    ).where(~text.isin(_FALSE_VALUES), False)
+
+
+_INT64_MAX = str(2**63 - 1)
+
+
+def _coerce_integer(column: pd.Series) -> pd.Series:
+    text = column.astype("string").fillna("").str.strip().str.lstrip("+")
+    digits = text.str.replace(r"\.0*$", "", regex=True)
+    magnitude = digits.str.lstrip("-").str.lstrip("0")
+    is_integral = (
+        text.str.fullmatch(r"-?\d+(?:\.0*)?")
+        & (
+            (magnitude.str.len() < 19)
+            | ((magnitude.str.len() == 19) & (magnitude <= _INT64_MAX))
+        )
+    ).to_numpy(bool)
+    # integral text is cast by Arrow, never through float64, which rounds
+    # integers above 2**53
+    integers = (
+        digits.where(is_integral).astype("string[pyarrow]").astype("int64[pyarrow]")
+    )
+    # other spellings, e.g. 1e3; non-integral numbers are failures, not truncated
+    numbers = pd.to_numeric(text.where(~is_integral), errors="coerce")
+    is_exact = (numbers.round() == numbers) & (numbers.abs() < 2**63)
+    return integers.fillna(numbers.where(is_exact).astype("int64[pyarrow]"))
+
+
+def _coerce_float(column: pd.Series) -> pd.Series:
+    return pd.to_numeric(column, errors="coerce")
+
+
+_COERCIONS = {
+    "INTEGER": (_coerce_integer, "int64[pyarrow]"),
+    "INT64": (_coerce_integer, "int64[pyarrow]"),
+    "FLOAT": (_coerce_float, "double[pyarrow]"),
+    "FLOAT64": (_coerce_float, "double[pyarrow]"),
+    "NUMERIC": (_coerce_float, "double[pyarrow]"),
+    "BOOLEAN": (_coerce_boolean, "bool[pyarrow]"),
+    "BOOL": (_coerce_boolean, "bool[pyarrow]"),
+    "TIMESTAMP": (None, "timestamp[us][pyarrow]"),
+    "DATETIME": (None, "timestamp[us][pyarrow]"),
+    "DATE": (None, "date32[pyarrow]"),
+}
+
+SUPPORTED_SCHEMA_TYPES = {"STRING", *_COERCIONS}
+
+
+def coerce_to_schema(df: pd.DataFrame, schema: List[dict]):
+    """
+    Convert the columns of a DataFrame to Arrow-backed types from a schema.
+
+    Values may be the formatted strings or the unformatted values of a sheet;
+    dates may be day serials. Every column is converted in one vectorized pass
+    and values that cannot be converted become null. Columns that already have
+    their Arrow type are kept, so converting twice is harmless.
+
+    :param df: The DataFrame to convert.
+    :param schema: A list of `{field, type}` dicts, with an optional `format`
+        for TIMESTAMP, DATETIME and DATE fields.
+    :return: The converted DataFrame and a `{field: failed_count}` dict.
+    """
+    columns = {}
+    failures = {}
+    for field in schema:
+        name, field_type = field["field"], field["type"].upper()
+        if name not in df.columns:
+            continue
+        column = df[name]
+        if field_type == "STRING":
+            coerce, dtype = None, "string[pyarrow]"
+        elif field_type in _COERCIONS:
+            coerce, dtype = _COERCIONS[field_type]
+        else:
+            continue
+        if column.dtype == dtype:
+            # already converted, e.g. before a snapshot was cached
+            continue
+        if field_type == "STRING":
+            columns[name] = column.where(
+                column.isna(), column.astype(str)
+            ).astype(dtype)
+            continue
+        if coerce is None:
+            converted = _coerce_datetime(
+                column, field.get("format", DEFAULT_DATETIME_FORMATS[field_type])
+            )
+        else:
+            converted = coerce(column)
+        is_blank = column.isna() | (column.astype("string").str.strip() == "")
+        is_failed = converted.isna() & ~is_blank
+        if is_failed.any():
+            failures[name] = int(is_failed.sum())
+        columns[name] = converted.where(~is_failed).astype(dtype)
+    return df.assign(**columns), failures
+
+
+def _is_key_in(left: pd.DataFrame, right: pd.DataFrame, keys: List[str]) -> np.ndarray:
+    """
+    Return a mask of the rows of `left` whose key is also in `right`.
+
+    An empty `right`, even one without columns, matches no row. Otherwise a
+    key column missing on either side is an error, not an empty match.
+    """
+    sides = [("left", left)] if right.empty else [("left", left), ("right", right)]
+    for side, df in sides:
+        missing = [key for key in keys if key not in df.columns]
+        if missing:
+            raise ValueError(f"Key columns {missing} are missing from {side}.")
+    if right.empty:
+        return np.zeros(len(left), dtype=bool)
+    return np.isin(
+        hash_normalized_keys(left, keys).to_numpy(),
+        hash_normalized_keys(right, keys).to_numpy(),
+    )
+
+
+def anti_join(
+    left: pd.DataFrame, right: pd.DataFrame, keys: List[str]
+) -> pd.DataFrame:
+    """
+    Return the rows of `left` whose key is not in `right`.
+
+    Keys are compared as 64-bit hashes of their `normalize_keys` values, so
+    typed keys match sheet strings and no merge is done: the result keeps the columns and dtypes of `left`, without
+    `_x`/`_y` suffixes.
+
+    :param left: The rows to filter.
+    :param right: The rows whose keys are excluded.
+    :param keys: The key columns, present in both DataFrames.
+    :return: The rows of `left` not in `right`, in their original order.
+    """
+    return left[~_is_key_in(left, right, keys)]
+
+
+def semi_join(
+    left: pd.DataFrame, right: pd.DataFrame, keys: List[str]
+) -> pd.DataFrame:
+    """
+    Return the rows of `left` whose key is in `right`.
+
+    :param left: The rows to filter.
+    :param right: The rows whose keys are kept.
+    :param keys: The key columns, present in both DataFrames.
+    :return: The rows of `left` also in `right`, in their original order.
+    """
+    return left[_is_key_in(left, right, keys)]
+
+
+def get_diff_rows_left_keep_all(
+    left: pd.DataFrame,
+    right: pd.DataFrame,
+    headers: List[str] = None,
+    on: List[str] = None,
+) -> pd.DataFrame:
+    """
+    Return the rows of `left` missing from `right`, with all their columns.
+
+    :param left: The source rows.
+    :param right: The rows already written.
+    :param headers: The columns to return. Defaults to all columns of `left`.
+    :param on: The key columns. Defaults to `headers`, comparing whole rows.
+    :return: The missing rows, with a fresh index.
+    """
+    headers = list(headers) if headers is not None else list(left.columns)
+    keys = list(on) if on else headers
+    return anti_join(left[headers], right, keys).reset_index(drop=True)
+
+
+def get_rows_not_in_a_df(
+    df_a: pd.DataFrame,
+    df_b: pd.DataFrame,
+    headers: List[str] = None,
+    unique_keys: List[str] = None,
+) -> pd.DataFrame:
+    """
+    Return the rows of `df_a` whose key is not in `df_b`.
+
+    :param df_a: The new rows.
+    :param df_b: The existing rows.
+    :param headers: The columns to return. Defaults to all columns of `df_a`.
+    :param unique_keys: The key columns. Defaults to `headers`.
+    :return: The rows of `df_a` not in `df_b`, with a fresh index.
+    """
+    return get_diff_rows_left_keep_all(df_a, df_b, headers=headers, on=unique_keys)
+
+
+def remove_xy_suffixes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop the `_y` columns of a merge and strip the `_x` suffix of the others.
+
+    :param df: The merged DataFrame.
+    :return: The DataFrame with the left-side column names.
+    """
+    columns = pd.Index(df.columns.astype(str))
+    is_right = columns.str.endswith("_y")
+    if not is_right.any() and not columns.str.endswith("_x").any():
+        return df
+    df = df.loc[:, ~is_right]
+    return df.rename(columns=lambda column: str(column).removesuffix("_x"))
+
+
+def dedup_and_order_df(
+    df: pd.DataFrame,
+    subset: List[str] = None,
+    order_by: List[str] = None,
+    ascending: List[bool] = None,
+) -> pd.DataFrame:
+    """
+    Keep the first row of every key, in the order given by `order_by`.
+
+    The rows are sorted once, with a stable sort, and the duplicates of the
+    hashed keys are dropped from the sorted rows.
+
+    :param df: The rows to deduplicate.
+    :param subset: The key columns. Defaults to all columns.
+    :param order_by: The columns deciding which row of a key comes first.
+    :param ascending: The sort direction of every `order_by` column.
+    :return: The deduplicated rows, ordered, with a fresh index.
+    """
+    if order_by:
+        df = df.sort_values(
+            by=list(order_by),
+            ascending=True if ascending is None else ascending,
+            kind="stable",
+        )
+    keys = list(subset) if subset else list(df.columns)
+    is_duplicated = hash_keys(df, keys).duplicated().to_numpy()
+    return df[~is_duplicated].reset_index(drop=True)
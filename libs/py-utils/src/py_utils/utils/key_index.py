@@ -0,0 +1,156 @@
+import datetime
+import os
+import re
+import sqlite3
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from py_utils.common.logger import LoggerMixin
+from py_utils.utils.cache import make_cache_key
+from py_utils.utils.dataframe import SHEET_EPOCH, hash_rows, normalize_keys
+from py_utils.utils.path import get_cache_dir
+
+
+# ISO dates and date-times, as written to a sheet and shown back by it
+_ISO_DATE_RE = re.compile(
+    r"^\d{4}-\d{2}-\d{2}(?:[ T]\d{1,2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?$"
+)
+
+
+def _to_day_serial(value):
+    """Map a date key, typed or ISO text, to the day serial a sheet stores."""
+    if isinstance(value, str):
+        if not _ISO_DATE_RE.match(value):
+            return value
+        try:
+            value = pd.Timestamp(value)
+        except ValueError:
+            return value
+    elif isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            return value
+    elif not isinstance(value, datetime.date):
+        return value
+    return (pd.Timestamp(value) - SHEET_EPOCH) / pd.Timedelta(days=1)
+
+
+class KeyIndexConfig:
+    DIR = os.environ.get("SHEET_KEY_INDEX_DIR")
+
+
+class SheetKeyIndex(LoggerMixin):
+    """
+    Persistent set of the keys a worksheet holds, stored in SQLite.
+
+    Keys are stored as hashes of their `normalize_keys` rendering in an
+    INTEGER PRIMARY KEY, next to the spreadsheet revision they were read at,
+    so unformatted keys read from the sheet and typed keys of written rows,
+    e.g. `1` and `1.0` or a blank cell and NaN, hash alike. Dates, whether
+    typed, ISO text or read as serials, are hashed as day serials. Writers add the keys of the
+    rows they wrote together with the revision that followed, in one
+    transaction, so an index whose revision still matches the spreadsheet is
+    known to be complete and the sheet does not need to be read.
+
+    Args:
+        spreadsheet_id (str): The spreadsheet of the worksheet.
+        sheet_name (str): The worksheet.
+        keys (list): The key columns.
+        directory (str): The directory of the index files.
+    """
+
+    def __init__(
+        self,
+        spreadsheet_id: str,
+        sheet_name: str,
+        keys: List[str],
+        directory: str = None,
+    ):
+        self.sheet_name = sheet_name
+        self.keys = list(keys)
+        self.path = os.path.join(
+            directory or KeyIndexConfig.DIR or get_cache_dir("sheet_key_index"),
+            f"{make_cache_key(spreadsheet_id, sheet_name, *self.keys)}.sqlite",
+        )
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS keys (hash INTEGER PRIMARY KEY)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    @property
+    def revision(self):
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE name = 'revision'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_revision(self, revision):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES ('revision', ?)",
+            (revision,),
+        )
+
+    def _hash(self, df) -> np.ndarray:
+        df = df[self.keys].apply(lambda column: column.map(_to_day_serial))
+        return hash_rows(normalize_keys(df, self.keys)).to_numpy()
+
+    def _insert(self, df):
+        if df.empty:
+            return
+        # sorted hashes are appended to the B-tree instead of inserted at random
+        hashes = np.unique(self._hash(df))
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO keys (hash) VALUES (?)",
+            zip(hashes.tolist()),
+        )
+
+    def add(self, df: pd.DataFrame, revision: str = None):
+        """Add the keys of written rows and the revision that followed."""
+        with self.connection:
+            self._insert(df)
+            self._set_revision(revision)
+
+    def rebuild(self, df: pd.DataFrame, revision: str = None):
+        """Replace the index with the keys of `df`, read at `revision`."""
+        with self.connection:
+            self.connection.execute("DELETE FROM keys")
+            self._insert(df)
+            self._set_revision(revision)
+        self.logger.info(f"Rebuilt key index with {len(df)} rows at {revision}")
+
+    def contains(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Return a mask of the rows of `df` whose key is in the index.
+        """
+        is_present = np.zeros(len(df), dtype=bool)
+        if df.empty:
+            return is_present
+        hashes, inverse = np.unique(self._hash(df), return_inverse=True)
+        # the distinct hashes are probed in key order by primary key lookups
+        with self.connection:
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS probe (hash INTEGER PRIMARY KEY)"
+            )
+            self.connection.execute("DELETE FROM probe")
+            self.connection.executemany(
+                "INSERT INTO probe (hash) VALUES (?)", zip(hashes.tolist())
+            )
+            found = self.connection.execute(
+                "SELECT p.hash FROM probe AS p JOIN keys AS k ON k.hash = p.hash"
+            ).fetchall()
+        if found:
+            is_found = np.isin(hashes, np.array([row[0] for row in found], "int64"))
+            is_present = is_found[inverse]
+        return is_present
+
+    def get_new_rows(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Return the rows of `df` whose key is not in the index."""
+        return df[~self.contains(df)]
+
+    def close(self):
+        self.connection.close()
@@ -171,4 +171,21 @@ def get_dirname(path):
     :param path: Path to get the directory name of.
     :return: Directory name of the path.
     """
-    return os.path.dirname(path)
\ No newline at end of file
+    return os.path.dirname(path)
+
+def get_cache_dir(*paths):
+    """
+    Get a directory below the local cache root, creating it if needed.
+
+    The cache root defaults to ``~/.cache/datalake-tool`` and can be overridden
+    with the ``DATALAKE_CACHE_DIR`` environment variable.
+
+    :param paths: Sub directories below the cache root.
+    :return: Absolute path of the cache directory as a string.
+    """
+    root = os.environ.get(
+        "DATALAKE_CACHE_DIR", os.path.join(Path.home(), ".cache", "datalake-tool")
+    )
+    path = os.path.abspath(os.path.join(root, *paths))
+    os.makedirs(path, exist_ok=True)
+    return path
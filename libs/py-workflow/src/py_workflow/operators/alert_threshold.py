@@ -1,6 +1,5 @@
-from google.cloud import bigquery
-
 from py_utils.common.logger import LoggerMixin
+from py_utils.google.console.bigquery import get_bigquery_service
 from py_workflow.operators.base import BaseOperator
 from py_workflow.operators.slack_alert import SlackOperator
 
@@ -9,25 +8,35 @@ class AlertThresholdOperator(BaseOperator, LoggerMixin):
     def __init__(
         self,
         *,
-        sql: str,
+        sql: str = None,
         threshold_conf: dict = None,
         slack_conf: dict = None,
+        checks: list = None,
+        project_id: str = None,
         **kwargs,
     ):
         self.sql = sql
         self.threshold_conf = threshold_conf
         self.slack_conf = slack_conf
-        self.client = bigquery.Client()
+        # each check is a dict of `sql` and `threshold_conf`, run concurrently
+        self.checks = (
+            checks
+            if checks is not None
+            else [{"sql": sql, "threshold_conf": threshold_conf}]
+        )
+        self.bq_service = get_bigquery_service(project_id=project_id)
         self.slack_operator = SlackOperator(**slack_conf)
 
     def load_data(self):
-        query_job = self.client.query(self.sql)
-        return query_job.result().to_dataframe()
+        return self.bq_service.query_dataframes(
+            [check["sql"] for check in self.checks]
+        )
 
-    def _check_condition(self, data):
-        metric = self.threshold_conf.get("metric")
-        operator = self.threshold_conf.get("operator")
-        threshold = self.threshold_conf.get("threshold")
+    def _check_condition(self, data, threshold_conf=None):
+        threshold_conf = threshold_conf or self.threshold_conf
+        metric = threshold_conf.get("metric")
+        operator = threshold_conf.get("operator")
+        threshold = threshold_conf.get("threshold")
         metric_val = data.get(metric)
         self.logger.info(
             f"Metric {metric} has Value: {metric_val} - Threshold: {threshold}"
@@ -49,14 +58,18 @@ class AlertThresholdOperator(BaseOperator, LoggerMixin):
         return False
 
     def check_threshold(self):
-        df = self.load_data()
-        if df.empty:
-            self.logger.info("No data found")
-            return
-        data = df.to_dict(orient="records")[0]
-        compares = self._check_condition(data=data)
-        self.logger.info(f"Compares: {compares}")
-        if compares:
+        is_reached = False
+        for check, df in zip(self.checks, self.load_data()):
+            if df.empty:
+                self.logger.info("No data found")
+                continue
+            data = df.to_dict(orient="records")[0]
+            compares = self._check_condition(
+                data=data, threshold_conf=check.get("threshold_conf")
+            )
+            self.logger.info(f"Compares: {compares}")
+            is_reached = is_reached or compares
+        if is_reached:
             self.logger.info("Alert Threshold is reached")
             self.slack_operator.execute()
         else:
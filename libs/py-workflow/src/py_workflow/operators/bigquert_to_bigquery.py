@@ -1,8 +1,45 @@
+import re
+
 from py_workflow.operators.base import BaseOperator
 from py_utils.common.logger import LoggerMixin
 
+from py_utils.google.console.bigquery import get_bigquery_service, normalize_sql
+
+# `SELECT * FROM table [WHERE _PARTITIONDATE = 'YYYY-MM-DD']` can run as a copy job
+_TABLE_COPY_RE = re.compile(
+    r"^select \* from `?(?P<table>[\w-]+\.\w+\.\w+)`?"
+    r"(?: where _partitiondate = (?:date)? ?\(?'(?P<date>\d{4}-\d{2}-\d{2})'\)?)?$",
+    re.IGNORECASE,
+)
+
+
+class WRITEMODE:
+    APPEND = "a"
+    TRUNCATE = "w"
+    MERGE = "merge"
+
+
+WRITE_DISPOSITIONS = {
+    WRITEMODE.APPEND: "WRITE_APPEND",
+    "append": "WRITE_APPEND",
+    WRITEMODE.TRUNCATE: "WRITE_TRUNCATE",
+    "truncate": "WRITE_TRUNCATE",
+}
+
 
 class BigqueryToBigqueryOperator(LoggerMixin, BaseOperator):
+    """
+    Run a query into a destination table entirely server-side.
+
+    Args:
+        query (str): The SQL query producing the rows.
+        project_id (str): The Google Cloud project ID.
+        write_mode (str): `w`/truncate, `a`/append or merge.
+        dest_table (str): The destination `dataset.table` or `project.dataset.table`.
+        unique_keys (list): The columns to merge on, for the merge mode.
+        partition (str): Optional `YYYYMMDD` partition to write, e.g. `{{ds_nodash}}`.
+    """
+
     def __init__(
         self,
         query: str,
@@ -10,21 +47,95 @@ class BigqueryToBigqueryOperator(LoggerMixin, BaseOperator):
         write_mode: str = "w",
         dest_table: str = None,
         unique_keys: list = None,
+        partition: str = None,
+        time_partitioning=None,
+        clustering_fields: list = None,
+        **kwargs,
     ):
         super().__init__()
+        if write_mode != WRITEMODE.MERGE and write_mode not in WRITE_DISPOSITIONS:
+            raise ValueError(f"Invalid write mode: {write_mode}")
+        if write_mode == WRITEMODE.MERGE and not unique_keys:
+            raise ValueError("unique_keys is required for the merge write mode.")
+        if write_mode == WRITEMODE.MERGE and partition:
+            raise ValueError("partition is not supported by the merge write mode.")
         self.query = query
         self.project_id = project_id
         self.write_mode = write_mode
-        self.dest_table = dest_table
+        self.dest_table = (
+            dest_table
+            if dest_table.count(".") == 2
+            else f"{self.project_id}.{dest_table}"
+        )
         self.unique_keys = unique_keys
+        self.partition = partition
+        self.time_partitioning = time_partitioning
+        self.clustering_fields = clustering_fields
+        self.bq_service = get_bigquery_service(project_id=self.project_id)
+
+    def get_destination(self, partition: str = None):
+        partition = partition or self.partition
+        if partition:
+            return f"{self.dest_table}${partition}"
+        return self.dest_table
+
+    @property
+    def destination(self):
+        return self.get_destination()
+
+    def get_copy_source(self):
+        """
+        Return the table or partition to copy when the query is a plain copy.
 
-    def fetch_dataframe_from_bigquery(self):
-        self.logger.info(f"Running query:\n {self.sql}")
-        results = self.bq_service.run_query(self.sql)
-        return results.to_dataframe()
+        Copy jobs keep the source's partitioning and clustering and only read
+        stored tables, so views, external tables and an explicit destination
+        layout go through a query instead.
 
-    def load_dataframe_to_bigquery(self, data):
-        pass
+        Returns:
+            tuple: `(source, partition)`, or None when a copy does not apply.
+        """
+        if self.time_partitioning is not None or self.clustering_fields:
+            return None
+        match = _TABLE_COPY_RE.match(normalize_sql(self.query))
+        if match is None:
+            return None
+        table = match.group("table")
+        if self.bq_service.get_table_type(table) != "TABLE":
+            return None
+        date = match.group("date")
+        if date is None:
+            # a whole table only maps onto a whole destination table
+            return None if self.partition else (table, None)
+        partition = date.replace("-", "")
+        if self.partition and self.partition != partition:
+            return None
+        return f"{table}${partition}", partition
 
-    def execute(**args):
-        return super().execute()
+    def execute(self):
+        self.logger.info(f"Running query into {self.destination}:\n {self.query}")
+        if self.write_mode == WRITEMODE.MERGE:
+            _, dataset_id, table_id = self.dest_table.split(".")
+            self.bq_service.merge_query(
+                self.query,
+                destination_dataset=dataset_id,
+                destination_table=table_id,
+                unique_keys=self.unique_keys,
+            )
+            return
+        write_disposition = WRITE_DISPOSITIONS[self.write_mode]
+        copy_source = self.get_copy_source()
+        if copy_source is not None:
+            source, partition = copy_source
+            self.bq_service.copy_table(
+                source,
+                self.get_destination(partition),
+                write_disposition=write_disposition,
+            )
+            return
+        self.bq_service.query_to_table(
+            self.query,
+            self.destination,
+            write_disposition=write_disposition,
+            time_partitioning=self.time_partitioning,
+            clustering_fields=self.clustering_fields,
+        )
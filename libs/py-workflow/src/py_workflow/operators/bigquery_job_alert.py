@@ -1,6 +1,5 @@
-from google.cloud import bigquery
-
 from py_utils.common.logger import LoggerMixin
+from py_utils.google.console.bigquery import get_bigquery_service
 from py_workflow.operators.base import BaseOperator
 
 # from py_workflow.operators.slack_alert import SlackOperator
@@ -14,15 +13,15 @@ class BigqueryJobAlertOperator(BaseOperator, LoggerMixin):
         self,
         sql: str,
         slack_conf: dict = None,
+        project_id: str = None,
         **kwargs,
     ):
         self.sql = sql
         self.slack_conf = slack_conf
-        self.client = bigquery.Client()
+        self.bq_service = get_bigquery_service(project_id=project_id)
 
     def load_data(self):
-        query_job = self.client.query(self.sql)
-        return query_job.result().to_dataframe()
+        return self.bq_service.query_to_dataframe(self.sql)
 
     def replace_and_render(self, data: list[dict], template_string: str) -> str:
         """
@@ -6,6 +6,7 @@ from googleapiclient.http import MediaFileUpload
 from google.oauth2 import service_account
 from py_workflow.operators.base import BaseOperator
 from py_utils.common.logger import LoggerMixin
+from py_utils.google.api.quota import rate_limited_request_builder
 
 
 class BigqueryToDriveOperator(BaseOperator, LoggerMixin):
@@ -25,7 +26,15 @@ class BigqueryToDriveOperator(BaseOperator, LoggerMixin):
         credentials = service_account.Credentials.from_service_account_file(
             credentials_path, scopes=["https://www.googleapis.com/auth/drive"]
         )
-        self.drive_service = build("drive", "v3", credentials=credentials)
+        # shares the Drive quota limiter and 429/5xx retries of the sheet clients
+        self.drive_service = build(
+            "drive",
+            "v3",
+            credentials=credentials,
+            requestBuilder=rate_limited_request_builder(
+                "drive", credentials.project_id
+            ),
+        )
 
     def export_table_to_gcs(self, bucket_name, destination_blob_name):
         destination_uri = f"gs://{bucket_name}/{destination_blob_name}.csv"
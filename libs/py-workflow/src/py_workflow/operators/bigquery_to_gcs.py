@@ -2,48 +2,149 @@ from google.cloud import bigquery
 from py_workflow.operators.base import BaseOperator
 from py_utils.common.logger import LoggerMixin
 
+from py_utils.google.console.bigquery import BigqueryConfig, get_bigquery_service
+
+# BigQuery cannot export more than 1 GB into a single file
+MAX_SINGLE_FILE_BYTES = 1024 * 1024 * 1024
+
+DESTINATION_FORMATS = {
+    "csv": (bigquery.DestinationFormat.CSV, "csv"),
+    "ndjson": (bigquery.DestinationFormat.NEWLINE_DELIMITED_JSON, "json"),
+    "avro": (bigquery.DestinationFormat.AVRO, "avro"),
+    "parquet": (bigquery.DestinationFormat.PARQUET, "parquet"),
+}
+
+COMPRESSIONS = {
+    "csv": {"gzip": bigquery.Compression.GZIP},
+    "ndjson": {"gzip": bigquery.Compression.GZIP},
+    "avro": {
+        "deflate": bigquery.Compression.DEFLATE,
+        "snappy": bigquery.Compression.SNAPPY,
+    },
+    "parquet": {
+        "gzip": bigquery.Compression.GZIP,
+        "snappy": bigquery.Compression.SNAPPY,
+        "zstd": bigquery.Compression.ZSTD,
+    },
+}
+
 
 class BigqueryToGCSOperator(BaseOperator, LoggerMixin):
+    """
+    Export BigQuery tables or partitions to GCS with server-side extract jobs.
+
+    Args:
+        project_id (str): The Google Cloud project ID.
+        dataset_id (str): The dataset of the table to export.
+        table_id (str): The table to export.
+        tables (list): Several `dataset.table` ids to export instead.
+        partitions (list): Optional `YYYYMMDD` partitions, e.g. `{{ds_nodash}}`.
+        destination_bucket_name (str): The destination bucket.
+        destination_blob_name (str): The destination path, without extension.
+        destination_format (str): csv, ndjson, avro or parquet.
+        compression (str): gzip, deflate, snappy or zstd, as the format allows.
+    """
+
     def __init__(
         self,
         project_id,
-        dataset_id,
-        table_id,
-        destination_bucket_name,
-        destination_blob_name,
-        credentials_path,
+        dataset_id=None,
+        table_id=None,
+        destination_bucket_name=None,
+        destination_blob_name=None,
+        credentials_path=None,
+        tables: list = None,
+        partitions: list = None,
+        destination_format: str = "csv",
+        compression: str = None,
+        **kwargs,
     ):
+        if destination_format not in DESTINATION_FORMATS:
+            raise ValueError(f"Invalid destination format: {destination_format}")
+        if compression is not None and compression not in COMPRESSIONS.get(
+            destination_format, {}
+        ):
+            raise ValueError(
+                f"Compression '{compression}' is not supported for {destination_format}"
+            )
         self.project_id = project_id
         self.dataset_id = dataset_id
         self.table_id = table_id
+        self.tables = tables or [f"{dataset_id}.{table_id}"]
+        self.partitions = [partitions] if isinstance(partitions, str) else partitions
         self.destination_bucket_name = destination_bucket_name
         self.destination_blob_name = destination_blob_name
+        self.destination_format = destination_format
+        self.compression = compression
         self.credentials_path = credentials_path
 
-        # Initialize BigQuery client
-        self.bq_client = bigquery.Client.from_service_account_json(credentials_path)
-
-    def export_table_to_gcs(self):
-        # Construct the destination URI for GCS
-        destination_uri = (
-            f"gs://{self.destination_bucket_name}/{self.destination_blob_name}.csv"
+        if BigqueryConfig.BACKEND != "bigquery":
+            raise ValueError(
+                "BigqueryToGCSOperator runs BigQuery extract jobs and does not "
+                f"support the {BigqueryConfig.BACKEND} backend."
+            )
+        # the service must not build a client from the ambient credentials first
+        client = (
+            bigquery.Client.from_service_account_json(
+                credentials_path, project=self.project_id
+            )
+            if credentials_path is not None
+            else None
+        )
+        self.bq_service = get_bigquery_service(
+            project_id=self.project_id, client=client
         )
 
-        # Reference to the dataset and table
-        dataset_ref = self.bq_client.dataset(self.dataset_id, project=self.project_id)
-        table_ref = dataset_ref.table(self.table_id)
+    @property
+    def extension(self):
+        extension = DESTINATION_FORMATS[self.destination_format][1]
+        if self.compression == "gzip" and self.destination_format in ("csv", "ndjson"):
+            extension += ".gz"
+        return extension
 
-        # Create an extract job
-        extract_job = self.bq_client.extract_table(
-            table_ref,
-            destination_uri,
-            location="US",  # Location must match that of the source table.
-        )
+    def get_sources(self):
+        """
+        Return the fully qualified tables, or partitions, to export.
+        """
+        sources = []
+        for table in self.tables:
+            table = table if table.count(".") == 2 else f"{self.project_id}.{table}"
+            if self.partitions:
+                sources.extend(f"{table}${partition}" for partition in self.partitions)
+            else:
+                sources.append(table)
+        return sources
 
-        # Wait for the job to complete
-        extract_job.result()
+    def get_destination_uri(self, source, is_single):
+        base = self.destination_blob_name
+        if not is_single:
+            table, _, partition = source.partition("$")
+            base = f"{base}/{table.split('.')[-1]}"
+            if partition:
+                base = f"{base}/{partition}"
+        table = self.bq_service.client.get_table(source.split("$")[0])
+        # shard with a wildcard when the table may not fit in one file
+        shard = "-*" if (table.num_bytes or 0) > MAX_SINGLE_FILE_BYTES else ""
+        return f"gs://{self.destination_bucket_name}/{base}{shard}.{self.extension}"
 
-        self.logger.info(
-            f"Exported {self.project_id}:{self.dataset_id}.{self.table_id} to {destination_uri}"
+    def export_table_to_gcs(self):
+        sources = self.get_sources()
+        extracts = [
+            (source, self.get_destination_uri(source, is_single=len(sources) == 1))
+            for source in sources
+        ]
+        self.bq_service.extract_tables(
+            extracts,
+            destination_format=DESTINATION_FORMATS[self.destination_format][0],
+            compression=(
+                COMPRESSIONS[self.destination_format][self.compression]
+                if self.compression
+                else None
+            ),
         )
-        return destination_uri
+        destination_uris = [destination_uri for _, destination_uri in extracts]
+        self.logger.info(f"Exported {sources} to {destination_uris}")
+        return destination_uris
+
+    def execute(self):
+        return self.export_table_to_gcs()
@@ -2,8 +2,9 @@ import pandas as pd
 from py_workflow.operators.base import BaseOperator
 from py_utils.common.logger import LoggerMixin
 
-from py_utils.google.console.bigquery import BigqueryService
+from py_utils.google.console.bigquery import get_bigquery_service
 from py_utils.google.api.sheet import GoogleSheetService
+from py_utils.utils.anti_join import OutOfCoreAntiJoin
 
 from py_utils.utils.dataframe import (
     get_rows_not_in_a_df,
@@ -26,6 +27,10 @@ class BigqueryToGGSheetOperator(BaseOperator, LoggerMixin):
         unique_keys: list = None,
         sheet_name: str = None,
         write_mode: str = "w",
+        is_out_of_core: bool = False,
+        memory_budget_bytes: int = None,
+        is_server_side_diff: bool = False,
+        is_key_index: bool = False,
     ):
         self.project_id = project_id
         self.sql = sql
@@ -34,49 +39,161 @@ class BigqueryToGGSheetOperator(BaseOperator, LoggerMixin):
         self.write_mode = write_mode
         self.headers = headers
         self.unique_keys = unique_keys
+        self.is_out_of_core = is_out_of_core
+        self.memory_budget_bytes = memory_budget_bytes
+        self.is_server_side_diff = is_server_side_diff
+        self.is_key_index = is_key_index
 
         # Initialize BigQuery client
-        self.bq_service = BigqueryService(project_id=self.project_id)
+        self.bq_service = get_bigquery_service(project_id=self.project_id)
         self.ggsheet_service = GoogleSheetService(url=self.spreadsheet_url)
 
     def fetch_dataframe_from_bigquery(self):
         self.logger.info(f"Running query:\n {self.sql}")
-        results = self.bq_service.run_query(self.sql)
-        return results.to_dataframe()
+        return self.bq_service.query_to_dataframe(self.sql)
 
-    def fetch_data_from_sheets(self, sheet_name=None):
+    def iter_dataframes_from_bigquery(self):
+        self.logger.info(f"Running query:\n {self.sql}")
+        return self.bq_service.iter_query_dataframes(self.sql)
+
+    def fetch_data_from_sheets(self, sheet_name=None, columns=None):
         # Fetch data from Google Sheets
-        df = self.ggsheet_service.read_sheet(sheet_name)
+        df = self.ggsheet_service.read_sheet(sheet_name, columns=columns)
         return df
 
-    def update_google_sheet(self, data):
+    def update_google_sheet(self, data, mode=None):
         self.logger.info(f"Updating Google Sheet\n: {self.spreadsheet_url}")
         self.ggsheet_service.export_to_sheets(
             sheet_idx=self.sheet_name,
             df=pd.DataFrame(data),
-            mode=self.write_mode,
+            mode=mode or self.write_mode,
+        )
+
+    def get_keys(self):
+        keys = self.unique_keys or self.headers
+        if keys is None:
+            raise ValueError("Diffing by keys needs unique_keys or headers.")
+        return keys
+
+    def fetch_keys_from_sheets(self, keys):
+        # only the key columns are needed to know what the sheet holds
+        if not self.ggsheet_service.read_headers(self.sheet_name):
+            return pd.DataFrame(columns=keys)
+        return self.fetch_data_from_sheets(sheet_name=self.sheet_name, columns=keys)
+
+    def write_chunks(self, chunks, key_index=None):
+        # only the first chunk may truncate
+        write_mode = self.write_mode
+        total_rows = 0
+        for new_data in chunks:
+            if new_data.empty:
+                continue
+            if self.headers is not None:
+                new_data = new_data[self.headers]
+            if key_index is None:
+                self.update_google_sheet(new_data, mode=write_mode)
+            else:
+                new_data = self.ggsheet_service.write_with_key_index(
+                    key_index,
+                    new_data,
+                    lambda df: self.update_google_sheet(df, mode=write_mode),
+                    is_replace=write_mode == WRITEMODE.TRUNCATE,
+                )
+            write_mode = WRITEMODE.APPEND
+            total_rows += len(new_data)
+        self.logger.info(f"size data write: {total_rows}")
+
+    def execute_with_key_index(self):
+        """
+        Diff the query result against the persistent key index of the sheet.
+
+        The sheet is only read when its revision is not the one the index
+        recorded after the last write.
+        """
+        key_index = self.ggsheet_service.get_key_index(
+            self.sheet_name, self.get_keys()
+        )
+        try:
+            # lazy, so every chunk is diffed after the previous one was indexed
+            self.write_chunks(
+                (
+                    key_index.get_new_rows(df_bq)
+                    for df_bq in self.iter_dataframes_from_bigquery()
+                ),
+                key_index=key_index,
+            )
+        finally:
+            key_index.close()
+
+    def execute_out_of_core(self):
+        """
+        Diff the query result against the sheet through local spill files.
+
+        Only the key columns of the sheet are read, and the result is spilled
+        chunk by chunk, so memory stays within `memory_budget_bytes` whatever
+        the size of the result.
+        """
+        keys = self.get_keys()
+        df_keys = self.fetch_keys_from_sheets(keys)
+        with OutOfCoreAntiJoin(
+            keys=keys, memory_budget_bytes=self.memory_budget_bytes
+        ) as anti_join:
+            anti_join.add_right(df_keys)
+            for df_bq in self.iter_dataframes_from_bigquery():
+                if self.headers is not None:
+                    df_bq = df_bq[self.headers]
+                anti_join.add_left(df_bq)
+            self.write_chunks(anti_join.iter_left_only())
+
+    def execute_server_side_diff(self):
+        """
+        Diff the query result against the sheet in BigQuery.
+
+        The key columns of the sheet are sent to BigQuery and the query is
+        wrapped in an anti-join, so only new rows leave BigQuery.
+        """
+        keys = self.get_keys()
+        df_keys = self.fetch_keys_from_sheets(keys)
+        self.logger.info(
+            f"Running query without {len(df_keys)} sheet keys:\n {self.sql}"
+        )
+        self.write_chunks(
+            self.bq_service.iter_query_dataframes_not_in(self.sql, df_keys, keys)
         )
 
     def execute(self):
-        # Fetch data from BigQuery
-        df_bq = self.fetch_dataframe_from_bigquery()
-        df_sheet = self.fetch_data_from_sheets(sheet_name=self.sheet_name)
-        if df_bq.empty:
-            self.logger.info("No data found.")
+        if self.is_key_index:
+            self.execute_with_key_index()
             return
+        if self.is_server_side_diff:
+            self.execute_server_side_diff()
+            return
+        if self.is_out_of_core:
+            self.execute_out_of_core()
+            return
+        df_sheet = self.fetch_data_from_sheets(sheet_name=self.sheet_name)
         if df_sheet.empty:
             self.logger.info("No data found in Google Sheet.")
             df_sheet = pd.DataFrame(columns=self.headers)
-        new_data = get_rows_not_in_a_df(
-            df_bq,
-            df_sheet,
-            headers=self.headers,
-            unique_keys=self.unique_keys,
-        )
-        self.logger.info(f"size data write: {len(new_data)}")
-        if new_data.empty:
+        # Large results arrive in chunks; only the first chunk may truncate
+        write_mode = self.write_mode
+        total_rows = 0
+        for df_bq in self.iter_dataframes_from_bigquery():
+            if df_bq.empty:
+                continue
+            new_data = get_rows_not_in_a_df(
+                df_bq,
+                df_sheet,
+                headers=self.headers,
+                unique_keys=self.unique_keys,
+            )
+            self.logger.info(f"size data write: {len(new_data)}")
+            if new_data.empty:
+                continue
+            new_data = remove_xy_suffixes(new_data)
+            # Update Google Sheet with fetched data
+            self.update_google_sheet(new_data, mode=write_mode)
+            write_mode = WRITEMODE.APPEND
+            total_rows += len(new_data)
+        if total_rows == 0:
             self.logger.info("No new data to write.")
-            return
-        new_data = remove_xy_suffixes(new_data)
-        # Update Google Sheet with fetched data
-        self.update_google_sheet(new_data)
@@ -0,0 +1,188 @@
+import json
+import os
+
+from google.cloud import bigquery
+from py_workflow.operators.base import BaseOperator
+from py_utils.common.logger import LoggerMixin
+
+from py_utils.google.console.bigquery import BigqueryConfig, get_bigquery_service
+from py_utils.google.console.gcs import GCSUtil, parse_gcs_uri
+from py_utils.utils.path import get_cache_dir
+
+
+class WRITEMODE:
+    APPEND = "append"
+    TRUNCATE = "truncate"
+
+
+SOURCE_FORMATS = {
+    "parquet": bigquery.SourceFormat.PARQUET,
+    "avro": bigquery.SourceFormat.AVRO,
+    "ndjson": bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+    "csv": bigquery.SourceFormat.CSV,
+}
+
+
+class GCSToBigQueryOperator(BaseOperator, LoggerMixin):
+    """
+    Load files already sitting in GCS into BigQuery with server-side load jobs.
+
+    Args:
+        project_id (str): The Google Cloud project ID.
+        source_uris (list): `gs://` URIs, with optional wildcards.
+        dataset_id (str): The destination dataset.
+        table_id (str): The destination table.
+        source_format (str): One of parquet, avro, ndjson or csv.
+        write_mode (str): append or truncate.
+        schema (list): Optional list of `{field, type, mode}` dicts.
+        manifest_uri (str): `gs://` URI of the loaded-files manifest. Defaults
+            to a local file in the cache directory.
+        max_uris_per_job (int): The number of URIs per load job.
+        max_bytes_per_job (int): The number of source bytes per load job.
+    """
+
+    def __init__(
+        self,
+        project_id: str = None,
+        source_uris: list = None,
+        dataset_id: str = None,
+        table_id: str = None,
+        source_format: str = "parquet",
+        write_mode: str = "append",
+        schema: list = None,
+        time_partitioning: str = None,
+        clustering_fields: list = None,
+        skip_leading_rows: int = 1,
+        manifest_uri: str = None,
+        max_uris_per_job: int = 1000,
+        max_bytes_per_job: int = 1024**4,
+        max_workers: int = 8,
+        **kwargs,
+    ):
+        if source_format not in SOURCE_FORMATS:
+            raise ValueError(f"Invalid source format: {source_format}")
+        if write_mode not in (WRITEMODE.APPEND, WRITEMODE.TRUNCATE):
+            raise ValueError(f"Invalid write mode: {write_mode}")
+        if BigqueryConfig.BACKEND != "bigquery":
+            raise ValueError(
+                "GCSToBigQueryOperator runs BigQuery load jobs and does not "
+                f"support the {BigqueryConfig.BACKEND} backend."
+            )
+        self.project_id = project_id
+        self.source_uris = (
+            [source_uris] if isinstance(source_uris, str) else source_uris
+        )
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+        self.source_format = source_format
+        self.write_mode = write_mode
+        self.schema = schema
+        self.time_partitioning = time_partitioning
+        self.clustering_fields = clustering_fields
+        self.skip_leading_rows = skip_leading_rows
+        self.manifest_uri = manifest_uri
+        self.max_uris_per_job = max_uris_per_job
+        self.max_bytes_per_job = max_bytes_per_job
+        self.max_workers = max_workers
+        self.gcs_util = GCSUtil(project_id=self.project_id)
+        self.bq_service = get_bigquery_service(project_id=self.project_id)
+
+    @property
+    def destination(self):
+        return f"{self.project_id}.{self.dataset_id}.{self.table_id}"
+
+    def convert_to_bigquery_schema(self):
+        if self.schema is None:
+            return None
+        return [
+            bigquery.SchemaField(
+                field["field"], field["type"], mode=field.get("mode", "NULLABLE")
+            )
+            for field in self.schema
+        ]
+
+    def load_manifest(self):
+        """
+        Return the `{uri: generation}` map of files already loaded.
+        """
+        if self.manifest_uri is not None:
+            content = self.gcs_util.read_text(*parse_gcs_uri(self.manifest_uri))
+        else:
+            path = self._local_manifest_path()
+            content = None
+            if os.path.exists(path):
+                with open(path, "r") as file:
+                    content = file.read()
+        return json.loads(content) if content else {}
+
+    def save_manifest(self, manifest):
+        content = json.dumps(manifest, sort_keys=True)
+        if self.manifest_uri is not None:
+            self.gcs_util.write_text(
+                *parse_gcs_uri(self.manifest_uri),
+                content,
+                content_type="application/json",
+            )
+            return
+        path = self._local_manifest_path()
+        with open(f"{path}.tmp", "w") as file:
+            file.write(content)
+        os.replace(f"{path}.tmp", path)
+
+    def _local_manifest_path(self):
+        return os.path.join(get_cache_dir("gcs_manifests"), f"{self.destination}.json")
+
+    def make_batches(self, blobs):
+        """
+        Group `(uri, generation, size)` tuples into load job batches.
+        """
+        batches, batch, batch_bytes = [], [], 0
+        for uri, _, size in blobs:
+            if batch and (
+                len(batch) >= self.max_uris_per_job
+                or batch_bytes + (size or 0) > self.max_bytes_per_job
+            ):
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+            batch.append(uri)
+            batch_bytes += size or 0
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def execute(self):
+        blobs = self.gcs_util.list_uris_matching(
+            self.source_uris, max_workers=self.max_workers
+        )
+        self.logger.info(f"Found {len(blobs)} files matching {self.source_uris}")
+        manifest = {} if self.write_mode == WRITEMODE.TRUNCATE else self.load_manifest()
+        new_blobs = [blob for blob in blobs if manifest.get(blob[0]) != blob[1]]
+        self.logger.info(
+            f"Skipping {len(blobs) - len(new_blobs)} files already loaded"
+        )
+        if not new_blobs:
+            self.logger.info("No new files to load.")
+            return
+        generations = {uri: generation for uri, generation, _ in new_blobs}
+
+        def on_batch_loaded(batch):
+            manifest.update({uri: generations[uri] for uri in batch})
+            self.save_manifest(manifest)
+
+        self.bq_service.load_from_uris(
+            table_id=self.destination,
+            uri_batches=self.make_batches(new_blobs),
+            source_format=SOURCE_FORMATS[self.source_format],
+            write_disposition=(
+                "WRITE_TRUNCATE"
+                if self.write_mode == WRITEMODE.TRUNCATE
+                else "WRITE_APPEND"
+            ),
+            time_partitioning=self.time_partitioning,
+            clustering_fields=self.clustering_fields,
+            schema=self.convert_to_bigquery_schema(),
+            skip_leading_rows=(
+                self.skip_leading_rows if self.source_format == "csv" else None
+            ),
+            on_batch_loaded=on_batch_loaded,
+        )
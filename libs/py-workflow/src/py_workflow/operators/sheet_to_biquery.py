@@ -6,18 +6,26 @@ from py_workflow.operators.base import BaseOperator
 from py_utils.common.logger import LoggerMixin
 
 from py_utils.google.api.sheet import GoogleSheetService
-from py_utils.google.console.bigquery import BigqueryService
+from py_utils.google.console.bigquery import get_bigquery_service
+from py_utils.utils.change_detection import ChangeDetector, ROW_HASH_COLUMN
+from py_utils.utils.dataframe import coerce_to_schema, SUPPORTED_SCHEMA_TYPES
 
 from py_utils.utils.string import remove_accents
 
 
 class WRITEMODE:
     APPEND = "append"
+    APPEND_STREAM = "append_stream"
     TRUNCATE = "truncate"
     INCREMENTAL = "incremental"
     SCD = "scd"
 
 
+class CHANGEDETECTION:
+    LOCAL = "local"
+    TARGET = "target"
+
+
 class GGSheetToBigQuery(BaseOperator, LoggerMixin):
     def __init__(
         self,
@@ -34,6 +42,10 @@ class GGSheetToBigQuery(BaseOperator, LoggerMixin):
         filter_conditions: list = None,
         columns: list = None,
         schema: list = None,
+        change_detection: str = None,
+        is_sync_deletes: bool = False,
+        is_key_hash: bool = False,
+        is_unformatted: bool = False,
     ):
         self.spreadsheet_url = spreadsheet_url
         self.sheet_name = sheet_name
@@ -47,10 +59,28 @@ class GGSheetToBigQuery(BaseOperator, LoggerMixin):
         self.write_mode = write_mode
         self.is_timestamp = is_timestamp
         self.schema = schema
+        self.change_detection = change_detection
+        self.is_sync_deletes = is_sync_deletes
+        self.is_key_hash = is_key_hash
+        self.is_unformatted = is_unformatted
         self.bigquery_schema = self.convert_to_bigquery_schema(self.schema)
         self.columns = columns
-        self.google_sheet_service = GoogleSheetService(url=self.spreadsheet_url)
-        self.bigquery_service = BigqueryService(project_id=self.project_id)
+        self._google_sheet_service = None
+        self.bigquery_service = get_bigquery_service(project_id=self.project_id)
+        self.change_detector = None
+        if self.change_detection is not None:
+            self.change_detector = ChangeDetector(
+                unique_keys=self.unique_keys,
+                snapshot_name=f"{self.project_id}.{self.dataset_id}.{self.table_id}",
+                exclude_columns=["_timestamp"],
+            )
+
+    @property
+    def google_sheet_service(self):
+        # built on first use, so a task that only loads never opens a sheet
+        if self._google_sheet_service is None:
+            self._google_sheet_service = GoogleSheetService(url=self.spreadsheet_url)
+        return self._google_sheet_service
 
     def convert_to_bigquery_schema(self, schema=None):
         if schema is None:
@@ -67,8 +97,16 @@ class GGSheetToBigQuery(BaseOperator, LoggerMixin):
             schemas.append(
                 bigquery.SchemaField("_timestamp", "TIMESTAMP", mode="NULLABLE")
             )
+        if self.change_detection == CHANGEDETECTION.TARGET:
+            schemas.append(
+                bigquery.SchemaField(ROW_HASH_COLUMN, "INTEGER", mode="NULLABLE")
+            )
         return schemas
 
+    @staticmethod
+    def normalize_column_name(column):
+        return remove_accents(column).lower().replace(" ", "_")
+
     def normalize_column_names(self, df):
         # Convert field names to lowercase and replace spaces with underscores
         columns = df.columns
@@ -77,7 +115,8 @@ class GGSheetToBigQuery(BaseOperator, LoggerMixin):
             headers[column] = remove_accents(column)
         df.rename(columns=headers, inplace=True)
         df.columns = df.columns.str.lower().str.replace(" ", "_")
-        df = df[self.columns]
+        if self.columns is not None:
+            df = df[self.columns]
         return df
 
     def get_dataframe_by_conditions(
@@ -127,19 +166,71 @@ class GGSheetToBigQuery(BaseOperator, LoggerMixin):
 
         return filtered_df
 
+    def get_render_options(self):
+        if not self.is_unformatted:
+            return {}
+        # typed cell values: numbers and booleans as-is, dates as day serials
+        return {
+            "value_render_option": "UNFORMATTED_VALUE",
+            "date_time_render_option": "SERIAL_NUMBER",
+        }
+
+    def get_sheet_schema(self, header_row):
+        """
+        Map the schema onto the sheet headers its fields are normalized from.
+        """
+        return GoogleSheetService.map_schema_to_headers(
+            self.schema, header_row, self.normalize_column_name
+        )
+
     def fetch_data_from_sheets(self):
         # Fetch data from Google Sheets
-        df = self.google_sheet_service.read_sheet(self.sheet_name)
+        read_options = self.get_render_options()
+        is_typed = self.is_unformatted and isinstance(self.schema, list)
+        header_row = None
+        if self.columns is not None or is_typed:
+            header_row = self.google_sheet_service.read_headers(self.sheet_name)
+        if is_typed:
+            # typed cells are coerced before the snapshot put, as Parquet
+            # cannot cache columns mixing numbers and strings
+            read_options["schema"] = self.get_sheet_schema(header_row)
+        if self.columns is None:
+            return self.google_sheet_service.read_sheet(
+                self.sheet_name, **read_options
+            )
+        # only fetch the selected columns and the ones the filters need
+        filter_fields = {
+            condition["field"] for condition in self.filter_conditions or []
+        }
+        columns = [
+            header
+            for header in dict.fromkeys(header_row)
+            if self.normalize_column_name(header) in self.columns
+            or header in filter_fields
+        ]
+        df = self.google_sheet_service.read_sheet(
+            self.sheet_name,
+            columns=columns,
+            header_row=header_row,
+            **read_options,
+        )
         return df
 
     def load_data_to_bigquery(self, df):
         self.logger.info(
             f"Loading data as {self.write_mode} BigQuery: {self.project_id}.{self.dataset_id}.{self.table_id} - size: {df.shape}"
         )
-        if self.write_mode == WRITEMODE.INCREMENTAL:
+        if (
+            self.write_mode in (WRITEMODE.INCREMENTAL, WRITEMODE.SCD)
+            and self.change_detector is not None
+        ):
+            self.load_changes_to_bigquery(df)
+        elif self.write_mode == WRITEMODE.INCREMENTAL:
             self.merge_data_to_bigquery(df)
         elif self.write_mode == WRITEMODE.APPEND:
             self.insert_data_to_bigquery(df)
+        elif self.write_mode == WRITEMODE.APPEND_STREAM:
+            self.stream_data_to_bigquery(df)
         elif self.write_mode == WRITEMODE.TRUNCATE:
             self.insert_data_to_bigquery(df)
         elif self.write_mode == WRITEMODE.SCD:
@@ -147,6 +238,65 @@ class GGSheetToBigQuery(BaseOperator, LoggerMixin):
         else:
             raise ValueError(f"Invalid write mode: {self.write_mode}")
 
+    def load_changes_to_bigquery(self, df):
+        """
+        Upload only inserted and updated rows, and optionally delete removed keys.
+        """
+        table_id = f"{self.project_id}.{self.dataset_id}.{self.table_id}"
+        is_table_exists = self.bigquery_service.is_table_exists(table_id=table_id)
+        previous = None
+        if not is_table_exists:
+            previous = pd.DataFrame()
+        if is_table_exists and (
+            self.change_detection == CHANGEDETECTION.TARGET or self.is_sync_deletes
+        ):
+            # keys are matched as STRING in BigQuery, checked before any write
+            self.bigquery_service.check_key_types(table_id, self.unique_keys)
+        if self.change_detection == CHANGEDETECTION.TARGET:
+            df[ROW_HASH_COLUMN] = self.change_detector.compute_row_hashes(df)
+            if is_table_exists and ROW_HASH_COLUMN not in (
+                self.bigquery_service.get_column_names(table_id)
+            ):
+                # rows of older tables have no hash yet, so they are all
+                # rewritten once with their hash by this load
+                self.logger.info(
+                    f"Adding {ROW_HASH_COLUMN} to {table_id}; "
+                    "all rows will be upserted once."
+                )
+                self.bigquery_service.add_column_if_not_exists(
+                    table_id, ROW_HASH_COLUMN, "INTEGER"
+                )
+            if is_table_exists:
+                previous = self.bigquery_service.read_row_hashes(
+                    table_id=table_id,
+                    unique_keys=self.unique_keys,
+                    hash_column=ROW_HASH_COLUMN,
+                )
+        elif self.change_detection != CHANGEDETECTION.LOCAL:
+            raise ValueError(f"Invalid change detection: {self.change_detection}")
+
+        change_set = self.change_detector.detect(df, previous=previous)
+        if change_set.is_empty:
+            self.logger.info("No changes detected. Skipping load.")
+            return
+        if not change_set.upserts.empty:
+            if self.write_mode == WRITEMODE.SCD:
+                self.scd_data_to_bigquery(change_set.upserts)
+            else:
+                self.merge_data_to_bigquery(change_set.upserts)
+        if self.is_sync_deletes and is_table_exists and change_set.deleted > 0:
+            self.bigquery_service.delete_by_keys(
+                destination_dataset=self.dataset_id,
+                destination_table=self.table_id,
+                keys_df=change_set.deleted_keys,
+                unique_keys=self.unique_keys,
+            )
+            self.logger.info(
+                f"Deleted {change_set.deleted} rows from {self.dataset_id}:{self.table_id}."
+            )
+        if self.change_detection == CHANGEDETECTION.LOCAL:
+            self.change_detector.save_snapshot(change_set.snapshot)
+
     def insert_data_to_bigquery(self, df, write_disposition="WRITE_APPEND"):
         table_id = f"{self.project_id}.{self.dataset_id}.{self.table_id}"
         self.bigquery_service.insert(
@@ -156,11 +306,27 @@ class GGSheetToBigQuery(BaseOperator, LoggerMixin):
             time_partitioning=self.time_partitioning,
             clustering_fields=self.clustering_fields,
             schema=self.bigquery_schema,
+            unique_keys=self.unique_keys,
+            is_key_hash=self.is_key_hash,
         )
         self.logger.info(
             f"Inserted {len(df)} rows into {self.dataset_id}:{self.table_id}."
         )
 
+    def stream_data_to_bigquery(self, df):
+        table_id = f"{self.project_id}.{self.dataset_id}.{self.table_id}"
+        self.bigquery_service.append_stream(
+            table_id=table_id,
+            df=df,
+            time_partitioning=self.time_partitioning,
+            clustering_fields=self.clustering_fields,
+            schema=self.bigquery_schema,
+            is_flush=True,
+        )
+        self.logger.info(
+            f"Streamed {len(df)} rows into {self.dataset_id}:{self.table_id}."
+        )
+
     def merge_data_to_bigquery(self, df):
         table_id = f"{self.project_id}.{self.dataset_id}.{self.table_id}"
         if not self.bigquery_service.is_table_exists(table_id=table_id):
@@ -172,6 +338,7 @@ class GGSheetToBigQuery(BaseOperator, LoggerMixin):
             df=df,
             unique_keys=self.unique_keys,
             schema=self.bigquery_schema,
+            is_key_hash=self.is_key_hash,
         )
         self.logger.info(
             f"Merged {len(df)} rows into {self.dataset_id}:{self.table_id}."
@@ -189,6 +356,7 @@ class GGSheetToBigQuery(BaseOperator, LoggerMixin):
             df=df,
             unique_keys=self.unique_keys,
             schema=self.bigquery_schema,
+            is_key_hash=self.is_key_hash,
         )
         self.logger.info("process slowly changing dimension")
 
@@ -214,51 +382,43 @@ class GGSheetToBigQuery(BaseOperator, LoggerMixin):
             self.logger.warning("Schema is not a list. Skipping parsing.")
             return df
 
-        # Create a copy of the DataFrame to avoid modifying the original
-        df_copy = df.copy()
-
-        # Define a mapping of field types to conversion functions
-        type_conversion_map = {
-            "TIMESTAMP": lambda col: pd.to_datetime(
-                col, format="%Y-%m-%d %H:%M:%S", errors="coerce"
-            ),
-            "DATE": lambda col: pd.to_datetime(col, format="%d-%m-%Y", errors="coerce"),
-            "FLOAT": lambda col: pd.to_numeric(col, errors="coerce"),
-            "INTEGER": lambda col: pd.to_numeric(col, errors="coerce"),
-            "STRING": lambda col: col.astype(str),
-            "BOOLEAN": lambda col: col.astype(bool),
-        }
-
-        # Apply schema to DataFrame columns
         for field_schema in self.schema:
             field_name = field_schema["field"]
             field_type = field_schema["type"]
-
-            if field_name not in df_copy.columns:
+            if field_name not in df.columns:
                 self.logger.warning(
                     f"Field '{field_name}' not found in DataFrame. Skipping."
                 )
-                continue
-
-            if field_type in type_conversion_map:
-                df_copy[field_name] = type_conversion_map[field_type](
-                    df_copy[field_name]
-                )
-            else:
+            elif field_type.upper() not in SUPPORTED_SCHEMA_TYPES:
                 self.logger.warning(
                     f"Unsupported field type '{field_type}' for field '{field_name}'. Skipping."
                 )
 
-        return df_copy
+        # all columns are converted in one vectorized pass into a new frame
+        df, failures = coerce_to_schema(df, self.schema)
+        for field_name, count in failures.items():
+            self.logger.warning(
+                f"{count} values of field '{field_name}' could not be converted and were set to null."
+            )
+        return df
+
+    def transform_dataframe(self, df_sheet):
+        """
+        Filter, select and type the rows read from the sheet.
+        """
+        if self.filter_conditions:
+            df_sheet = self.get_dataframe_by_conditions(
+                df_sheet, self.filter_conditions
+            )
+        df_sheet = self.normalize_column_names(df_sheet)
+        self.logger.info(f"columns: {df_sheet.columns}")
+        return self.apply_schema_to_dataframe(df_sheet)
 
     def execute(self):
         # Fetch data from Google Sheets
         self.logger.info(f"Fetching data from Google Sheets: {self.spreadsheet_url}")
         df_sheet = self.fetch_data_from_sheets()
-        df_sheet = self.get_dataframe_by_conditions(df_sheet, self.filter_conditions)
-        df_sheet = self.normalize_column_names(df_sheet)
-        self.logger.info(f"columns: {df_sheet.columns}")
-        df_sheet = self.apply_schema_to_dataframe(df_sheet)
+        df_sheet = self.transform_dataframe(df_sheet)
         self.logger.info(
             f"Fetched {len(df_sheet)} rows from Google Sheets: {self.spreadsheet_url}"
         )
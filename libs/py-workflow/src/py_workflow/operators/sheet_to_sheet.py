@@ -23,6 +23,7 @@ class SheetToSheetOperator(LoggerMixin, BaseOperator):
         filter_conditions: list = None,
         dropdown_headers: any = None,
         is_remove_sync_data: bool = False,
+        is_key_index: bool = False,
         **kwargs,
     ):
         self.src_spreadsheet_url = src_spreadsheet_url
@@ -42,10 +43,11 @@ class SheetToSheetOperator(LoggerMixin, BaseOperator):
         self.logger.info(f"dropdown_headers: {dropdown_headers}")
         self.dropdown_headers = dropdown_headers
         self.is_remove_sync_data = is_remove_sync_data
+        self.is_key_index = is_key_index
 
-    def fetch_data_from_sheets(self, sheet_name=None):
+    def fetch_data_from_sheets(self, sheet_name=None, columns=None):
         # Fetch data from Google Sheets
-        df = self.src_google_sheet_service.read_sheet(sheet_name)
+        df = self.src_google_sheet_service.read_sheet(sheet_name, columns=columns)
         return df
 
     def load_data_to_sheets(self, df):
@@ -121,44 +123,89 @@ class SheetToSheetOperator(LoggerMixin, BaseOperator):
 
         return filtered_df
 
+    def get_source_columns(self):
+        """
+        Return the source columns to fetch: the headers and the filtered fields.
+        """
+        if self.headers is None:
+            return None
+        filter_fields = [
+            condition["field"] for condition in self.filter_conditions or []
+        ]
+        return list(dict.fromkeys(self.headers + filter_fields))
+
+    def write_new_data(self, source_df, key_index=None):
+        """Write the source rows missing from the destination, return them."""
+        if key_index is not None:
+            new_data = key_index.get_new_rows(source_df).reset_index(drop=True)
+        else:
+            dest_df = self.fetch_data_from_sheets(
+                self.dest_sheet_name, columns=self.headers
+            )
+            self.logger.info(f"dest_df: {dest_df}")
+            self.logger.info(f"source_df: {source_df}")
+            if not dest_df.empty:
+                self.logger.info("No data found in destination sheet.")
+                self._validate_headers(source_df, dest_df)
+            new_data = get_diff_rows_left_keep_all(
+                source_df,
+                dest_df,
+                headers=self.headers,
+                on=self.unique_keys,
+            )
+        self.logger.info(f"size data write: {len(new_data)}")
+        if new_data.empty:
+            self.logger.info("No new data to write.")
+            return new_data
+        new_data = remove_xy_suffixes(new_data)
+        self.logger.info(f"new_data: {new_data}")
+        if self.write_mode not in ("w", "a"):
+            return new_data
+
+        def write(df):
+            self.dest_google_sheet_service.export_to_sheets(
+                sheet_idx=self.dest_sheet_name, df=df, mode=self.write_mode
+            )
+
+        if key_index is None:
+            write(new_data)
+            return new_data
+        return self.dest_google_sheet_service.write_with_key_index(
+            key_index, new_data, write, is_replace=self.write_mode == "w"
+        )
+
     def execute(self, **args):
-        source_df = self.fetch_data_from_sheets(self.src_sheet_name)
+        source_df = self.fetch_data_from_sheets(
+            self.src_sheet_name, columns=self.get_source_columns()
+        )
         if self.filter_conditions:
             source_df = self._filter_dataframe(source_df, self.filter_conditions)
         if source_df.empty:
             self.logger.info("No data found.")
             return
         source_df = source_df[self.headers]
-        dest_df = self.fetch_data_from_sheets(self.dest_sheet_name)
-        self.logger.info(f"dest_df: {dest_df}")
-        self.logger.info(f"source_df: {source_df}")
-        if not dest_df.empty:
-            self.logger.info("No data found in destination sheet.")
-            self._validate_headers(source_df, dest_df)
-        new_data = get_diff_rows_left_keep_all(
-            source_df,
-            dest_df,
-            headers=self.headers,
-            on=self.unique_keys,
-        )
-        self.logger.info(f"size data write: {len(new_data)}")
-        if new_data.empty:
-            self.logger.info("No new data to write.")
-            return
-        new_data = remove_xy_suffixes(new_data)
-        self.logger.info(f"new_data: {new_data}")
-        if self.write_mode == "w":
-            self.dest_google_sheet_service.clear_sheet(self.dest_sheet_name)
-            self.dest_google_sheet_service.append_rows(
-                sheet_idx=self.dest_sheet_name,
-                row=new_data.values.tolist(),
-            )
-        elif self.write_mode == "a":
+        if self.write_mode == "sync":
+            # the destination is made equal to the source, writing only the diff
             self.dest_google_sheet_service.export_to_sheets(
                 sheet_idx=self.dest_sheet_name,
-                df=new_data,
-                mode="a",
+                df=source_df,
+                mode="sync",
+                unique_keys=self.unique_keys,
             )
+            return
+        key_index = None
+        if self.is_key_index:
+            # the destination is only read when it changed outside this operator
+            key_index = self.dest_google_sheet_service.get_key_index(
+                self.dest_sheet_name, self.unique_keys or self.headers
+            )
+        try:
+            new_data = self.write_new_data(source_df, key_index)
+        finally:
+            if key_index is not None:
+                key_index.close()
+        if new_data.empty:
+            return
         if self.is_remove_sync_data:
             key_columns = self.unique_keys
             key_values = new_data[key_columns].values.tolist()
@@ -0,0 +1,178 @@
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from py_workflow.operators.base import BaseOperator
+from py_workflow.operators.sheet_to_biquery import GGSheetToBigQuery
+from py_utils.common.logger import LoggerMixin
+
+
+class GGSheetsToBigQuery(BaseOperator, LoggerMixin):
+    """
+    Load many worksheets, across one or more spreadsheets, in one task.
+
+    Every spreadsheet is read with a single `values.batchGet`. Each source
+    keeps its own filters, columns and schema, and is either loaded to its
+    own table, concurrently, or unioned into `table_id` with a column naming
+    the source tab.
+
+    Args:
+        sources (list): One dict per worksheet, with `sheet_name` and
+            optionally `spreadsheet_url`, `tag` and any GGSheetToBigQuery
+            argument (`table_id`, `columns`, `filter_conditions`, `schema`,
+            `unique_keys`, `write_mode`, ...) overriding the defaults below.
+        spreadsheet_url (str): The default spreadsheet of the sources.
+        project_id (str): The project of the tables.
+        dataset_id (str): The default dataset of the tables.
+        table_id (str): The table of the union, or the default table.
+        write_mode (str): The default write mode.
+        is_union (bool): Union all sources into `table_id`.
+        source_column (str): The column tagging union rows with their source.
+        schema (list): The schema of the union, or the default schema.
+        is_unformatted (bool): Read typed values instead of formatted strings.
+        max_workers (int): The number of tables loaded concurrently.
+    """
+
+    def __init__(
+        self,
+        sources: list = None,
+        spreadsheet_url: str = None,
+        project_id: str = None,
+        dataset_id: str = None,
+        table_id: str = None,
+        write_mode: str = "append",
+        is_union: bool = False,
+        source_column: str = "_source_tab",
+        schema: list = None,
+        unique_keys: list = None,
+        clustering_fields: list = None,
+        time_partitioning: str = None,
+        is_timestamp: bool = False,
+        is_unformatted: bool = False,
+        max_workers: int = 4,
+    ):
+        if not sources:
+            raise ValueError("No sources to load.")
+        if is_union and not table_id:
+            raise ValueError("A union of sources needs a table_id.")
+        self.spreadsheet_url = spreadsheet_url
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+        self.write_mode = write_mode
+        self.is_union = is_union
+        self.source_column = source_column
+        self.schema = schema
+        self.is_unformatted = is_unformatted
+        self.max_workers = max_workers
+        defaults = dict(
+            spreadsheet_url=spreadsheet_url,
+            project_id=project_id,
+            dataset_id=dataset_id,
+            table_id=table_id,
+            write_mode=write_mode,
+            schema=schema,
+            unique_keys=unique_keys,
+            clustering_fields=clustering_fields,
+            time_partitioning=time_partitioning,
+            is_timestamp=is_timestamp,
+        )
+        self.tags = []
+        self.tasks = []
+        destinations = {}
+        for index, source in enumerate(sources):
+            if not source.get("sheet_name"):
+                raise ValueError(f"Source {index} has no sheet_name: {source}")
+            params = {**defaults, **source}
+            self.tags.append(params.pop("tag", params["sheet_name"]))
+            if not is_union:
+                destination = (
+                    f"{params['project_id']}.{params['dataset_id']}."
+                    f"{params['table_id']}"
+                )
+                if destination in destinations:
+                    # concurrent loads into one table would overwrite each other
+                    raise ValueError(
+                        f"Sources {destinations[destination]} and {index} both "
+                        f"load {destination}; set is_union to combine them."
+                    )
+                destinations[destination] = index
+            # the batch read decides the render options of every source
+            params["is_unformatted"] = is_unformatted
+            self.tasks.append(GGSheetToBigQuery(**params))
+        self.union_task = None
+        if self.is_union:
+            union_schema = None
+            if schema is not None:
+                union_schema = schema + [{"field": source_column, "type": "STRING"}]
+            # only loads, so it never opens the default spreadsheet, which
+            # is None when every source sets its own
+            self.union_task = GGSheetToBigQuery(
+                **{**defaults, "schema": union_schema},
+                is_unformatted=is_unformatted,
+            )
+
+    def fetch_data_from_sheets(self):
+        """
+        Read the worksheets of every spreadsheet with one request each.
+
+        Returns:
+            list: The DataFrame of every source, in the order of `sources`.
+        """
+        by_spreadsheet = {}
+        for task in self.tasks:
+            by_spreadsheet.setdefault(task.spreadsheet_url, []).append(task)
+        frames = {}
+        for spreadsheet_url, tasks in by_spreadsheet.items():
+            self.logger.info(
+                f"Fetching {len(tasks)} worksheets from Google Sheets: "
+                f"{spreadsheet_url}"
+            )
+            # typed tabs are coerced to their schema before they are cached
+            schemas = {
+                task.sheet_name: task.schema
+                for task in tasks
+                if task.is_unformatted and isinstance(task.schema, list)
+            }
+            frames[spreadsheet_url] = tasks[0].google_sheet_service.read_sheets(
+                [task.sheet_name for task in tasks],
+                schemas=schemas,
+                normalize_header=GGSheetToBigQuery.normalize_column_name,
+                **tasks[0].get_render_options(),
+            )
+        return [
+            frames[task.spreadsheet_url][task.sheet_name] for task in self.tasks
+        ]
+
+    def load_union_to_bigquery(self, frames):
+        df = pd.concat(
+            [
+                df.assign(**{self.source_column: tag})
+                for tag, df in zip(self.tags, frames)
+            ],
+            ignore_index=True,
+        )
+        self.logger.info(f"Union of {len(frames)} worksheets: {df.shape}")
+        self.union_task.load_data_to_bigquery(df)
+
+    def load_tables_to_bigquery(self, frames):
+        # every table has its own load job, so they run concurrently
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(task.load_data_to_bigquery, df)
+                for task, df in zip(self.tasks, frames)
+            ]
+            for future in futures:
+                future.result()
+
+    def execute(self):
+        frames = [
+            task.transform_dataframe(df)
+            for task, df in zip(self.tasks, self.fetch_data_from_sheets())
+        ]
+        self.logger.info(
+            f"Fetched {sum(len(df) for df in frames)} rows "
+            f"from {len(frames)} worksheets"
+        )
+        if self.is_union:
+            self.load_union_to_bigquery(frames)
+        else:
+            self.load_tables_to_bigquery(frames)
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 
 @dataclass
@@ -9,6 +9,8 @@ class Task:
     operator: str
     params: Dict[str, Any]
     dependencies: List[str]
+    max_bytes_billed: Optional[int] = None
+    is_dry_run_first: bool = False
 
     def to_dict(self):
         return self.__dict__
@@ -31,6 +33,8 @@ class TaskFields:
     operator = "operator"
     params = "params"
     dependencies = "dependencies"
+    max_bytes_billed = "max_bytes_billed"
+    is_dry_run_first = "is_dry_run_first"
 
 
 class DagFields:
@@ -4,6 +4,7 @@ from typing import Dict, Any, List
 from abc import ABC, abstractmethod
 
 from py_utils.common.logger import LoggerMixin
+from py_utils.google.console.job_stats import JobPolicy, get_job_stats_collector
 from py_workflow.pipeline.config import Task, TaskFields, DagFields
 from py_workflow.pipeline.alert import SlackFailureAlert
 
@@ -108,6 +109,8 @@ class PipelineV1(AbstractPipeline, LoggerMixin):
             operator=task_dict[TaskFields.operator],
             params=task_dict[TaskFields.params],
             dependencies=task_dict[TaskFields.dependencies],
+            max_bytes_billed=task_dict.get(TaskFields.max_bytes_billed),
+            is_dry_run_first=task_dict.get(TaskFields.is_dry_run_first, False),
         )
 
     def make_tasks(self, configs) -> List[Task]:
@@ -143,6 +146,7 @@ class TaskExecutor(LoggerMixin):
         self.dag_config = dag_config
         self.tasks = tasks
         self.executed_tasks = set()
+        self.job_stats = get_job_stats_collector()
 
     def execute_task(self, task):
         try:
@@ -160,8 +164,18 @@ class TaskExecutor(LoggerMixin):
             operator_class = getattr(module, class_name)
             operator_instance = operator_class(**task.params)
 
-            # Execute the operator
-            operator_instance.execute()
+            # Execute the operator under the task's BigQuery budget
+            self.job_stats.start_task(
+                task.task_id,
+                JobPolicy(
+                    max_bytes_billed=task.max_bytes_billed,
+                    is_dry_run_first=task.is_dry_run_first,
+                ),
+            )
+            try:
+                operator_instance.execute()
+            finally:
+                self.job_stats.end_task()
 
             # Mark the task as executed
             self.executed_tasks.add(task.task_id)
@@ -182,5 +196,8 @@ class TaskExecutor(LoggerMixin):
             raise Exception(f"Error executing task {task.task_id}: {e}")
 
     def run(self):
-        for task in self.tasks:
-            self.execute_task(task)
+        try:
+            for task in self.tasks:
+                self.execute_task(task)
+        finally:
+            self.job_stats.log_summary()